@@ -0,0 +1 @@
+CREATE INDEX IF NOT EXISTS ix_runs_user_id_problem_id_id_source_hash_ej_lang_id ON pynformatics.runs (user_id, problem_id, id, source_hash, ej_lang_id);
@@ -0,0 +1,3 @@
+CREATE INDEX IF NOT EXISTS ix_runs_problem_id_id ON pynformatics.runs (problem_id, id);
+CREATE INDEX IF NOT EXISTS ix_runs_problem_id_statement_id_id ON pynformatics.runs (problem_id, statement_id, id);
+CREATE INDEX IF NOT EXISTS ix_runs_problem_id_ej_status_id ON pynformatics.runs (problem_id, ej_status, id);
@@ -0,0 +1,21 @@
+-- Runs with display fields of their users for monitors, see rmatics/model/monitor_run.py.
+-- Primary key clusters runs of problem together; PRIMARY KEY (id) works too, but then
+-- monitor reads rows of problem scattered over the table.
+CREATE TABLE IF NOT EXISTS pynformatics.monitor_runs (
+    id INT NOT NULL,
+    problem_id INT NOT NULL,
+    user_id INT,
+    create_time DATETIME,
+    ej_score INT,
+    ej_status INT,
+    ej_test_num INT,
+    statement_id INT,
+    context_source INT,
+    is_visible BOOL,
+    firstname VARCHAR(100),
+    lastname VARCHAR(100),
+    username VARCHAR(100),
+    email VARCHAR(100),
+    PRIMARY KEY (problem_id, id),
+    UNIQUE KEY ix_monitor_runs_id (id)
+);
@@ -8,7 +8,10 @@ from rmatics.ejudge.judges_config import init_app as init_judges
 from rmatics.model.base import db, celery
 from rmatics.model.base import mongo
 from rmatics.model.base import redis
-from rmatics.plugins import monitor_cacher, invalidator
+from rmatics.plugins import monitor_cacher, invalidator, redis_invalidator, standings_aggregator, \
+    duplicate_detector, judge_limiter, replica_router
+from rmatics.utils.cacher.codecs import CacheCodec
+from rmatics.utils.cacher.local_cache import LocalCache
 from rmatics.utils.centrifugo import centrifugo_client
 from rmatics.view import handle_api_exception
 from rmatics.view.monitors.route import monitor_blueprint
@@ -26,6 +29,8 @@ def create_app(config=None, config_logger=True):
     app.url_map.strict_slashes = False
     app.logger.info(f'Running with {config} module')
 
+    replica_router.init_app(app, uris=app.config.get('SQLALCHEMY_REPLICA_URIS'),
+                            pin_period=app.config.get('DB_PRIMARY_PIN_PERIOD', 10))
     db.init_app(app)
     mongo.init_app(app)
     configure_celery_app(app, celery)
@@ -33,9 +38,31 @@ def create_app(config=None, config_logger=True):
     init_judges(app)
 
     monitor_caching_time = app.config.get('MONITOR_CACHING_TIME_HOURS', 1) * 60 * 60
-    monitor_cacher.init_app(app, redis, period=monitor_caching_time, autocommit=False)
-
-    invalidator.init_app(remove_cache_func=redis.delete)
+    monitor_cache_codec = CacheCodec(app.config.get('MONITOR_CACHE_CODEC', 'json'),
+                                     compress_threshold=app.config.get('MONITOR_CACHE_COMPRESS_THRESHOLD', 0))
+    monitor_cache_kwargs = {
+        'period': monitor_caching_time,
+        'autocommit': False,
+        'codec': monitor_cache_codec,
+        'stale_period': app.config.get('MONITOR_CACHE_STALE_PERIOD', 0),
+        'fill_wait': app.config.get('MONITOR_CACHE_FILL_WAIT_MS', 500) / 1000,
+    }
+    if app.config.get('MONITOR_LOCAL_CACHE_TTL'):
+        monitor_local_cache = LocalCache(max_bytes=app.config.get('MONITOR_LOCAL_CACHE_MAX_BYTES'),
+                                         ttl=app.config.get('MONITOR_LOCAL_CACHE_TTL'))
+        monitor_local_cache.init_app(redis, channel='monitor/invalidated')
+        monitor_cache_kwargs['local_cache'] = monitor_local_cache
+    if app.config.get('MONITOR_CACHE_INVALIDATOR') == 'redis':
+        redis_invalidator.init_app(remove_cache_func=monitor_cacher.remove, store=redis)
+        monitor_cacher.init_app(app, redis, cache_invalidator=redis_invalidator, **monitor_cache_kwargs)
+    else:
+        invalidator.init_app(remove_cache_func=monitor_cacher.remove)
+        monitor_cacher.init_app(app, redis, cache_invalidator=invalidator, **monitor_cache_kwargs)
+
+    standings_aggregator.init_app(redis, period=monitor_caching_time)
+    duplicate_detector.init_app(redis, use_cache=app.config.get('SUBMIT_DUPLICATE_CACHE', False))
+    if app.config.get('SUBMIT_JUDGE_LIMITER'):
+        judge_limiter.init_app(redis, lease=app.config.get('SUBMIT_JUDGE_SLOT_LEASE', 60))
 
     # Centrifugo
     cent_url = app.config.get('CENTRIFUGO_URL')
@@ -48,6 +75,8 @@ def create_app(config=None, config_logger=True):
     app.register_blueprint(monitor_blueprint)
 
     app.cli.add_command(cli.test)
+    app.cli.add_command(cli.backfill_monitor_runs_command)
+    app.cli.add_command(cli.create_protocol_indexes_command)
 
     return app
 
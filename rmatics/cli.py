@@ -6,9 +6,16 @@ import click
 from flask.cli import with_appcontext
 from teamcity.unittestpy import TeamcityTestRunner
 
+from rmatics.model.base import redis
+from rmatics.model.monitor_run import backfill_monitor_runs
+from rmatics.model.run import create_protocol_test_indexes
+
 THIS_FILE = os.path.abspath(os.path.dirname(__file__))
 TESTS_DIR = os.path.join(THIS_FILE, 'tests/')
 
+# Hash with id of the last run copied by backfill-monitor-runs
+MONITOR_RUNS_BACKFILL_KEY = 'monitor_runs/backfill'
+
 
 @click.command('test')
 @click.option('--teamcity', is_flag=True, default=False)
@@ -32,6 +39,34 @@ def test(teamcity, verbosity):
     sys.exit(exit_code)
 
 
+@click.command('backfill-monitor-runs')
+@click.option('--batch-size', default=1000)
+@click.option('--restart', is_flag=True, default=False,
+              help='Copy runs from the first one instead of the last copied one')
+@with_appcontext
+def backfill_monitor_runs_command(batch_size, restart):
+    """ Copies all runs to monitor_runs, interrupted command continues from the last copied batch
+
+        Turn MONITOR_RUNS_PROJECTION on before it, so runs changed meanwhile are written too
+    """
+    if restart:
+        redis.delete(MONITOR_RUNS_BACKFILL_KEY)
+    after_id = int(redis.hget(MONITOR_RUNS_BACKFILL_KEY, 'last_id') or 0)
+
+    for last_id in backfill_monitor_runs(after_id, batch_size):
+        redis.hset(MONITOR_RUNS_BACKFILL_KEY, 'last_id', last_id)
+        click.echo(f'Runs up to #{last_id} are copied')
+    click.echo('Done')
+
+
+@click.command('create-protocol-indexes')
+@with_appcontext
+def create_protocol_indexes_command():
+    """ Creates indexes of tests stored out of protocols, run it before turning PROTOCOL_SPLIT_TESTS on """
+    create_protocol_test_indexes()
+    click.echo('Done')
+
+
 if __name__ == '__main__':
     test()
 
@@ -59,15 +59,77 @@ class BaseConfig:
     SQLALCHEMY_POOL_SIZE = 10
     SQLALCHEMY_POOL_RECYCLE = 90
 
+    # Comma separated read replicas for read only views, see ReplicaRouter
+    SQLALCHEMY_REPLICA_URIS = [uri for uri in os.getenv('SQLALCHEMY_REPLICA_URIS', '').split(',') if uri]
+    # Client which wrote reads from primary for this many seconds
+    DB_PRIMARY_PIN_PERIOD = int(os.getenv('DB_PRIMARY_PIN_PERIOD', 10))
+
     REDIS_URL = os.getenv('REDIS_URL', 'redis://@localhost:6379/0')
 
     # services
     JUDGES_CONFIG_PATH = os.getenv('JUDGES_CONFIG_PATH', None)
     DEFAULT_JUDGE_ID = os.getenv('DEFAULT_JUDGE_ID', None)
 
+    # monitors
+    # Fetch runs for all monitor problems with one query instead of one per problem
+    MONITOR_BATCH_FETCH = bool_(os.getenv('MONITOR_BATCH_FETCH', False))
+    MONITOR_BATCH_CHUNK_SIZE = int(os.getenv('MONITOR_BATCH_CHUNK_SIZE', 50))
+    # 'db' keeps invalidation index in MonitorCacheMeta, 'redis' keeps it in Redis sets
+    MONITOR_CACHE_INVALIDATOR = os.getenv('MONITOR_CACHE_INVALIDATOR', 'db')
+    # Patch cached runs on run update instead of invalidating them, needs 'redis' invalidator
+    MONITOR_CACHE_UPDATE_IN_PLACE = bool_(os.getenv('MONITOR_CACHE_UPDATE_IN_PLACE', False))
+    # Maintain per-problem per-user summaries of runs for /monitor/problem_standings
+    MONITOR_STANDINGS = bool_(os.getenv('MONITOR_STANDINGS', False))
+    # Allow format=columnar for monitors, its cache entries are invalidated along with get_runs ones
+    MONITOR_COLUMNAR_FORMAT = bool_(os.getenv('MONITOR_COLUMNAR_FORMAT', False))
+    # 'json' or 'msgpack'; cache entries longer than threshold bytes are compressed, 0 disables it
+    MONITOR_CACHE_CODEC = os.getenv('MONITOR_CACHE_CODEC', 'json')
+    MONITOR_CACHE_COMPRESS_THRESHOLD = int(os.getenv('MONITOR_CACHE_COMPRESS_THRESHOLD', 0))
+    # Serve expired monitor cache for this many seconds while one worker recomputes it, 0 disables it
+    MONITOR_CACHE_STALE_PERIOD = int(os.getenv('MONITOR_CACHE_STALE_PERIOD', 0))
+    # How long workers wait for the one computing missed monitor cache
+    MONITOR_CACHE_FILL_WAIT_MS = int(os.getenv('MONITOR_CACHE_FILL_WAIT_MS', 500))
+    # Keep monitor cache in process memory for this many seconds, 0 disables it
+    MONITOR_LOCAL_CACHE_TTL = float(os.getenv('MONITOR_LOCAL_CACHE_TTL', 0))
+    MONITOR_LOCAL_CACHE_MAX_BYTES = int(os.getenv('MONITOR_LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Write runs with display fields of users to monitor_runs, old runs are copied by `flask backfill-monitor-runs`
+    MONITOR_RUNS_PROJECTION = bool_(os.getenv('MONITOR_RUNS_PROJECTION', False))
+    # Read monitors from monitor_runs without join with users, needs MONITOR_RUNS_PROJECTION and backfill
+    MONITOR_RUNS_FROM_PROJECTION = bool_(os.getenv('MONITOR_RUNS_FROM_PROJECTION', False))
+
+    # submits
+    # Keep source of the last run of user for problem in redis for duplicate check
+    SUBMIT_DUPLICATE_CACHE = bool_(os.getenv('SUBMIT_DUPLICATE_CACHE', False))
+    # Limit concurrent submits by max_concurrency of judges and back off while judge is unhealthy
+    SUBMIT_JUDGE_LIMITER = bool_(os.getenv('SUBMIT_JUDGE_LIMITER', False))
+    # Slot of worker which died while submitting is freed after this many seconds
+    SUBMIT_JUDGE_SLOT_LEASE = int(os.getenv('SUBMIT_JUDGE_SLOT_LEASE', 60))
+
+    # Get submissions list by one query of needed columns instead of loading Run objects
+    SUBMISSIONS_CORE_QUERY = bool_(os.getenv('SUBMISSIONS_CORE_QUERY', False))
+    # Count of runs in submissions list with total=cached is cached for this many seconds
+    SUBMISSIONS_COUNT_CACHE_TTL = int(os.getenv('SUBMISSIONS_COUNT_CACHE_TTL', 60))
 
     # notification
     EJUDGE_NOTIFY_GROUP = os.getenv('EJUDGE_NOTIFY_GROUP', 'rmatics')
+    # Cut input, output and checker output of every test in XML protocols to this many characters, 0 disables it
+    PROTOCOL_FIELD_LIMIT = int(os.getenv('PROTOCOL_FIELD_LIMIT', 0))
+    # Store protocols in compact form with short keys, it is read by all versions since this one
+    PROTOCOL_COMPACT_FORMAT = bool_(os.getenv('PROTOCOL_COMPACT_FORMAT', False))
+    # Compress text fields of compact protocols longer than this many characters, 0 disables it
+    PROTOCOL_COMPRESS_THRESHOLD = int(os.getenv('PROTOCOL_COMPRESS_THRESHOLD', 1024))
+    # Store input, output and other big fields of tests out of protocol, in protocol_test collection,
+    # its indexes are created by `flask create-protocol-indexes`
+    PROTOCOL_SPLIT_TESTS = bool_(os.getenv('PROTOCOL_SPLIT_TESTS', False))
+    # Process notification by one process_notification task instead of chain of tasks
+    NOTIFY_SINGLE_TASK = bool_(os.getenv('NOTIFY_SINGLE_TASK', False))
+    # Duplicates of processed terminal notification are skipped for this many seconds
+    NOTIFY_PROCESSED_PERIOD = int(os.getenv('NOTIFY_PROCESSED_PERIOD', 60 * 60))
+    # Collect terminal notifications for this many ms and process them in batches, 0 disables it
+    NOTIFY_BATCH_WINDOW_MS = int(os.getenv('NOTIFY_BATCH_WINDOW_MS', 0))
+    NOTIFY_BATCH_SIZE = int(os.getenv('NOTIFY_BATCH_SIZE', 200))
+    # Threads fetching protocols of batch from judges
+    NOTIFY_BATCH_FETCH_WORKERS = int(os.getenv('NOTIFY_BATCH_FETCH_WORKERS', 8))
 
     CENTRIFUGO_URL = os.getenv('CENTRIFUGO_URL', 'http://localhost:1377')
     CENTRIFUGO_API_KEY = os.getenv('CENTRIFUGO_API_KEY', 'foo')
@@ -79,7 +141,9 @@ class BaseConfig:
         "task_ignore_result": bool_(os.getenv('CELERY_TASK_IGNORE_RESULT', False)),
         "imports": (
             'rmatics.ejudge.submit_queue.task',
-            'rmatics.tasks.notify'
+            'rmatics.tasks.notify',
+            'rmatics.tasks.notify_batch',
+            'rmatics.utils.cacher.helpers',
         ),
         "worker_max_memory_per_child": 250_000,  # 250MB
         "broker_transport_options": {
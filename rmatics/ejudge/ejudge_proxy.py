@@ -28,7 +28,7 @@ def report_error(code, login_data, submit_data, file, filename, user_id, addon =
 
 
 def submit(run_file, contest_id, prob_id, lang_id, filename, url,
-           sender_user_id=5, token=None, ext_user_id=None):
+           sender_user_id=5, token=None, ext_user_id=None, session=None, timeout=None):
     if token is None:
         current_app.logger.error('token is None')
         return
@@ -54,7 +54,8 @@ def submit(run_file, contest_id, prob_id, lang_id, filename, url,
 
     current_app.logger.info('Request {}'.format(submit_data))
 
-    c = requests.put(url, data=submit_data, headers=headers, files=files, stream=False)
+    http = session if session is not None else requests
+    c = http.put(url, data=submit_data, headers=headers, files=files, stream=False, timeout=timeout)
 
     text_response = str(c.text)
 
@@ -1,8 +1,16 @@
 import json
+import os
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
+import requests
 from flask import Flask, current_app
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Statuses of ejudge which are worth retrying with the same request
+RETRY_STATUSES = (502, 503, 504)
+
 
 @dataclass
 class JudgeConfig:
@@ -12,9 +20,42 @@ class JudgeConfig:
     sender_user_id: int = field(default=5)
     lang_map: Dict[int, int] = field(default_factory=dict)
 
+    # HTTP client settings
+    pool_size: int = field(default=10)
+    keep_alive: bool = field(default=True)
+    connect_timeout: float = field(default=5)
+    read_timeout: float = field(default=30)
+    retries: int = field(default=2)
+
+    # Submit settings, 0 means no limit of concurrent submits
+    max_concurrency: int = field(default=0)
+    # Celery queue of submits to the judge, so its workers don't wait for other judges
+    queue: Optional[str] = field(default=None)
+    # Retries are delayed longer while mean latency is above it
+    latency_target: float = field(default=5)
+
+    _session: Optional[requests.Session] = field(default=None, init=False, repr=False, compare=False)
+    _session_pid: Optional[int] = field(default=None, init=False, repr=False, compare=False)
+
     def get_token(self) -> Optional[str]:
         return self.token
 
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return self.connect_timeout, self.read_timeout
+
+    def get_session(self) -> requests.Session:
+        """ Pooled session to the judge, shared by all tasks of the process
+
+        Session is created lazily, so every forked worker gets its own
+        connections instead of sockets inherited from parent
+        """
+        pid = os.getpid()
+        if self._session is None or self._session_pid != pid:
+            self._session = _build_session(self)
+            self._session_pid = pid
+        return self._session
+
     def map_lang_id(self, lang_id: int) -> int:
         return self.lang_map.get(lang_id, lang_id)
 
@@ -28,11 +69,43 @@ def _load(path: str) -> Dict[int, JudgeConfig]:
             name=cfg.get('name', ''),
             token=cfg.get('token'),
             sender_user_id=cfg.get('sender_user_id', 5),
-            lang_map={int(k): v for k, v in cfg.get('lang_map', {}).items()}
+            lang_map={int(k): v for k, v in cfg.get('lang_map', {}).items()},
+            pool_size=cfg.get('pool_size', 10),
+            keep_alive=cfg.get('keep_alive', True),
+            connect_timeout=cfg.get('connect_timeout', 5),
+            read_timeout=cfg.get('read_timeout', 30),
+            retries=cfg.get('retries', 2),
+            max_concurrency=cfg.get('max_concurrency', 0),
+            queue=cfg.get('queue'),
+            latency_target=cfg.get('latency_target', 5),
         )
         for jid, cfg in data.items()
     }
 
+
+def _build_session(judge: JudgeConfig) -> requests.Session:
+    # Failed connects are retried for any method as request was not sent.
+    # Read errors and bad statuses are retried only for GET:
+    # repeated submit-run PUT would create duplicate run in ejudge
+    retry = Retry(
+        total=judge.retries,
+        connect=judge.retries,
+        read=judge.retries,
+        status=judge.retries,
+        method_whitelist=frozenset(['GET']),
+        status_forcelist=RETRY_STATUSES,
+        backoff_factor=0.3,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=judge.pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not judge.keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
 def _validate(app: Flask, judges: Dict[int, JudgeConfig]) -> bool:
     for jid in judges:
         judge = judges[jid]
@@ -1,17 +1,22 @@
 import requests
+from contextlib import closing
 from typing import Optional
 
 from flask import current_app
 
-from .xml import parse_xml_testing_report
+from .xml import parse_xml_testing_report_stream
 from .bson import parse_bson_testing_report
 
+STREAM_CHUNK_SIZE = 64 * 1024
+
 def fetch_protocol(
     url,
     token,
     ej_contest_id,
     ej_run_id,
     run_id,
+    session: Optional[requests.Session] = None,
+    timeout=10,
 ) -> Optional[dict]:
     """Запросить у ejudge потестовый отчёт по API и распарсить его."""
     headers = (
@@ -27,18 +32,30 @@ def fetch_protocol(
         'format': 'xml',
     }
 
-    resp = requests.get(
+    http = session if session is not None else requests
+    resp = http.get(
         url,
         params=params,
         headers=headers,
-        timeout=10,
+        timeout=timeout,
+        stream=True,
     )
+    with closing(resp):
+        return _parse_protocol(resp, run_id)
+
+
+def _parse_protocol(resp: requests.Response, run_id) -> Optional[dict]:
     resp.raise_for_status()
 
     content_type = resp.headers.get('Content-Type', '')
 
     if 'xml' in content_type:
-        return parse_xml_testing_report(resp.text, run_id)
+        # Report is parsed while it is read, big test fields are cut
+        return parse_xml_testing_report_stream(
+            resp.iter_content(STREAM_CHUNK_SIZE),
+            run_id,
+            field_limit=current_app.config.get('PROTOCOL_FIELD_LIMIT', 0),
+        )
     elif 'bson' in content_type:
         return parse_bson_testing_report(resp.content, run_id)
     else:
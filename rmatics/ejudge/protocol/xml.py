@@ -1,7 +1,11 @@
 import xml.etree.ElementTree as ET
+from typing import Iterable
 
 from rmatics.utils.run import get_string_status
 
+TEST_FIELDS = ('input', 'output', 'correct', 'checker', 'stderr')
+TOO_BIG_VALUES = ('1', 'yes', 'true')
+
 def _to_int(value, default=None):
     try:
         return int(value)
@@ -13,7 +17,43 @@ def _text(elem) -> str:
 
 
 def _too_big(elem) -> bool:
-    return elem is not None and elem.get('too-big') in ('1', 'yes', 'true')
+    return elem is not None and elem.get('too-big') in TOO_BIG_VALUES
+
+
+def _build_test(attrib: dict, fields: dict) -> dict:
+    """ fields: {tag: (text, too_big)} of found children of test """
+    def text(tag):
+        return fields.get(tag, ('', False))[0]
+
+    def too_big(tag):
+        return fields.get(tag, ('', False))[1]
+
+    status_code = attrib.get('status', 'UNKOWN')
+
+    try:
+        string_status = get_string_status(status_code)
+    except KeyError:
+        string_status = status_code
+
+    return {
+        'input': text('input'),
+        'big_input': too_big('input'),
+        'corr': text('correct'),
+        'big_corr': too_big('correct'),
+        'output': text('output'),
+        'big_output': too_big('output'),
+        'checker_output': text('checker'),
+        'error_output': text('stderr'),
+        'extra': '',
+        'status': status_code,
+        'string_status': string_status,
+        'time': _to_int(attrib.get('time'), 0),
+        'real_time': _to_int(attrib.get('real-time'), 0),
+        'max_memory_used': _to_int(
+            attrib.get('max-memory-used'),
+            0,
+        ),
+    }
 
 def parse_xml_testing_report(xml_text: str, run_id: int) -> dict:
     root = ET.fromstring(xml_text)
@@ -27,41 +67,113 @@ def parse_xml_testing_report(xml_text: str, run_id: int) -> dict:
             if num is None:
                 continue
 
-            inp = test.find('input')
-            out = test.find('output')
-            corr = test.find('correct')
-            checker = test.find('checker')
-            err = test.find('stderr')
-
-            status_code = test.get('status', 'UNKOWN')
-
-            try:
-                string_status = get_string_status(status_code)
-            except KeyError:
-                string_status = status_code
-
-            tests[num] = {
-                'input': _text(inp),
-                'big_input': _too_big(inp),
-                'corr': _text(corr),
-                'big_corr': _too_big(corr),
-                'output': _text(out),
-                'big_output': _too_big(out),
-                'checker_output': _text(checker),
-                'error_output': _text(err),
-                'extra': '',
-                'status': status_code,
-                'string_status': string_status,
-                'time': _to_int(test.get('time'), 0),
-                'real_time': _to_int(test.get('real-time'), 0),
-                'max_memory_used': _to_int(
-                    test.get('max-memory-used'),
-                    0,
-                ),
-            }
+            fields = {}
+            for tag in TEST_FIELDS:
+                elem = test.find(tag)
+                if elem is not None:
+                    fields[tag] = (_text(elem), _too_big(elem))
+
+            tests[num] = _build_test(test.attrib, fields)
 
     return {
         'run_id': run_id,
         'compiler_output': _text(root.find('compiler_output')),
         'tests': tests,
-    }
\ No newline at end of file
+    }
+
+
+class _Field:
+    """ Text of element being parsed, cut to limit characters if limit is set """
+    def __init__(self, depth: int, too_big: bool = False, limit: int = 0):
+        self.depth = depth
+        self.too_big = too_big
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        # Only text before the first child is taken, as elem.text
+        self.closed = False
+
+    def add(self, data: str):
+        if self.closed:
+            return
+        if self.limit:
+            data = data[:self.limit - self.size]
+        self.chunks.append(data)
+        self.size += len(data)
+
+    @property
+    def text(self) -> str:
+        return ''.join(self.chunks)
+
+
+class _TestingReportTarget:
+    """ XMLParser target collecting testing report without building tree """
+    def __init__(self, field_limit: int = 0):
+        self.field_limit = field_limit
+        self.compiler_output = None
+        self.tests = {}
+
+        self._path = []
+        self._test_attrib = None
+        self._test_fields = None
+        self._field = None
+
+    def start(self, tag, attrib):
+        if self._field is not None:
+            self._field.closed = True
+
+        self._path.append(tag)
+        path = self._path[1:]
+        depth = len(self._path)
+
+        if path == ['tests', 'test']:
+            self._test_attrib = dict(attrib)
+            self._test_fields = {}
+        elif len(path) == 3 and path[:2] == ['tests', 'test'] \
+                and tag in TEST_FIELDS and tag not in self._test_fields:
+            self._field = _Field(depth, attrib.get('too-big') in TOO_BIG_VALUES, self.field_limit)
+        elif path == ['compiler_output'] and self.compiler_output is None:
+            self._field = _Field(depth)
+
+    def data(self, data):
+        if self._field is not None:
+            self._field.add(data)
+
+    def end(self, tag):
+        path = self._path[1:]
+        field = self._field
+
+        if field is not None and field.depth == len(self._path):
+            if path == ['compiler_output']:
+                self.compiler_output = field.text
+            else:
+                self._test_fields[tag] = (field.text, field.too_big)
+            self._field = None
+        elif path == ['tests', 'test']:
+            num = self._test_attrib.get('num')
+            if num is not None:
+                self.tests[num] = _build_test(self._test_attrib, self._test_fields)
+            self._test_attrib = None
+            self._test_fields = None
+
+        self._path.pop()
+
+    def close(self):
+        return self.compiler_output or '', self.tests
+
+
+def parse_xml_testing_report_stream(chunks: Iterable[bytes], run_id: int, field_limit: int = 0) -> dict:
+    """ The same as parse_xml_testing_report, but parses report by chunks,
+        e.g. from resp.iter_content(), without building tree.
+        Test fields are cut to field_limit characters while parsed, 0 means no limit
+    """
+    parser = ET.XMLParser(target=_TestingReportTarget(field_limit))
+    for chunk in chunks:
+        parser.feed(chunk)
+    compiler_output, tests = parser.close()
+
+    return {
+        'run_id': run_id,
+        'compiler_output': compiler_output,
+        'tests': tests,
+    }
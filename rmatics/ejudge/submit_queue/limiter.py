@@ -0,0 +1,137 @@
+import logging
+import time
+import uuid
+from typing import Optional, Tuple
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# Health of judge is measured in windows of this many seconds, current and previous ones are used
+HEALTH_WINDOW = 60
+# Judge with fewer requests in the windows is considered healthy
+HEALTH_MIN_REQUESTS = 10
+ERROR_RATE_TARGET = 0.1
+MAX_BACKOFF_EXPONENT = 6
+
+
+class JudgeLimiter:
+    """ Limits concurrent submits to judge and measures its health
+
+    Usage:
+    ------
+        judge_limiter = JudgeLimiter(prefix='judge')
+        judge_limiter.init_app(redis, lease=60)
+
+        token = judge_limiter.acquire(judge_id, limit=judge.max_concurrency)
+        if token is None:
+            ...  # Judge is busy, try again in judge_limiter.get_delay(judge_id, 1)
+        try:
+            ...  # Submit
+            judge_limiter.record(judge_id, latency, ok=True)
+        finally:
+            judge_limiter.release(judge_id, token)
+
+    Also:
+    ------
+        Slots are members of redis sorted set {prefix}/{judge_id}/slots scored
+        by acquire time, slots older than lease are left by dead workers and are dropped.
+        Health is kept as counters of requests, errors and latency
+        in hashes {prefix}/{judge_id}/health/{window}. get_delay grows
+        exponentially while error rate or latency is above target.
+        Until init_app is called there are no limits and health is not measured
+    """
+    def __init__(self, prefix='judge'):
+        self.prefix = prefix
+        self.store = None
+        self.lease = None
+
+    def init_app(self, store, lease=60):
+        self.store = store
+        self.lease = lease
+
+    def acquire(self, judge_id: int, limit: int) -> Optional[str]:
+        """ Returns token of acquired slot or None if all limit slots are busy """
+        token = uuid.uuid4().hex
+        if self.store is None or not limit:
+            return token
+
+        key = self._get_key(judge_id, 'slots')
+        now = time.time()
+        pipeline = self.store.pipeline()
+        pipeline.zremrangebyscore(key, '-inf', now - self.lease)
+        pipeline.zadd(key, {token: now})
+        pipeline.zrank(key, token)
+        pipeline.expire(key, self.lease)
+        try:
+            _, _, rank, _ = pipeline.execute()
+            if rank < limit:
+                return token
+            self.store.zrem(key, token)
+        except redis.exceptions.ConnectionError:
+            logger.warning('Can\'t acquire slot of judge %s, submitting without limit', judge_id)
+            return token
+        return None
+
+    def release(self, judge_id: int, token: str):
+        if self.store is None:
+            return
+        try:
+            self.store.zrem(self._get_key(judge_id, 'slots'), token)
+        except redis.exceptions.ConnectionError:
+            logger.warning('Can\'t release slot of judge %s', judge_id)
+
+    def record(self, judge_id: int, latency: float, ok: bool):
+        if self.store is None:
+            return
+
+        key = self._get_key(judge_id, 'health', self._get_window())
+        pipeline = self.store.pipeline(transaction=False)
+        pipeline.hincrby(key, 'requests', 1)
+        pipeline.hincrby(key, 'errors', 0 if ok else 1)
+        pipeline.hincrbyfloat(key, 'latency', latency)
+        pipeline.expire(key, 2 * HEALTH_WINDOW)
+        try:
+            pipeline.execute()
+        except redis.exceptions.ConnectionError:
+            logger.warning('Can\'t record health of judge %s', judge_id)
+
+    def get_health(self, judge_id: int) -> Tuple[int, float, float]:
+        """ Returns number of requests, error rate and mean latency for the last windows """
+        if self.store is None:
+            return 0, 0., 0.
+
+        window = self._get_window()
+        pipeline = self.store.pipeline(transaction=False)
+        for key_window in (window - 1, window):
+            pipeline.hgetall(self._get_key(judge_id, 'health', key_window))
+        try:
+            stats = pipeline.execute()
+        except redis.exceptions.ConnectionError:
+            logger.warning('Can\'t read health of judge %s', judge_id)
+            return 0, 0., 0.
+
+        requests = sum(int(stat.get(b'requests', 0)) for stat in stats)
+        if not requests:
+            return 0, 0., 0.
+        errors = sum(int(stat.get(b'errors', 0)) for stat in stats)
+        latency = sum(float(stat.get(b'latency', 0)) for stat in stats)
+        return requests, errors / requests, latency / requests
+
+    def get_delay(self, judge_id: int, base_delay: float, latency_target: float = 5) -> float:
+        """ base_delay, doubled for every extra target reached by error rate or latency of judge """
+        requests, error_rate, latency = self.get_health(judge_id)
+        if requests < HEALTH_MIN_REQUESTS:
+            return base_delay
+
+        pressure = max(error_rate / ERROR_RATE_TARGET, latency / latency_target)
+        if pressure <= 1:
+            return base_delay
+        return base_delay * 2 ** min(pressure - 1, MAX_BACKOFF_EXPONENT)
+
+    @staticmethod
+    def _get_window() -> int:
+        return int(time.time() // HEALTH_WINDOW)
+
+    def _get_key(self, judge_id: int, *parts) -> str:
+        return '/'.join(map(str, (self.prefix, judge_id, *parts)))
@@ -1,9 +1,13 @@
+import time
+
+import requests
 from celery import shared_task
 from celery.utils.log import get_task_logger
 
 from typing import Optional
 from rmatics.model import Run
 from rmatics.model.base import db
+from rmatics.model.monitor_run import sync_monitor_runs
 from sqlalchemy.orm import joinedload
 from rmatics.utils.run import EjudgeStatuses
 
@@ -11,9 +15,13 @@ from rmatics.ejudge.judges_config import get_judge, get_default_judge_id
 from rmatics.ejudge.ejudge_proxy import submit
 
 from rmatics import centrifugo_client
+from rmatics.plugins import judge_limiter
 
 logger = get_task_logger(__name__)
 
+# Seconds to wait for free slot of busy judge, grows while judge is unhealthy
+THROTTLE_DELAY = 1
+
 _REQUIRED_ENTRY_KEYS = ('contest_id', 'problem_id')
 
 
@@ -91,6 +99,8 @@ def _add_info_from_ejudge(run, ejudge_run_id, ejudge_run_uuid, status, judge_id)
     run.judge_id = judge_id
 
     db.session.add(run)
+    db.session.flush()
+    sync_monitor_runs(Run.id == run.id)
     db.session.commit()
 
 def _build_submit_error_protocol(run_id, ejudge_respone: str) -> dict:
@@ -102,8 +112,16 @@ def _build_submit_error_protocol(run_id, ejudge_respone: str) -> dict:
         r["ejResp"] = ejudge_respone
     return r
 
+
+def _requeue(task, run_id, queue: Optional[str], countdown: Optional[float] = None):
+    # Not a retry: run is not failed, but keeps its retries count
+    task.apply_async((run_id,), {'requeued': True}, queue=queue,
+                     countdown=countdown, retries=task.request.retries)
+
+
 @shared_task(name='rmatics.ejudge.submit_queue.task.submit_task', ignore_result=True, bind=True, default_retry_delay=5, max_retries=5)
-def submit_task(self, run_id):
+def submit_task(self, run_id, requeued=False):
+    """ requeued task is on queue of its judge and run updates are already sent """
     logger.info(f'Trying to send run #{run_id} to ejudge')
 
     run = _get_run(run_id)
@@ -117,7 +135,8 @@ def submit_task(self, run_id):
         return
     db.session.expunge(problem)
 
-    centrifugo_client.send_problem_run_updates(run.problem_id, run)
+    if not requeued:
+        centrifugo_client.send_problem_run_updates(run.problem_id, run)
 
     entry = _get_judge_entry(problem, run.lang_id, run.user_id)
 
@@ -146,38 +165,63 @@ def submit_task(self, run_id):
         )
         return
 
-    entry_url = judge.url
-    entry_token = judge.get_token()
-    sender_user_id = judge.sender_user_id
-    lang_id = judge.map_lang_id(run.lang_id)
-
-    file = run.source
-
-    try:
-        ejudge_response = submit(
-            run_file=file,
-            contest_id=contest_id,
-            prob_id=prob_id,
-            lang_id=lang_id,
-            filename='common_filename',
-            url=entry_url,
-            sender_user_id=sender_user_id,
-            token=entry_token,
-            ext_user_id=run_id
-        )
-    except Exception as e:
-        logger.error(
-            f'Run #{run_id}: submit to judge {judge_id!r} raised exception'
-        )
-        if self.request.retries < submit_task.max_retries:
-            logger.info('retry submit')
-            self.retry(exc=e)
+    if judge.queue and not requeued:
+        _requeue(self, run_id, judge.queue)
+        return
 
-        _add_info_from_ejudge(run, None, None, EjudgeStatuses.RMATICS_SUBMIT_ERROR, judge_id)
-        run.protocol = _build_submit_error_protocol(run_id, 'Ошибка отправки посылки')
-        logger.error('submit failed after 3 retries')
+    token = judge_limiter.acquire(judge_id, judge.max_concurrency)
+    if token is None:
+        countdown = judge_limiter.get_delay(judge_id, THROTTLE_DELAY, judge.latency_target)
+        logger.info(f'Run #{run_id}: judge {judge_id!r} is busy, waiting {countdown:.1f}s')
+        _requeue(self, run_id, judge.queue, countdown)
         return
 
+    # Slot is released whatever fails below, otherwise it is held until lease expires
+    try:
+        entry_url = judge.url
+        entry_token = judge.get_token()
+        sender_user_id = judge.sender_user_id
+        lang_id = judge.map_lang_id(run.lang_id)
+
+        file = run.source
+
+        started = time.monotonic()
+        try:
+            ejudge_response = submit(
+                run_file=file,
+                contest_id=contest_id,
+                prob_id=prob_id,
+                lang_id=lang_id,
+                filename='common_filename',
+                url=entry_url,
+                sender_user_id=sender_user_id,
+                token=entry_token,
+                ext_user_id=run_id,
+                session=judge.get_session(),
+                timeout=judge.timeout,
+            )
+        except Exception as e:
+            judge_limiter.record(judge_id, time.monotonic() - started, ok=False)
+            logger.error(
+                f'Run #{run_id}: submit to judge {judge_id!r} raised exception'
+            )
+            # Request was sent and ejudge may have created the run,
+            # submitting it again would duplicate it
+            if isinstance(e, requests.ReadTimeout):
+                logger.error(f'Run #{run_id}: judge {judge_id!r} did not answer submit, it is not retried')
+            elif self.request.retries < submit_task.max_retries:
+                logger.info('retry submit')
+                countdown = judge_limiter.get_delay(judge_id, self.default_retry_delay, judge.latency_target)
+                self.retry(exc=e, countdown=countdown)
+
+            _add_info_from_ejudge(run, None, None, EjudgeStatuses.RMATICS_SUBMIT_ERROR, judge_id)
+            run.protocol = _build_submit_error_protocol(run_id, 'Ошибка отправки посылки')
+            logger.error('submit failed after 3 retries')
+            return
+
+        judge_limiter.record(judge_id, time.monotonic() - started, ok=True)
+    finally:
+        judge_limiter.release(judge_id, token)
 
     try:
         code = ejudge_response['code']
@@ -1,12 +1,41 @@
 from flask_pymongo import PyMongo
 from flask_redis import FlaskRedis
-from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
 from celery import Celery
+from sqlalchemy import orm
+from sqlalchemy.sql import Select
 
 from rmatics.utils.patched_packages.patched_pymongo import patch_pymongo_to_avoiding_deadlocks
+from rmatics.utils.replicas import ReplicaRouter
 patch_pymongo_to_avoiding_deadlocks()
 
-db = SQLAlchemy()
+
+class RoutingSession(SignallingSession):
+    """ Selects go to replica chosen by ReplicaRouter for read only view, the rest go to primary """
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = ReplicaRouter.get_bind()
+        if bind is not None and not self._flushing and (clause is None or isinstance(clause, Select)):
+            return self.db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_read_engine(self):
+        """ Engine for Core selects: replica in read only view, primary otherwise """
+        bind = ReplicaRouter.get_bind()
+        if bind is not None:
+            return self.get_engine(bind=bind)
+        return self.engine
+
+
+db = RoutingSQLAlchemy()
 mongo = PyMongo()
 redis = FlaskRedis()
-celery = Celery('rmatics-alive')
\ No newline at end of file
+celery = Celery('rmatics-alive')
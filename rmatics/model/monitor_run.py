@@ -0,0 +1,90 @@
+from typing import Iterator
+
+from flask import current_app
+from sqlalchemy import and_, func, select
+
+from rmatics.model.base import db
+from rmatics.model.run import Run
+from rmatics.model.user import SimpleUser
+
+# Runs with display fields of their users, so monitors are read without join with moodle.mdl_user.
+# Rows are clustered by (problem_id, id) as monitors read them, see migrations/009-add_monitor_runs.sql
+MonitorRun = db.Table(
+    'monitor_runs',
+    db.Column('id', db.Integer, nullable=False, autoincrement=False),
+    db.Column('problem_id', db.Integer, nullable=False, autoincrement=False),
+    db.Column('user_id', db.Integer),
+    db.Column('create_time', db.DateTime),
+    db.Column('ej_score', db.Integer),
+    db.Column('ej_status', db.Integer),
+    db.Column('ej_test_num', db.Integer),
+    db.Column('statement_id', db.Integer),
+    db.Column('context_source', db.Integer),
+    db.Column('is_visible', db.Boolean),
+
+    db.Column('firstname', db.Unicode(100)),
+    db.Column('lastname', db.Unicode(100)),
+    db.Column('username', db.Unicode(100)),
+    db.Column('email', db.Unicode(100)),
+
+    db.PrimaryKeyConstraint('problem_id', 'id'),
+    db.Index('ix_monitor_runs_id', 'id', unique=True),
+    schema='pynformatics',
+)
+
+RUN_COLUMNS = ('id', 'problem_id', 'user_id', 'create_time', 'ej_score', 'ej_status', 'ej_test_num',
+               'statement_id', 'context_source', 'is_visible')
+USER_COLUMNS = ('firstname', 'lastname', 'username', 'email')
+
+
+def _select_monitor_runs():
+    runs = Run.__table__
+    users = SimpleUser.__table__
+    return select([*(runs.c[name] for name in RUN_COLUMNS), *(users.c[name] for name in USER_COLUMNS)]) \
+        .select_from(runs.join(users, runs.c.user_id == users.c.id))
+
+
+def sync_monitor_runs(where):
+    """ Writes runs matching where to monitor_runs if MONITOR_RUNS_PROJECTION is on """
+    if current_app.config.get('MONITOR_RUNS_PROJECTION'):
+        copy_monitor_runs(where)
+
+
+def copy_monitor_runs(where):
+    """ Copies runs matching where (clause on runs columns) to monitor_runs
+
+        Rows of the runs are replaced, so it is used for new and updated runs;
+        it is done in session transaction and is committed along with the runs.
+        Ids are selected first, mysql checks IN subquery of DELETE for every row of monitor_runs
+    """
+    run_ids = [run_id for run_id, in db.session.execute(select([Run.__table__.c.id]).where(where))]
+    if run_ids:
+        _replace_monitor_runs(MonitorRun.c.id.in_(run_ids), Run.__table__.c.id.in_(run_ids))
+
+
+def _replace_monitor_runs(projection_where, runs_where):
+    """ Both clauses should match the same runs, in monitor_runs and in runs """
+    db.session.execute(MonitorRun.delete().where(projection_where))
+    db.session.execute(MonitorRun.insert().from_select(
+        [*RUN_COLUMNS, *USER_COLUMNS],
+        _select_monitor_runs().where(runs_where),
+    ))
+
+
+def backfill_monitor_runs(after_id: int = 0, batch_size: int = 1000) -> Iterator[int]:
+    """ Copies runs with id > after_id to monitor_runs by batch_size runs, batch per transaction
+
+        Yields id of the last copied run after every batch, so it can be continued from it
+    """
+    runs = Run.__table__
+    while True:
+        batch = select([runs.c.id]).where(runs.c.id > after_id).order_by(runs.c.id).limit(batch_size).alias()
+        last_id = db.session.execute(select([func.max(batch.c.id)])).scalar()
+        if last_id is None:
+            return
+
+        _replace_monitor_runs(and_(MonitorRun.c.id > after_id, MonitorRun.c.id <= last_id),
+                              and_(runs.c.id > after_id, runs.c.id <= last_id))
+        db.session.commit()
+        yield last_id
+        after_id = last_id
@@ -1,10 +1,13 @@
 import datetime
 import hashlib
 import logging
-from typing import Optional
+import zlib
+from typing import Dict, Iterable, List, Optional, Tuple
 
-from flask import g
-from rmatics.utils.run import get_string_code, get_full_string_code
+from flask import g, current_app
+from rmatics.utils.run import get_string_code, get_full_string_code, get_string_status
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
 from sqlalchemy import MetaData, Table
 
 from rmatics.model.base import db, mongo
@@ -27,6 +30,14 @@ EJUDGE_COLUMNS = [
 class Run(db.Model):
     __table_args__ = (
         db.Index('ix_runs_ej_run_uuid_judge_id', 'ej_run_uuid', 'judge_id'),
+        # Covers the last run lookup of duplicate check
+        db.Index('ix_runs_user_id_problem_id_id_source_hash_ej_lang_id',
+                 'user_id', 'problem_id', 'id', 'source_hash', 'ej_lang_id'),
+        # Cover monitors and submissions list of problem, both ordered by id,
+        # see tests/unit/model/run/test_query_plans.py
+        db.Index('ix_runs_problem_id_id', 'problem_id', 'id'),
+        db.Index('ix_runs_problem_id_statement_id_id', 'problem_id', 'statement_id', 'id'),
+        db.Index('ix_runs_problem_id_ej_status_id', 'problem_id', 'ej_status', 'id'),
         {'schema': 'pynformatics'},
     )
     __tablename__ = 'runs'
@@ -83,6 +94,11 @@ class Run(db.Model):
             protocol['rjdgId'] = rejudge_id
             mongo.db.rejudge.insert_one(protocol)
             mongo.db.protocol.find_one_and_delete({'run_id': self.id})
+            if protocol.get('split'):
+                tests = list(mongo.db.protocol_test.find({'run_id': self.id}, {'_id': False}))
+                if tests:
+                    mongo.db.rejudge_test.insert_many([{**test, 'rjdgId': rejudge_id} for test in tests])
+                    mongo.db.protocol_test.delete_many({'run_id': self.id})
 
     @property
     def source(self) -> Optional[bytes]:
@@ -95,12 +111,39 @@ class Run(db.Model):
 
     @property
     def protocol(self) -> Optional[dict]:
-        p = mongo.db.protocol.find_one({'run_id': self.id}, {'_id': False})
-        return unmarshal_protocol(p)
+        return self.get_protocol()
 
     @protocol.setter
     def protocol(self, protocol_source: dict):
-        mongo.db.protocol.update({'run_id': self.id}, protocol_source, upsert=True)
+        protocol, tests = dump_protocol(self.id, protocol_source)
+        if tests is not None:
+            save_protocol_tests({self.id: tests})
+        mongo.db.protocol.update({'run_id': self.id}, protocol, upsert=True)
+
+    def get_protocol(self, full: bool = True) -> Optional[dict]:
+        """ If not full, data of tests stored out of protocol (see PROTOCOL_SPLIT_TESTS)
+            is not loaded, it can be got by get_protocol_test
+        """
+        protocol = unmarshal_protocol(mongo.db.protocol.find_one({'run_id': self.id}, {'_id': False}))
+        if protocol is None or not protocol.get('split'):
+            return protocol
+
+        tests_data = load_protocol_tests(self.id) if full else {}
+        for test_number, test in protocol['tests'].items():
+            for field in PROTOCOL_BLOB_FIELDS:
+                test.pop(field, None)
+            test.update(tests_data.get(test_number, {}))
+        return protocol
+
+    def get_protocol_test(self, test_number: str) -> Optional[dict]:
+        protocol = self.get_protocol(full=False)
+        if protocol is None or test_number not in protocol['tests']:
+            return None
+
+        test = protocol['tests'][test_number]
+        if protocol.get('split'):
+            test.update(load_protocol_tests(self.id, test_number).get(test_number, {}))
+        return test
 
     @staticmethod
     def generate_source_hash(blob: bytes) -> str:
@@ -180,39 +223,190 @@ LightWeightRun = Table(
 )
 
 
+# Compact protocol tests: (key, short key, type), values equal to type() are not stored
+PROTOCOL_TEST_FIELDS = (
+    ('input', 'i', str),
+    ('big_input', 'bi', bool),
+    ('corr', 'c', str),
+    ('big_corr', 'bc', bool),
+    ('output', 'o', str),
+    ('big_output', 'bo', bool),
+    ('checker_output', 'co', str),
+    ('error_output', 'eo', str),
+    ('extra', 'e', str),
+    ('status', 's', str),
+    ('time', 't', int),
+    ('real_time', 'rt', int),
+    ('max_memory_used', 'm', int),
+)
+# Derived from status, not stored
+PROTOCOL_DERIVED_FIELDS = ('string_status',)
+
+# Big fields of tests, stored out of protocol in protocol_test collection if PROTOCOL_SPLIT_TESTS
+PROTOCOL_BLOB_FIELDS = ('input', 'corr', 'output', 'checker_output', 'error_output')
+
+
+def _compress(value, threshold: int):
+    """ Text longer than threshold is stored as zlib compressed bytes """
+    if threshold and isinstance(value, str) and len(value) > threshold:
+        return zlib.compress(value.encode(), 1)
+    return value
+
+
+def _decompress(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode()
+    return value
+
+
+def _marshal_test(test: dict, threshold: int) -> dict:
+    known = {key for key, _, _ in PROTOCOL_TEST_FIELDS} | set(PROTOCOL_DERIVED_FIELDS)
+    # Unknown fields are kept as is
+    t = {key: value for key, value in test.items() if key not in known}
+    for key, short_key, typ in PROTOCOL_TEST_FIELDS:
+        value = test.get(key)
+        if value is not None and value != typ():
+            t[short_key] = _compress(value, threshold)
+    return t
+
+
+def _unmarshal_test(t: dict) -> dict:
+    short_keys = {short_key for _, short_key, _ in PROTOCOL_TEST_FIELDS}
+    test = {key: value for key, value in t.items() if key not in short_keys}
+    for key, short_key, typ in PROTOCOL_TEST_FIELDS:
+        test[key] = _decompress(t[short_key]) if short_key in t else typ()
+
+    if isinstance(t.get('s'), int):
+        # Numeric ejudge status
+        test['status'] = get_string_code(t['s'])
+    try:
+        test['string_status'] = get_string_status(test['status'])
+    except KeyError:
+        test['string_status'] = test['status']
+    return test
+
+
+def marshal_protocol(protocol: dict, compress_threshold: int = 0) -> dict:
+    """ Compact form of protocol to store in mongo
+
+        Tests are [[test_number, test]] with short keys, without default values
+        and derived fields, compiler output is "c".
+        Text fields longer than compress_threshold are compressed, 0 disables it
+    """
+    p = dict(protocol)
+    if 'tests' in p:
+        p['t'] = [[test_number, _marshal_test(test, compress_threshold)]
+                  for test_number, test in (p.pop('tests') or {}).items()]
+    if 'compiler_output' in p:
+        p['c'] = _compress(p.pop('compiler_output'), compress_threshold)
+    return p
+
+
+def split_protocol(run_id: int, protocol: dict) -> Tuple[dict, List[dict]]:
+    """ Returns protocol without PROTOCOL_BLOB_FIELDS of tests, marked as split,
+        and documents {run_id, test_num, **blob fields} of protocol_test collection
+    """
+    tests = {}
+    test_docs = []
+    for test_number, test in (protocol.get('tests') or {}).items():
+        tests[test_number] = {key: value for key, value in test.items() if key not in PROTOCOL_BLOB_FIELDS}
+        test_docs.append({
+            'run_id': run_id,
+            'test_num': test_number,
+            **{field: test[field] for field in PROTOCOL_BLOB_FIELDS if field in test},
+        })
+    return {**protocol, 'tests': tests, 'split': True}, test_docs
+
+
+def dump_protocol(run_id: int, protocol: dict) -> Tuple[dict, Optional[List[dict]]]:
+    """ Protocol and documents of its tests in the storage format chosen by config,
+        documents of tests are None if tests are stored in protocol
+    """
+    config = current_app.config
+    compact = config.get('PROTOCOL_COMPACT_FORMAT')
+    threshold = config.get('PROTOCOL_COMPRESS_THRESHOLD', 0) if compact else 0
+
+    test_docs = None
+    if config.get('PROTOCOL_SPLIT_TESTS'):
+        protocol, test_docs = split_protocol(run_id, protocol)
+        test_docs = [{key: _compress(value, threshold) for key, value in doc.items()} for doc in test_docs]
+    if compact:
+        protocol = marshal_protocol(protocol, threshold)
+    return protocol, test_docs
+
+
+# Code of mongo write error of unique index
+DUPLICATE_KEY_ERROR = 11000
+
+
+def create_protocol_test_indexes():
+    """ Indexes of collections of tests stored out of protocol, existing ones are kept """
+    mongo.db.protocol_test.create_index([('run_id', ASCENDING), ('test_num', ASCENDING)], unique=True)
+    mongo.db.rejudge_test.create_index([('run_id', ASCENDING), ('rjdgId', ASCENDING), ('test_num', ASCENDING)],
+                                       unique=True)
+
+
+def save_protocol_tests(tests_by_run: Dict[int, List[dict]]):
+    """ Replaces documents of tests of runs by new ones.
+        protocol_test is indexed by (run_id, test_num), see create_protocol_test_indexes
+    """
+    mongo.db.protocol_test.delete_many({'run_id': {'$in': list(tests_by_run)}})
+    test_docs = [doc for docs in tests_by_run.values() for doc in docs]
+    if not test_docs:
+        return
+    try:
+        mongo.db.protocol_test.insert_many(test_docs, ordered=False)
+    except BulkWriteError as e:
+        # Tests of the same protocol saved concurrently, e.g. by duplicate notification
+        if any(error['code'] != DUPLICATE_KEY_ERROR for error in e.details['writeErrors']):
+            raise
+
+
+def get_sources(run_ids: Iterable[int]) -> Dict[int, Optional[bytes]]:
+    """ Returns {run_id: source} of runs found by one query """
+    docs = mongo.db.source.find({'run_id': {'$in': list(run_ids)}},
+                                {'_id': False, 'run_id': True, 'blob': True})
+    return {doc['run_id']: doc.get('blob') for doc in docs}
+
+
+def get_protocol_summaries(run_ids: Iterable[int]) -> Dict[int, dict]:
+    """ Returns {run_id: protocol without PROTOCOL_BLOB_FIELDS of tests} found by one query """
+    summaries = {}
+    for doc in mongo.db.protocol.find({'run_id': {'$in': list(run_ids)}}, {'_id': False}):
+        run_id = doc['run_id']
+        protocol = unmarshal_protocol(doc)
+        for test in protocol['tests'].values():
+            for field in PROTOCOL_BLOB_FIELDS:
+                test.pop(field, None)
+        summaries[run_id] = protocol
+    return summaries
+
+
+def load_protocol_tests(run_id: int, test_number: str = None) -> Dict[str, dict]:
+    """ Returns {test_number: blob fields of test} stored out of protocol """
+    query = {'run_id': run_id}
+    if test_number is not None:
+        query['test_num'] = test_number
+
+    return {
+        doc['test_num']: {field: _decompress(doc[field]) for field in PROTOCOL_BLOB_FIELDS if field in doc}
+        for doc in mongo.db.protocol_test.find(query, {'_id': False})
+    }
+
+
 def unmarshal_protocol(p) -> Optional[dict]:
+    """ Long form of protocol stored in any format """
     if p is None:
         return None
     if "t" in p:
-        p["tests"] = {test_number: {
-            "input": fill(t, "i", str),
-            "big_input" : fill(t, "bi", bool),
-            "corr" : fill(t, "c", str),
-            "big_corr" : fill(t, "bc", bool),
-            "status" : get_string_code(t["s"] if "s" in t else None),
-            "string_status" : fill_str_status(t),
-            "real_time" : fill(t, "rt", int),
-            "time" : fill(t, "t", int),
-            "max_memory_used" : fill(t, "t", int),
-            "big_output" : fill(t, "bo", bool),
-            "output" : fill(t, "o", str),
-            "checker_output" : fill(t, "co", str),
-            "error_output" : fill(t, "eo", str),
-            "extra" : fill(t, "e", str),
-        } for test_number, t in p["t"]}
-        del p["t"]
+        p["tests"] = {test_number: _unmarshal_test(t) for test_number, t in p.pop("t")}
     if "tests" not in p:
         p["tests"] = {}
     if "c" in p:
-        p["compiler_output"] = p["c"]
+        p["compiler_output"] = _decompress(p.pop("c"))
     if "ejResp" in p:
         p["judge_resp"] = p["ejResp"]
     if "a" in p:
         p["audit"] = p["a"]
     p["v"] = 2
     return p
-
-    def fill(t, field, typ):
-        if field in t:
-            return typ(t[field])
-        return typ()
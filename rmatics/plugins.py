@@ -1,7 +1,12 @@
+from rmatics.ejudge.submit_queue.limiter import JudgeLimiter
 from rmatics.utils.cacher import FlaskCacher
-from rmatics.utils.cacher.cache_invalidators import MonitorCacheInvalidator
+from rmatics.utils.cacher.cache_invalidators import MonitorCacheInvalidator, RedisCacheInvalidator
+from rmatics.utils.duplicates import DuplicateSubmissionDetector
+from rmatics.utils.replicas import ReplicaRouter
+from rmatics.utils.standings import StandingsAggregator
 
 invalidator = MonitorCacheInvalidator(autocommit=False)
+redis_invalidator = RedisCacheInvalidator(prefix='monitor')
 
 allowed_kwargs = [
     'problem_id',
@@ -17,3 +22,10 @@ monitor_cacher = FlaskCacher(prefix='monitor',
                              cache_invalidator=invalidator,
                              allowed_kwargs=allowed_kwargs)
 
+standings_aggregator = StandingsAggregator(prefix='standings')
+
+duplicate_detector = DuplicateSubmissionDetector(prefix='last_source')
+
+judge_limiter = JudgeLimiter(prefix='judge')
+
+replica_router = ReplicaRouter(cookie='db_primary_until')
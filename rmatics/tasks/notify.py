@@ -2,15 +2,18 @@ import requests
 
 from celery import shared_task
 from celery.utils.log import get_task_logger
+from flask import current_app
 
 from werkzeug.exceptions import BadRequest
 from sqlalchemy import and_, update
 from typing import Optional
 
 from rmatics.ejudge.judges_config import get_judge
-from rmatics.model.base import db
+from rmatics.model.base import db, redis
+from rmatics.model.monitor_run import sync_monitor_runs
 from rmatics.model.run import Run
-from rmatics.utils.cacher.helpers import invalidate_monitor_cache_by_run
+from rmatics.plugins import standings_aggregator
+from rmatics.utils.cacher.helpers import invalidate_monitor_cache_by_run, update_monitor_cache_by_run
 
 from rmatics.ejudge.protocol import fetch_protocol
 
@@ -31,9 +34,9 @@ def _is_terminal(status: Optional[int]) -> bool:
     return status is not None and status not in NON_TERMINAL_STATUSES
 
 def _resolve_judge(judge_id: int):
-    """(url, token) ejudge'а, у которого спрашивать протокол."""
+    """(url, token, session, timeout) ejudge'а, у которого спрашивать протокол."""
     judge = get_judge(judge_id)
-    return judge.url, judge.get_token()
+    return judge.url, judge.get_token(), judge.get_session(), judge.timeout
 
 def _compare_values(x, y) -> bool:
     try:
@@ -90,26 +93,26 @@ def check_run(self, data) -> dict:
 
     return data
 
+def _load_protocol(run: Run, data: dict):
+    url, token, session, timeout = _resolve_judge(int(data["judge_id"]))
+    protocol = fetch_protocol(url, token, data["contest_id"], data["run_id"], run.id,
+                              session=session, timeout=timeout)
+    if protocol is not None:
+        run.protocol = protocol
+
+def _is_client_error(exc: Exception) -> bool:
+    """ Protocol request which failed with 4xx should not be retried """
+    return isinstance(exc, requests.HTTPError) and 400 <= exc.response.status_code < 500
+
 @shared_task(name='rmatics.tasks.notify.load_protocol', bind=True, default_retry_delay=30, max_retries=5)
 def load_protocol(self, data) -> dict:
     run = _get_run(data)
 
     if _is_terminal(data["status"]):
-        url, token = _resolve_judge(int(data["judge_id"]))
         try:
-            protocol = fetch_protocol(url, token, data["contest_id"], data["run_id"], run.id)
-            if protocol is not None:
-                run.protocol = protocol
-        except requests.HTTPError as exc:
-            status = exc.response.status_code
-            if not (400 <= status < 500) and self.request.retries < load_protocol.max_retries:
-                logger.info('retry protocol')
-                self.retry(exc=exc)
-            logger.warning('Failed to load protocol. Aborting.'
-                          f'Request args={data}')
-            raise exc
+            _load_protocol(run, data)
         except Exception as exc:
-            if self.request.retries < load_protocol.max_retries:
+            if not _is_client_error(exc) and self.request.retries < load_protocol.max_retries:
                 logger.info('retry protocol')
                 self.retry(exc=exc)
             logger.warning('Failed to load protocol. Aborting.'
@@ -118,16 +121,10 @@ def load_protocol(self, data) -> dict:
         
     return data
 
-UPD_RUN_COUNTDOWNS = (2, 5, 15, 60, 120)
-@shared_task(name='rmatics.tasks.notify.upd_run', bind=True, ignore_result=True, max_retries=len(UPD_RUN_COUNTDOWNS))
-def upd_run(self, data):
-    ejudge_run_id = _to_int(data.get('run_id'))
-    ejudge_run_uuid = data.get('run_uuid')
-    ejudge_contest_id = _to_int(data.get('contest_id'))
-    status = _to_int(data.get('status'))
-    judge_id = _to_int(data.get('judge_id'))
-
+def _get_run_values(data) -> dict:
+    """ Values of Run columns from notification """
     values = {}
+    status = _to_int(data.get('status'))
     if status is not None:
         values[Run.ejudge_status] = status
 
@@ -139,9 +136,18 @@ def upd_run(self, data):
     if test is not None:
         values[Run.ejudge_test_num] = test
 
-    values[Run.ejudge_run_id] = ejudge_run_id
-    values[Run.ejudge_run_uuid] = ejudge_run_uuid
-    values[Run.ejudge_contest_id] = ejudge_contest_id
+    values[Run.ejudge_run_id] = _to_int(data.get('run_id'))
+    values[Run.ejudge_run_uuid] = data.get('run_uuid')
+    values[Run.ejudge_contest_id] = _to_int(data.get('contest_id'))
+    return values
+
+
+def _update_run(data) -> bool:
+    ejudge_run_uuid = data.get('run_uuid')
+    status = _to_int(data.get('status'))
+    judge_id = _to_int(data.get('judge_id'))
+
+    values = _get_run_values(data)
 
     rmatics_run_id = data.get('rmatics_run_id')
     if rmatics_run_id is not None:
@@ -153,22 +159,40 @@ def upd_run(self, data):
     if status in NON_TERMINAL_STATUSES:
         where = and_(where, Run.ejudge_status.in_(NON_TERMINAL_STATUSES))
 
+    applied = db.session.execute(update(Run).where(where).values(values)).rowcount
+    if applied > 0:
+        sync_monitor_runs(where)
+    db.session.commit()
+
+    if applied > 0:
+        logger.info(f'Run was updated successfully')
+        if current_app.config.get('MONITOR_STANDINGS'):
+            _update_standings(where)
+    else:
+        logger.info(f'Skipping update: already terminal')
+    return applied > 0
+
+UPD_RUN_COUNTDOWNS = (2, 5, 15, 60, 120)
+@shared_task(name='rmatics.tasks.notify.upd_run', bind=True, ignore_result=True, max_retries=len(UPD_RUN_COUNTDOWNS))
+def upd_run(self, data):
     try:
-        applied = db.session.execute(update(Run).where(where).values(values)).rowcount
-        db.session.commit()
+        _update_run(data)
     except Exception as exc:
         if self.request.retries < upd_run.max_retries:
             logger.info('retry protocol')
             self.retry(exc=exc, countdown=UPD_RUN_COUNTDOWNS[self.request.retries])
         logger.error(f'Failed to update run. Aborting.')
         raise exc
-
-    if applied > 0:
-        logger.info(f'Run was updated successfully')
-    else:
-        logger.info(f'Skipping update: already terminal')
     return data
 
+def _update_standings(where):
+    try:
+        for problem_id, user_id in db.session.query(Run.problem_id, Run.user_id).filter(where):
+            standings_aggregator.update(problem_id, user_id)
+    except Exception:
+        # Standings are secondary, run update is already committed
+        logger.exception('Failed to update standings')
+
 @shared_task(name='rmatics.tasks.notify.invalidate_cache', bind=True, ignore_result=True, default_retry_delay=5, max_retries=3)
 def invalidate_cache(self, data):
     try:
@@ -177,7 +201,13 @@ def invalidate_cache(self, data):
         logger.info('retry invalidate')
         self.retry(exc=e)
 
-    invalidate_monitor_cache_by_run(run)
+    _invalidate_cache(run)
+
+def _invalidate_cache(run: Run):
+    if current_app.config.get('MONITOR_CACHE_UPDATE_IN_PLACE'):
+        update_monitor_cache_by_run(run)
+    else:
+        invalidate_monitor_cache_by_run(run)
 
 def make_terminal_upd_chain():
     upd_chain = check_run.s() | load_protocol.s() | upd_run.s() | invalidate_cache.s()
@@ -186,3 +216,92 @@ def make_terminal_upd_chain():
 def make_nonterminal_upd_chain():
     upd_chain = check_run.s() | upd_run.s() | invalidate_cache.s()
     return upd_chain
+
+
+# Retry countdowns of process_notification steps, the same as of the chain tasks
+NOTIFICATION_STEP_COUNTDOWNS = {
+    'check_run': CHECK_RUN_COUNTDOWNS,
+    'load_protocol': (load_protocol.default_retry_delay,) * load_protocol.max_retries,
+    'upd_run': UPD_RUN_COUNTDOWNS,
+    'invalidate_cache': (invalidate_cache.default_retry_delay,) * invalidate_cache.max_retries,
+}
+PROCESSED_KEY_PREFIX = 'notify/processed'
+
+@shared_task(name='rmatics.tasks.notify.process_notification', bind=True, ignore_result=True, max_retries=None)
+def process_notification(self, data, state=None):
+    """ Does the same as terminal or nonterminal chain in one task
+
+        state keeps done steps and retries of every step,
+        so task is retried from the failed step with its own countdowns.
+        Processed terminal notifications are remembered by (judge_id, run_uuid, status)
+        and their duplicates are skipped until nonterminal notification of the run
+        is applied, i.e. the run is judged again
+    """
+    state = state or {'done': [], 'retries': {}}
+    terminal = _is_terminal(data['status'])
+
+    if terminal and not state['done'] and _is_processed(data):
+        logger.info(f'Skipping notification: already processed. Request args={data}')
+        return
+
+    try:
+        run = _get_run(data)
+    except NoRunError as exc:
+        _retry_step(self, 'check_run', exc, data, state)
+
+    steps = [
+        ('load_protocol', lambda: _load_protocol(run, data)),
+        ('upd_run', lambda: _update_run(data)),
+        ('invalidate_cache', lambda: _invalidate_cache(run)),
+    ]
+    for step, do_step in steps:
+        if step in state['done'] or (step == 'load_protocol' and not terminal):
+            continue
+        try:
+            do_step()
+        except Exception as exc:
+            _retry_step(self, step, exc, data, state)
+        state['done'].append(step)
+
+    # Late nonterminal notification of judged run is not applied and doesn't make duplicates new
+    if terminal or not _is_terminal(_get_stored_status(run)):
+        _set_processed(data, terminal)
+
+def _get_stored_status(run: Run) -> Optional[int]:
+    return db.session.query(Run.ejudge_status).filter(Run.id == run.id).scalar()
+
+def _retry_step(task, step: str, exc: Exception, data: dict, state: dict):
+    countdowns = NOTIFICATION_STEP_COUNTDOWNS[step]
+    retries = state['retries'].get(step, 0)
+    if retries >= len(countdowns) or _is_client_error(exc):
+        logger.error(f'Failed to {step}. Aborting. Request args={data}')
+        raise exc
+
+    logger.info(f'retry {step}')
+    db.session.rollback()
+    state['retries'][step] = retries + 1
+    raise task.retry(args=(data,), kwargs={'state': state}, exc=exc, countdown=countdowns[retries])
+
+def _get_processed_key(data) -> str:
+    return f'{PROCESSED_KEY_PREFIX}/{_to_int(data["judge_id"])}/{data["run_uuid"]}'
+
+def _is_processed(data) -> bool:
+    try:
+        return bool(redis.hexists(_get_processed_key(data), str(data['status'])))
+    except Exception:
+        logger.warning('Can\'t read processed notifications from redis')
+        return False
+
+def _set_processed(data, terminal: bool):
+    key = _get_processed_key(data)
+    try:
+        if terminal:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.hset(key, str(data['status']), 1)
+            pipeline.expire(key, current_app.config.get('NOTIFY_PROCESSED_PERIOD', 60 * 60))
+            pipeline.execute()
+        else:
+            # Run is judged again, its next terminal notifications are new
+            redis.delete(key)
+    except Exception:
+        logger.warning('Can\'t write processed notifications to redis')
@@ -0,0 +1,261 @@
+import json
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from flask import current_app
+from pymongo import ReplaceOne
+from sqlalchemy import case, or_, update
+
+from rmatics.ejudge.protocol import fetch_protocol
+from rmatics.model.base import db, mongo, redis
+from rmatics.model.monitor_run import sync_monitor_runs
+from rmatics.model.run import Run, dump_protocol, save_protocol_tests
+from rmatics.plugins import standings_aggregator
+from rmatics.tasks.notify import (
+    _compare_values,
+    _get_run_values,
+    _resolve_judge,
+    _to_int,
+    make_terminal_upd_chain,
+    process_notification,
+)
+from rmatics.utils.cacher.helpers import invalidate_monitor_cache_by_runs, update_monitor_cache_by_run
+
+logger = get_task_logger(__name__)
+
+# Notifications are pushed to the left of buffer and popped from the right
+BUFFER_KEY = 'notify/terminal'
+SCHEDULED_KEY = 'notify/terminal/scheduled'
+# Flush is scheduled again by the next notification if scheduled one is lost
+SCHEDULE_GRACE_MS = 60 * 1000
+# Popped batches are kept in their lists until processed, {list key: lease deadline}
+PROCESSING_KEY = 'notify/terminal/processing'
+# Batch not acknowledged in this time is considered lost with its worker and returned to buffer
+PROCESSING_LEASE_S = 10 * 60
+
+
+def enqueue_terminal_notification(data: dict):
+    """ Buffers terminal notification, the first one of window schedules flush of buffer """
+    window_ms = current_app.config['NOTIFY_BATCH_WINDOW_MS']
+
+    pipeline = redis.pipeline(transaction=False)
+    pipeline.lpush(BUFFER_KEY, json.dumps(data))
+    pipeline.set(SCHEDULED_KEY, 1, nx=True, px=window_ms + SCHEDULE_GRACE_MS)
+    _, scheduled = pipeline.execute()
+
+    if scheduled:
+        flush_terminal_notifications.apply_async(countdown=window_ms / 1000)
+
+
+@shared_task(name='rmatics.tasks.notify_batch.flush_terminal_notifications', ignore_result=True)
+def flush_terminal_notifications():
+    # Notifications pushed after it schedule the next flush,
+    # the ones pushed before it are drained below
+    redis.delete(SCHEDULED_KEY)
+    _restore_lost_batches()
+
+    batch_size = current_app.config.get('NOTIFY_BATCH_SIZE', 200)
+    while True:
+        batch_key, notifications = _pop_batch(batch_size)
+        if not notifications:
+            break
+        try:
+            process_terminal_notifications(notifications)
+        except Exception:
+            # Batch is retried one by one, chains keep it in broker
+            logger.exception('Failed to process batch of notifications')
+            db.session.rollback()
+            for data in notifications:
+                _delay_one(data)
+        _ack_batch(batch_key)
+
+
+def _pop_batch(size: int) -> Tuple[str, List[dict]]:
+    """ Moves up to size oldest notifications from buffer to new processing list,
+        they are kept there until the batch is acknowledged or its lease expires
+    """
+    batch_key = f'{PROCESSING_KEY}/{uuid.uuid4().hex}'
+    pipeline = redis.pipeline(transaction=True)
+    pipeline.zadd(PROCESSING_KEY, {batch_key: time.time() + PROCESSING_LEASE_S})
+    for _ in range(size):
+        pipeline.rpoplpush(BUFFER_KEY, batch_key)
+    _, *items = pipeline.execute()
+
+    notifications = [json.loads(item) for item in items if item is not None]
+    if not notifications:
+        _ack_batch(batch_key)
+    return batch_key, notifications
+
+
+def _ack_batch(batch_key: str):
+    pipeline = redis.pipeline(transaction=True)
+    pipeline.delete(batch_key)
+    pipeline.zrem(PROCESSING_KEY, batch_key)
+    pipeline.execute()
+
+
+def _restore_lost_batches():
+    """ Returns batches with expired lease to the popped end of buffer, in their order.
+        Their notifications may be processed twice, which doesn't change the result
+    """
+    for batch_key in redis.zrangebyscore(PROCESSING_KEY, '-inf', time.time()):
+        # Processing list is reversed, its oldest notification is pushed last
+        items = redis.lrange(batch_key, 0, -1)
+        pipeline = redis.pipeline(transaction=True)
+        if items:
+            pipeline.rpush(BUFFER_KEY, *items)
+        pipeline.delete(batch_key)
+        pipeline.zrem(PROCESSING_KEY, batch_key)
+        pipeline.execute()
+        logger.warning(f'{len(items)} notifications of lost batch are returned to buffer')
+
+
+def process_terminal_notifications(notifications: List[dict]):
+    """ Does the same as terminal chain for every notification, but with
+        concurrent protocol fetches, one bulk write to mongo, one UPDATE of runs
+        and one cache invalidation per problem.
+
+        Notifications which can't be processed so (run is not committed yet,
+        protocol fetch failed) are processed one by one with retries
+    """
+    runs, unresolved = _find_runs(notifications)
+
+    protocols, failed = _fetch_protocols(runs)
+    for run_id in failed:
+        unresolved.append(runs.pop(run_id)[1])
+
+    for data in unresolved:
+        _delay_one(data)
+
+    if not runs:
+        return
+
+    _save_protocols(protocols)
+    _update_runs({run_id: data for run_id, (_, data) in runs.items()})
+    db.session.commit()
+    logger.info(f'{len(runs)} runs were updated by batch')
+
+    run_objects = [run for run, _ in runs.values()]
+    if current_app.config.get('MONITOR_STANDINGS'):
+        _update_standings(run_objects)
+
+    if current_app.config.get('MONITOR_CACHE_UPDATE_IN_PLACE'):
+        for run in run_objects:
+            update_monitor_cache_by_run(run)
+    else:
+        invalidate_monitor_cache_by_runs(run_objects)
+
+
+def _delay_one(data: dict):
+    if current_app.config.get('NOTIFY_SINGLE_TASK'):
+        process_notification.delay(data)
+    else:
+        make_terminal_upd_chain().delay(data)
+
+
+def _find_runs(notifications: List[dict]) -> Tuple[Dict[int, Tuple[Run, dict]], List[dict]]:
+    """ Returns {run_id: (run, notification)} and notifications without run,
+        as _get_run does. The last notification of run wins
+    """
+    run_ids = {_to_int(data.get('rmatics_run_id')) for data in notifications} - {None}
+    uuids = {data['run_uuid'] for data in notifications if data.get('rmatics_run_id') is None}
+
+    query = db.session.query(Run).filter(or_(Run.id.in_(run_ids), Run.ejudge_run_uuid.in_(uuids)))
+    runs_by_id = {}
+    runs_by_uuid = {}
+    for run in query:
+        runs_by_id[run.id] = run
+        runs_by_uuid[(run.ejudge_run_uuid, run.judge_id)] = run
+
+    runs = {}
+    unresolved = []
+    for data in notifications:
+        run_id = _to_int(data.get('rmatics_run_id'))
+        if data.get('rmatics_run_id') is not None:
+            run = runs_by_id.get(run_id)
+        else:
+            run = runs_by_uuid.get((data['run_uuid'], _to_int(data['judge_id'])))
+
+        if run is None \
+                or not _compare_values(run_id, run.id) \
+                or not _compare_values(_to_int(data['judge_id']), run.judge_id) \
+                or not _compare_values(data['run_uuid'], run.ejudge_run_uuid):
+            unresolved.append(data)
+        else:
+            runs[run.id] = (run, data)
+    return runs, unresolved
+
+
+def _fetch_protocols(runs: Dict[int, Tuple[Run, dict]]) -> Tuple[Dict[int, Optional[dict]], List[int]]:
+    """ Fetches protocols in threads, returns {run_id: protocol} and ids of runs failed to fetch """
+    app = current_app._get_current_object()
+
+    def fetch(run_id: int, data: dict) -> Optional[dict]:
+        with app.app_context():
+            url, token, session, timeout = _resolve_judge(int(data['judge_id']))
+            return fetch_protocol(url, token, data['contest_id'], data['run_id'], run_id,
+                                  session=session, timeout=timeout)
+
+    workers = current_app.config.get('NOTIFY_BATCH_FETCH_WORKERS', 8)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {run_id: executor.submit(fetch, run_id, data) for run_id, (_, data) in runs.items()}
+
+    protocols = {}
+    failed = []
+    for run_id, future in futures.items():
+        try:
+            protocols[run_id] = future.result()
+        except Exception:
+            logger.warning(f'Failed to load protocol of run #{run_id} in batch', exc_info=True)
+            failed.append(run_id)
+    return protocols, failed
+
+
+def _save_protocols(protocols: Dict[int, Optional[dict]]):
+    requests = []
+    tests_by_run = {}
+    for run_id, protocol in protocols.items():
+        if protocol is None:
+            continue
+        protocol, tests = dump_protocol(run_id, protocol)
+        requests.append(ReplaceOne({'run_id': run_id}, protocol, upsert=True))
+        if tests is not None:
+            tests_by_run[run_id] = tests
+
+    if tests_by_run:
+        save_protocol_tests(tests_by_run)
+    if requests:
+        mongo.db.protocol.bulk_write(requests, ordered=False)
+
+
+def _update_runs(notifications: Dict[int, dict]):
+    """ One UPDATE ... SET column = CASE id WHEN ... for all runs """
+    values_by_run = {
+        run_id: {column.key: value for column, value in _get_run_values(data).items()}
+        for run_id, data in notifications.items()
+    }
+
+    keys = {key for run_values in values_by_run.values() for key in run_values}
+    values = {}
+    for key in keys:
+        column = getattr(Run, key)
+        whens = {run_id: run_values[key]
+                 for run_id, run_values in values_by_run.items()
+                 if key in run_values}
+        values[column] = case(whens, value=Run.id, else_=column)
+
+    db.session.execute(update(Run).where(Run.id.in_(list(values_by_run))).values(values))
+    sync_monitor_runs(Run.id.in_(list(values_by_run)))
+
+
+def _update_standings(runs: List[Run]):
+    try:
+        for problem_id, user_id in {(run.problem_id, run.user_id) for run in runs}:
+            standings_aggregator.update(problem_id, user_id)
+    except Exception:
+        # Standings are secondary, runs update is already committed
+        logger.exception('Failed to update standings')
@@ -1,16 +1,39 @@
 import json
+import threading
+import time
 
 from mock import MagicMock
 
+from rmatics.model.base import redis
 from rmatics.testutils import TestCase
 from rmatics.utils.cacher import Cacher
-from rmatics.utils.cacher.locker import FakeLocker
+from rmatics.utils.cacher.locker import FakeLocker, ILocker
 
 PREFIX = 'my_cache'
 FUNC_NAME = 'my_func_name'
 FUNC_RETURN_VALUE = {'data': 'hi!'}
 
 
+class ThreadLocker(ILocker):
+    """ Locks of threads of one process, as RedisLocker locks of processes """
+    def __init__(self):
+        self.locks = {}
+        self.guard = threading.Lock()
+
+    def _lock(self, key, timeout):
+        self._get_lock(key).acquire()
+
+    def _try_lock(self, key, timeout) -> bool:
+        return self._get_lock(key).acquire(blocking=False)
+
+    def _unlock(self, key):
+        self._get_lock(key).release()
+
+    def _get_lock(self, key) -> threading.Lock:
+        with self.guard:
+            return self.locks.setdefault(key, threading.Lock())
+
+
 class TestCacher(TestCase):
 
     def setUp(self):
@@ -67,8 +90,168 @@ class TestCacher(TestCase):
         res = self.cached_function(a=3)
 
         self.to_be_cached.assert_not_called()
-        self.locker_lock.assert_called_once()
-        self.locker_unlock.assert_called_once()
+        # Hits are read without lock
+        self.locker_lock.assert_not_called()
+        self.locker_unlock.assert_not_called()
 
         self.invalidator_subscribe_mock.assert_not_called()
         self.assertEqual(res, another_func_return)
+
+
+class TestCacherGetMany(TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.redis = MagicMock()
+        self.pipeline = self.redis.pipeline.return_value
+
+        invalidator = MagicMock()
+        self.invalidator_subscribe_mock = invalidator.subscribe
+
+        self.cacher = Cacher(self.redis, FakeLocker(), ['a', 'problem_id'], prefix='key_prefix',
+                             cache_invalidator=invalidator)
+
+        self.batch_func = MagicMock(side_effect=lambda list_of_kwargs: [
+            {'a': kwargs['a']} for kwargs in list_of_kwargs
+        ])
+        self.to_be_cached = MagicMock()
+        self.to_be_cached.__name__ = FUNC_NAME
+
+    def test_get_all_from_cache(self):
+        self.redis.mget.return_value = [json.dumps({'a': 1}), json.dumps({'a': 2})]
+
+        res = self.cacher.get_many(self.to_be_cached, [{'a': 1}, {'a': 2}], batch_func=self.batch_func)
+
+        self.assertEqual(res, [{'a': 1}, {'a': 2}])
+        self.redis.mget.assert_called_once()
+        self.redis.get.assert_not_called()
+        self.batch_func.assert_not_called()
+        self.pipeline.execute.assert_not_called()
+        self.invalidator_subscribe_mock.assert_not_called()
+
+    def test_compute_only_missed(self):
+        self.redis.mget.return_value = [json.dumps({'a': 1}), None, None]
+
+        res = self.cacher.get_many(self.to_be_cached, [{'a': 1}, {'a': 2}, {'a': 3}],
+                                   batch_func=self.batch_func)
+
+        self.assertEqual(res, [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.batch_func.assert_called_once_with([{'a': 2}, {'a': 3}])
+
+        self.assertEqual(self.pipeline.set.call_count, 2)
+        self.pipeline.execute.assert_called_once()
+        self.redis.set.assert_not_called()
+        self.assertEqual(self.invalidator_subscribe_mock.call_count, 2)
+
+    def test_same_keys_as_single_call(self):
+        self.redis.get.return_value = ''
+        self.redis.mget.return_value = [None]
+        self.to_be_cached.return_value = FUNC_RETURN_VALUE
+
+        cached_function = self.cacher(self.to_be_cached)
+        cached_function(a=1)
+        self.cacher.get_many(cached_function, [{'a': 1}])
+
+        single_key = self.redis.set.call_args[0][0]
+        self.assertEqual(self.redis.mget.call_args[0][0], [single_key])
+        # Missed result is computed by the cached function itself
+        self.to_be_cached.assert_called_with(a=1)
+
+
+class TestCacherStampede(TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.redis = MagicMock()
+        self.pipeline = self.redis.pipeline.return_value
+
+        # Lock is taken by another process
+        self.locker = FakeLocker()
+        self.locker._try_lock = MagicMock(return_value=False)
+
+        self.to_be_cached = MagicMock(return_value=FUNC_RETURN_VALUE)
+        self.to_be_cached.__name__ = FUNC_NAME
+
+    def get_cached_function(self, **kwargs):
+        cacher = Cacher(self.redis, self.locker, ['a'], prefix='key_prefix', period=60, **kwargs)
+        return cacher(self.to_be_cached)
+
+    def test_waits_for_fill(self):
+        self.redis.get.side_effect = [None, None, json.dumps({'filled': True})]
+
+        res = self.get_cached_function(fill_wait=1)(a=1)
+
+        self.assertEqual(res, {'filled': True})
+        self.to_be_cached.assert_not_called()
+        self.redis.set.assert_not_called()
+
+    def test_computes_without_caching_if_not_filled(self):
+        self.redis.get.return_value = None
+
+        res = self.get_cached_function(fill_wait=0.1)(a=1)
+
+        self.assertEqual(res, FUNC_RETURN_VALUE)
+        self.to_be_cached.assert_called_once_with(a=1)
+        self.redis.set.assert_not_called()
+
+    def test_serves_stale_while_revalidating(self):
+        # Result is cached but its fresh marker is expired
+        self.redis.mget.return_value = [json.dumps({'stale': True}), None]
+        cached_function = self.get_cached_function(stale_period=30)
+
+        res = cached_function(a=1)
+        self.assertEqual(res, {'stale': True})
+        self.to_be_cached.assert_not_called()
+        self.redis.get.assert_not_called()
+
+        # Lock owner recomputes result
+        self.locker._try_lock.return_value = True
+        res = cached_function(a=1)
+        self.assertEqual(res, FUNC_RETURN_VALUE)
+
+        (key, _), value_kwargs = self.pipeline.set.call_args_list[0]
+        (fresh_key, _), fresh_kwargs = self.pipeline.set.call_args_list[1]
+        self.assertEqual(value_kwargs, {'ex': 90})
+        self.assertEqual(fresh_key, f'{key}/fresh')
+        self.assertEqual(fresh_kwargs, {'ex': 60})
+        self.pipeline.execute.assert_called_once()
+
+    def test_get_many_serves_stale(self):
+        self.redis.mget.return_value = [json.dumps({'a': 1}), json.dumps({'a': 2}), None, b'1']
+        cacher = Cacher(self.redis, self.locker, ['a'], prefix='key_prefix', period=60, stale_period=30)
+        batch_func = MagicMock(return_value=[])
+
+        res = cacher.get_many(self.to_be_cached, [{'a': 1}, {'a': 2}], batch_func=batch_func)
+
+        self.assertEqual(res, [{'a': 1}, {'a': 2}])
+        batch_func.assert_not_called()
+
+    def test_get_many_is_single_flight(self):
+        cacher = Cacher(redis, ThreadLocker(), ['a'], prefix='key_prefix', period=60, fill_wait=2)
+        started = threading.Event()
+
+        def batch_func(list_of_kwargs):
+            started.set()
+            time.sleep(0.2)
+            return [{'a': kwargs['a']} for kwargs in list_of_kwargs]
+
+        batch_mock = MagicMock(side_effect=batch_func)
+        list_of_kwargs = [{'a': 1}, {'a': 2}]
+        results = {}
+
+        def first():
+            results['first'] = cacher.get_many(self.to_be_cached, list_of_kwargs, batch_func=batch_mock)
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        started.wait(1)
+        # Only the missed key which is not being computed is computed by the second caller
+        second = cacher.get_many(self.to_be_cached, list_of_kwargs + [{'a': 3}], batch_func=batch_mock)
+        thread.join()
+
+        self.assertEqual(results['first'], [{'a': 1}, {'a': 2}])
+        self.assertEqual(second, [{'a': 1}, {'a': 2}, {'a': 3}])
+        self.assertEqual([call[0][0] for call in batch_mock.call_args_list], [list_of_kwargs, [{'a': 3}]])
+        self.to_be_cached.assert_not_called()
@@ -125,3 +125,15 @@ class TestMonitorCacheInvalidator(TestCase):
         }
         self.invalidator.invalidate(FUNC_NAME, all_of=func_kwargs)
         self.redis_delete_mock.assert_called_once()
+
+    def test_cache_invalidated_by_problem_and_any_user(self):
+        self.invalidator.invalidate_by = ['user_ids']
+        self.invalidator.subscribe(FUNC_NAME, 10, 'user_1', {'problem_id': 1, 'user_ids': 1})
+        self.invalidator.subscribe(FUNC_NAME, 10, 'user_2', {'problem_id': 1, 'user_ids': 2})
+        self.invalidator.subscribe(FUNC_NAME, 10, 'user_3', {'problem_id': 1, 'user_ids': 3})
+        self.invalidator.subscribe(FUNC_NAME, 10, 'other_problem', {'problem_id': 2, 'user_ids': 1})
+
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1}, any_of={'user_ids': [1, 2]})
+
+        self.redis_delete_mock.assert_called_once()
+        self.assertCountEqual(self.redis_delete_mock.call_args[0], ['user_1', 'user_2'])
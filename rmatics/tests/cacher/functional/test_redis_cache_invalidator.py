@@ -0,0 +1,129 @@
+from mock import MagicMock
+
+from rmatics.utils.cacher import Cacher
+from rmatics.utils.cacher.locker import FakeLocker
+
+from rmatics.model.base import redis
+from rmatics.testutils import TestCase
+from rmatics.utils.cacher.cache_invalidators import RedisCacheInvalidator
+
+PREFIX = 'my_cache'
+FUNC_NAME = 'my_func_name'
+PERIOD = 10
+
+
+class TestRedisCacheInvalidator(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.remove_cache_mock = MagicMock()
+
+        self.invalidator = RedisCacheInvalidator(prefix=PREFIX)
+        self.invalidator.init_app(remove_cache_func=self.remove_cache_mock, store=redis)
+
+    def subscribe(self, key, **func_kwargs):
+        self.invalidator.subscribe(FUNC_NAME, PERIOD, key, func_kwargs)
+
+    def removed_keys(self):
+        return {key.decode()
+                for call in self.remove_cache_mock.call_args_list
+                for key in call[0]}
+
+    def test_subscribe_creates_index_with_ttl(self):
+        self.subscribe('key', problem_id=1, user_ids=[1, 2], time_after=5)
+
+        for suffix in ('user_ids_1', 'user_ids_2', 'all'):
+            set_key = f'{PREFIX}/invalidate/{FUNC_NAME}/1/{suffix}'
+            self.assertEqual(redis.smembers(set_key), {b'key'})
+            self.assertTrue(0 < redis.ttl(set_key) <= PERIOD)
+
+        self.assertFalse(redis.exists(f'{PREFIX}/invalidate/{FUNC_NAME}/1/*'))
+
+    def test_cache_invalidated_by_user(self):
+        self.subscribe('key_users_1_2', problem_id=1, user_ids=[1, 2])
+        self.subscribe('key_user_3', problem_id=1, user_ids=[3])
+        self.subscribe('key_all_users', problem_id=1, time_after=5)
+        self.subscribe('key_other_problem', problem_id=2, user_ids=[1])
+
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1, 'user_ids': 1})
+
+        self.assertEqual(self.removed_keys(), {'key_users_1_2', 'key_all_users'})
+
+    def test_cache_invalidated_for_problem(self):
+        self.subscribe('key_user_1', problem_id=1, user_ids=[1])
+        self.subscribe('key_all_users', problem_id=1)
+        self.subscribe('key_other_problem', problem_id=2, user_ids=[1])
+
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1})
+
+        self.assertEqual(self.removed_keys(), {'key_user_1', 'key_all_users'})
+
+    def test_cache_not_invalidated(self):
+        self.subscribe('key_user_1', problem_id=1, user_ids=[1])
+
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1, 'user_ids': 2})
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 2, 'user_ids': 1})
+
+        self.remove_cache_mock.assert_not_called()
+
+    def test_index_removed_after_invalidation(self):
+        self.subscribe('key_user_1', problem_id=1, user_ids=[1])
+
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1, 'user_ids': 1})
+        self.invalidator.invalidate(FUNC_NAME, all_of={'problem_id': 1, 'user_ids': 1})
+
+        self.remove_cache_mock.assert_called_once()
+
+    def test_find(self):
+        self.subscribe('key_user_1', problem_id=1, user_ids=[1], show_hidden=False)
+        self.subscribe('key_user_2', problem_id=1, user_ids=[2])
+
+        entries = self.invalidator.find(FUNC_NAME, all_of={'problem_id': 1, 'user_ids': 1})
+
+        self.assertEqual(entries, [('key_user_1', {'problem_id': 1, 'user_ids': [1], 'show_hidden': False})])
+
+
+class TestCacherUpdate(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        invalidator = RedisCacheInvalidator(prefix=PREFIX)
+        invalidator.init_app(remove_cache_func=redis.delete, store=redis)
+        self.cacher = Cacher(redis, FakeLocker(), ['problem_id', 'user_ids'], prefix=PREFIX,
+                             cache_invalidator=invalidator, period=PERIOD)
+
+        def func(problem_id=None, user_ids=None):
+            return [problem_id]
+        self.func = func
+
+    def cached_values(self, list_of_kwargs):
+        return self.cacher.get_many(self.func, list_of_kwargs, batch_func=MagicMock(side_effect=AssertionError))
+
+    def test_update(self):
+        list_of_kwargs = [
+            {'problem_id': 1, 'user_ids': [1, 2]},
+            {'problem_id': 1, 'user_ids': [3]},
+            {'problem_id': 2},
+        ]
+        self.cacher.get_many(self.func, list_of_kwargs, batch_func=lambda kwargs: [[k['problem_id']] for k in kwargs])
+
+        patch = MagicMock(side_effect=lambda result, func_kwargs: result + ['patched'])
+        updated = self.cacher.update(self.func, patch, problem_id=1, user_ids=1)
+
+        self.assertTrue(updated)
+        patch.assert_called_once_with([1], {'problem_id': 1, 'user_ids': [1, 2]})
+        self.assertEqual(self.cached_values(list_of_kwargs), [[1, 'patched'], [1], [2]])
+
+    def test_update_removes_unpatchable(self):
+        self.cacher.get_many(self.func, [{'problem_id': 1}], batch_func=lambda kwargs: [[1]])
+
+        self.cacher.update(self.func, lambda result, func_kwargs: None, problem_id=1, user_ids=1)
+
+        func_result = self.cacher.get_many(self.func, [{'problem_id': 1}], batch_func=lambda kwargs: [['new']])
+        self.assertEqual(func_result, [['new']])
+
+    def test_update_not_supported(self):
+        self.cacher.cache_invalidator = MagicMock()
+        self.cacher.cache_invalidator.find.return_value = None
+
+        self.assertFalse(self.cacher.update(self.func, MagicMock(), problem_id=1))
@@ -38,3 +38,11 @@ class TestCacher(TestCase):
         keys.add(get_cache_key(func, prefix, args, kwargs))
 
         self.assertEqual(len(keys), 3)
+
+    def test_cache_key_is_stable(self):
+        func = MagicMock(__name__='func')
+
+        key = get_cache_key(func, 'prefix', (), {'a': [1, 2], 'b': 'c'})
+        self.assertEqual(key, get_cache_key(func, 'prefix', (), {'b': 'c', 'a': [1, 2]}))
+        self.assertNotEqual(key, get_cache_key(func, 'prefix', (), {'a': [2, 1], 'b': 'c'}))
+        self.assertTrue(key.startswith('prefix/func_'))
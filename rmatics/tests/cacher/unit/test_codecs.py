@@ -0,0 +1,50 @@
+import json
+
+from rmatics.testutils import TestCase
+from rmatics.utils.cacher.codecs import CacheCodec, MSGPACK_VERSION, ZLIB_FLAG
+
+VALUE = [{'id': i, 'user': {'id': 1, 'firstname': 'Имя'}, 'score': None} for i in range(100)]
+
+
+class TestCacheCodec(TestCase):
+    def test_json_is_plain(self):
+        codec = CacheCodec()
+        data = codec.dumps(VALUE)
+
+        self.assertEqual(json.loads(data), VALUE)
+        self.assertEqual(codec.loads(data), VALUE)
+
+    def test_msgpack(self):
+        codec = CacheCodec('msgpack')
+        data = codec.dumps(VALUE)
+
+        self.assertEqual(data[0], MSGPACK_VERSION)
+        self.assertEqual(codec.loads(data), VALUE)
+
+    def test_compression(self):
+        codec = CacheCodec('msgpack', compress_threshold=100)
+        data = codec.dumps(VALUE)
+
+        self.assertEqual(data[0], MSGPACK_VERSION | ZLIB_FLAG)
+        self.assertLess(len(data), len(CacheCodec('msgpack').dumps(VALUE)))
+        self.assertEqual(codec.loads(data), VALUE)
+
+        # Small values are not compressed
+        self.assertEqual(codec.dumps([1])[0], MSGPACK_VERSION)
+
+        codec = CacheCodec('json', compress_threshold=100)
+        self.assertEqual(codec.loads(codec.dumps(VALUE)), VALUE)
+
+    def test_reads_every_version(self):
+        codecs = [CacheCodec(), CacheCodec('msgpack'), CacheCodec('json', compress_threshold=1)]
+        old_entry = json.dumps(VALUE)
+
+        for codec in codecs:
+            self.assertEqual(codec.loads(old_entry), VALUE)
+            self.assertEqual(codec.loads(old_entry.encode()), VALUE)
+            for other_codec in codecs:
+                self.assertEqual(codec.loads(other_codec.dumps(VALUE)), VALUE)
+
+    def test_unknown_serializer(self):
+        with self.assertRaises(ValueError):
+            CacheCodec('pickle')
@@ -0,0 +1,101 @@
+import json
+
+import mock
+from mock import MagicMock
+
+from rmatics.testutils import TestCase
+from rmatics.utils.cacher.cacher import Cacher
+from rmatics.utils.cacher.local_cache import LocalCache, MISSING
+from rmatics.utils.cacher.locker import FakeLocker
+
+CHANNEL = 'invalidated'
+
+
+class TestLocalCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.store = MagicMock()
+        self.local_cache = LocalCache(max_bytes=10, ttl=5)
+        self.local_cache.init_app(self.store, channel=CHANNEL)
+
+    def test_get_set(self):
+        self.assertIs(self.local_cache.get('a'), MISSING)
+
+        self.local_cache.set('a', [], size=2)
+        self.assertEqual(self.local_cache.get('a'), [])
+
+        # Listener is started once
+        self.store.pubsub.return_value.subscribe.assert_called_once()
+        self.local_cache.get('a')
+        self.store.pubsub.assert_called_once()
+
+    def test_evicts_least_recently_used(self):
+        self.local_cache.set('a', 'a', size=4)
+        self.local_cache.set('b', 'b', size=4)
+        self.local_cache.get('a')
+        self.local_cache.set('c', 'c', size=4)
+
+        self.assertEqual(self.local_cache.get('a'), 'a')
+        self.assertIs(self.local_cache.get('b'), MISSING)
+        self.assertEqual(self.local_cache.get('c'), 'c')
+
+        # Too big values are not stored
+        self.local_cache.set('d', 'd', size=11)
+        self.assertIs(self.local_cache.get('d'), MISSING)
+        self.assertEqual(self.local_cache.get('a'), 'a')
+
+    def test_expires(self):
+        self.local_cache.set('a', 'a', size=1)
+        with mock.patch('rmatics.utils.cacher.local_cache.time.monotonic') as monotonic:
+            monotonic.return_value = float('inf')
+            self.assertIs(self.local_cache.get('a'), MISSING)
+
+    def test_publish(self):
+        self.local_cache.set('a', 'a', size=1)
+        self.local_cache.set('b', 'b', size=1)
+
+        self.local_cache.publish([b'a'])
+
+        self.assertIs(self.local_cache.get('a'), MISSING)
+        self.store.publish.assert_called_once_with(CHANNEL, json.dumps(['a']))
+
+        # Message from other process
+        self.local_cache._on_message({'data': json.dumps(['b']).encode()})
+        self.assertIs(self.local_cache.get('b'), MISSING)
+
+
+class TestCacherWithLocalCache(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.redis = MagicMock()
+        self.local_cache = LocalCache(max_bytes=1024, ttl=5)
+
+        self.cacher = Cacher(self.redis, FakeLocker(), ['a'], prefix='key_prefix',
+                             local_cache=self.local_cache)
+
+        self.to_be_cached = MagicMock()
+        self.to_be_cached.__name__ = 'func'
+        self.cached_function = self.cacher(self.to_be_cached)
+
+    def test_hit_is_kept_in_process(self):
+        self.redis.get.return_value = json.dumps({'a': 1})
+
+        self.assertEqual(self.cached_function(a=1), {'a': 1})
+        self.assertEqual(self.cached_function(a=1), {'a': 1})
+        self.redis.get.assert_called_once()
+
+        self.redis.mget.return_value = [None]
+        self.to_be_cached.return_value = {'a': 2}
+        res = self.cacher.get_many(self.cached_function, [{'a': 1}, {'a': 2}])
+        self.assertEqual(res, [{'a': 1}, {'a': 2}])
+        self.assertEqual(len(self.redis.mget.call_args[0][0]), 1)
+
+    def test_remove(self):
+        self.redis.get.return_value = json.dumps({'a': 1})
+        self.cached_function(a=1)
+        key = self.redis.get.call_args[0][0]
+
+        self.cacher.remove(key)
+
+        self.redis.delete.assert_called_once_with(key)
+        self.assertIs(self.local_cache.get(key), MISSING)
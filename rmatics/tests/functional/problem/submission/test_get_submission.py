@@ -297,3 +297,109 @@ class TestAPIProblemSubmission(TestCase):
         data = resp.get_json()
         self.assertEqual(data['result'], 'success')
         self.assertEqual(len(data['data']), 2)
+
+    def test_keyset_pages(self):
+        # run1, run3, run5 are in problems[1], run5 is hidden
+        resp = self.send_request(self.problems[1].id, count=1, show_hidden=True)
+        self.assert200(resp)
+        data = resp.get_json()
+        self.assertEqual([run['id'] for run in data['data']], [self.run5.id])
+        self.assertEqual(data['metadata']['count'], 3)
+        self.assertEqual(data['metadata']['next_before_id'], self.run5.id)
+
+        resp = self.send_request(self.problems[1].id, page=None, count=1, show_hidden=True,
+                                 before_id=self.run5.id)
+        self.assert200(resp)
+        data = resp.get_json()
+        self.assertEqual([run['id'] for run in data['data']], [self.run3.id])
+        self.assertIsNone(data['metadata']['count'])
+        self.assertEqual(data['metadata']['next_before_id'], self.run3.id)
+        self.assertEqual(data['metadata']['next_after_id'], self.run3.id)
+
+        resp = self.send_request(self.problems[1].id, page=None, count=2, show_hidden=True,
+                                 before_id=self.run3.id)
+        data = resp.get_json()
+        self.assertEqual([run['id'] for run in data['data']], [self.run1.id])
+        self.assertIsNone(data['metadata']['next_before_id'])
+
+        resp = self.send_request(self.problems[1].id, page=None, count=1, show_hidden=True,
+                                 after_id=self.run1.id)
+        data = resp.get_json()
+        self.assertEqual([run['id'] for run in data['data']], [self.run3.id])
+        self.assertEqual(data['metadata']['next_after_id'], self.run3.id)
+
+        resp = self.send_request(self.problems[1].id, page=None, count=5, show_hidden=True,
+                                 after_id=self.run1.id, total='exact')
+        data = resp.get_json()
+        self.assertEqual([run['id'] for run in data['data']], [self.run5.id, self.run3.id])
+        self.assertIsNone(data['metadata']['next_after_id'])
+        self.assertEqual(data['metadata']['count'], 3)
+        self.assertEqual(data['metadata']['page_count'], 1)
+
+    def test_empty_count(self):
+        resp = self.send_request(self.problems[1].id, count=0, show_hidden=True)
+        self.assert200(resp)
+        data = resp.get_json()
+        self.assertEqual(data['data'], [])
+        self.assertEqual(data['metadata']['count'], 3)
+        self.assertIsNone(data['metadata']['next_before_id'])
+
+        for cursor in ({'before_id': self.run5.id}, {'after_id': self.run1.id}):
+            resp = self.send_request(self.problems[1].id, page=None, count=0, show_hidden=True, **cursor)
+            self.assert200(resp)
+            data = resp.get_json()
+            self.assertEqual(data['data'], [])
+            self.assertIsNone(data['metadata']['next_after_id'])
+
+    def test_page_is_required(self):
+        resp = self.send_request(self.problems[1].id, page=None)
+        self.assert400(resp)
+
+    def test_cached_total(self):
+        resp = self.send_request(self.problems[1].id, total='cached')
+        self.assert200(resp)
+        self.assertEqual(resp.get_json()['metadata']['count'], 2)
+
+        run = Run(user_id=self.user1.id, problem_id=self.problems[1].id,
+                  ejudge_status=0, lang_id=1, is_visible=True)
+        db.session.add(run)
+        db.session.commit()
+
+        resp = self.send_request(self.problems[1].id, total='cached', page=2, count=1)
+        data = resp.get_json()
+        self.assertEqual(data['metadata']['count'], 2)
+        self.assertEqual(data['metadata']['page_count'], 2)
+        self.assertEqual(len(data['data']), 1)
+
+        resp = self.send_request(self.problems[1].id, total='exact')
+        self.assertEqual(resp.get_json()['metadata']['count'], 3)
+
+        resp = self.send_request(self.problems[1].id, total='cached', lang_id=1)
+        self.assertEqual(resp.get_json()['metadata']['count'], 2)
+
+
+class TestAPIProblemSubmissionCoreQuery(TestAPIProblemSubmission):
+    def setUp(self):
+        super().setUp()
+        self.app.config['SUBMISSIONS_CORE_QUERY'] = True
+
+    def tearDown(self):
+        self.app.config['SUBMISSIONS_CORE_QUERY'] = False
+        super().tearDown()
+
+    def test_same_as_orm(self):
+        self.run1.create_time = datetime(2019, 1, 2, 3, 4, 5, 6)
+        self.run1.ejudge_score = 100
+        db.session.commit()
+
+        self.run1.update_source(b'source')
+
+        resp = self.send_request(self.problems[1].id, show_hidden=True, include_source=True)
+        self.assert200(resp)
+        data = resp.get_json()
+        self.assertEqual(len(data['data']), 3)
+
+        self.app.config['SUBMISSIONS_CORE_QUERY'] = False
+        db.session.expunge_all()
+        orm_resp = self.send_request(self.problems[1].id, show_hidden=True, include_source=True)
+        self.assertEqual(data, orm_resp.get_json())
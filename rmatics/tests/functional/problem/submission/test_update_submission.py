@@ -44,6 +44,13 @@ class TestAPIUpdateRun(TestCase):
         self.assertEqual(run.ejudge_status, 1488)
         self.monitor_invalidate_cache_mock.assert_called_once()
 
+    def test_update_run_updates_standings(self):
+        with mock.patch.dict(self.app.config, {'MONITOR_STANDINGS': True}), \
+                mock.patch('rmatics.tasks.notify.standings_aggregator') as standings_mock:
+            resp = self.send_request(self.run.id, {'ejudge_status': EjudgeStatuses.OK.value})
+        self.assert200(resp)
+        standings_mock.update.assert_called_once_with(self.run.problem_id, self.run.user_id)
+
 
 class TestRejudgeAPI(TestCase):
     def setUp(self):
@@ -122,6 +129,19 @@ class TestRejudgeAPI(TestCase):
         self.assert404(resp)
         submit_task_mock.delay.assert_not_called()
 
+    @mock.patch('rmatics.view.problem.run.submit_task')
+    def test_rejudge_updates_standings(self, submit_task_mock):
+        run = Run(user_id=self.users[0].id, problem_id=self.problems[1].id,
+                  ejudge_status=EjudgeStatuses.OK.value, lang_id=1, ejudge_contest_id=1)
+        db.session.add(run)
+        db.session.commit()
+
+        with mock.patch.dict(self.app.config, {'MONITOR_STANDINGS': True}), \
+                mock.patch('rmatics.tasks.notify.standings_aggregator') as standings_mock:
+            resp = self.send_request(run.id)
+        self.assert200(resp)
+        standings_mock.update.assert_called_once_with(run.problem_id, run.user_id)
+
 
 class TestUpdateFromEjudgeE2E(TestCase):
     """Сквозной тест нотификации нового ejudge: POST
@@ -178,6 +198,36 @@ class TestUpdateFromEjudgeE2E(TestCase):
         self.assertIsNotNone(
             mongo.db.protocol.find_one({'run_id': self.run.id}))
 
+    @mock.patch('rmatics.tasks.notify_batch.fetch_protocol')
+    def test_terminal_notification_is_batched(self, fetch_mock):
+        fetch_mock.return_value = {'run_id': self.run.id, 'tests': {}, 'compiler_output': ''}
+
+        with mock.patch.dict(self.app.config, {'NOTIFY_BATCH_WINDOW_MS': 100}):
+            resp = self.send_notification(status=EjudgeStatuses.OK.value, score=100)
+        self.assert200(resp)
+
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.OK.value)
+        self.assertEqual(run.ejudge_score, 100)
+        fetch_mock.assert_called_once()
+        self.assertIsNotNone(
+            mongo.db.protocol.find_one({'run_id': self.run.id}))
+
+    @mock.patch('rmatics.tasks.notify.fetch_protocol')
+    def test_terminal_notification_by_single_task(self, fetch_mock):
+        fetch_mock.return_value = {'run_id': self.run.id, 'tests': {}, 'compiler_output': ''}
+
+        with mock.patch.dict(self.app.config, {'NOTIFY_SINGLE_TASK': True}), \
+                mock.patch('rmatics.view.problem.run.make_terminal_upd_chain') as make_chain:
+            resp = self.send_notification(status=EjudgeStatuses.OK.value, score=100)
+        self.assert200(resp)
+
+        make_chain.assert_not_called()
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.OK.value)
+        self.assertEqual(run.ejudge_score, 100)
+        fetch_mock.assert_called_once()
+
     @mock.patch('rmatics.tasks.notify.fetch_protocol')
     def test_nonterminal_notification_does_not_fetch_protocol(self, fetch_mock):
         resp = self.send_notification(status=EjudgeStatuses.RUNNING.value)
@@ -261,3 +311,10 @@ class TestUpdateFromEjudgeV1(TestCase):
         resp = self.send_notification(run_id=777555,
                                       status=EjudgeStatuses.OK.value)
         self.assert400(resp)
+
+    def test_updates_standings(self):
+        with mock.patch.dict(self.app.config, {'MONITOR_STANDINGS': True}), \
+                mock.patch('rmatics.tasks.notify.standings_aggregator') as standings_mock:
+            resp = self.send_notification(status=EjudgeStatuses.OK.value, score=100)
+        self.assert200(resp)
+        standings_mock.update.assert_called_once_with(self.run.problem_id, self.run.user_id)
@@ -9,6 +9,7 @@ from rmatics import db, monitor_cacher
 from rmatics.model import Run, UserGroup, MonitorCourseModule, CourseModule
 from rmatics.model.monitor import MonitorStatement, Monitor
 from rmatics.testutils import TestCase
+from rmatics.view.monitors.monitor import get_runs_by_problems
 
 
 class TestContestBasedMonitorGetApi(TestCase):
@@ -111,6 +112,51 @@ class TestContestBasedMonitorGetApi(TestCase):
 
         self.assertEqual(sum(runs_lens), 3)
 
+    def test_batch_fetch(self):
+        with mock.patch.dict(self.app.config, {'MONITOR_BATCH_FETCH': True}):
+            with mock.patch('rmatics.view.monitors.monitor.get_runs_by_problems',
+                            wraps=get_runs_by_problems) as mock_get_runs_by_problems:
+                resp = self.send_request(contest_id=self.course_module_statement_id,
+                                         group_id=self.groups[0].id)
+        self.assert200(resp)
+
+        # Runs of all problems are fetched at once and cache is read by one MGET
+        mock_get_runs_by_problems.assert_called_once()
+        self.mock_cacher_get.assert_not_called()
+        self.mock_cacher_set.assert_not_called()
+
+        data = resp.json['data']
+        self.assertEqual(len(data), 3)
+        runs_lens = map(lambda d: len(d['runs']), data)
+        self.assertEqual(sum(runs_lens), 3)
+
+    def test_stream(self):
+        resp = self.send_request(contest_id=self.course_module_statement_id,
+                                 group_id=self.groups[0].id)
+        self.assert200(resp)
+
+        stream_resp = self.send_request(contest_id=self.course_module_statement_id,
+                                        group_id=self.groups[0].id, stream=True)
+        self.assert200(stream_resp)
+        self.assertTrue(stream_resp.is_streamed)
+        self.assertEqual(stream_resp.json, resp.json)
+
+    def test_columnar(self):
+        resp = self.send_request(contest_id=self.course_module_statement_id, format='columnar')
+        self.assert400(resp)
+
+        with mock.patch.dict(self.app.config, {'MONITOR_COLUMNAR_FORMAT': True}):
+            resp = self.send_request(contest_id=self.course_module_statement_id,
+                                     group_id=self.groups[0].id, format='columnar')
+        self.assert200(resp)
+
+        data = resp.json['data']
+        self.assertEqual(len(data), 3)
+        runs = data[0]['runs']
+        self.assertEqual(runs['id'], [run.id for run in self.runs])
+        self.assertEqual(len(runs['users']), 3)
+        self.assertEqual(data[1]['runs']['id'], [])
+
     def test_without_group(self):
         resp = self.send_request(contest_id=self.course_module_statement_id)
         self.assert200(resp)
@@ -177,3 +223,56 @@ class TestProblemBasedMonitorGetApi(TestCase):
             for i in problem_ids]
 
         self.assertEqual(response, expected_runs_data)
+
+
+    def test_stream(self):
+        self.create_users()
+        self.create_ejudge_problems()
+        runs = [Run(problem_id=self.ejudge_problems[0].id, user_id=user.id) for user in self.users]
+        db.session.add_all(runs)
+        db.session.commit()
+
+        problem_ids = [problem.id for problem in self.ejudge_problems[:2]]
+        with mock.patch('rmatics.view.monitors.monitor.get_runs') as mock_get_runs:
+            resp = self.send_request(problem_id=problem_ids, stream=True)
+        self.assert200(resp)
+
+        # Cache is bypassed
+        mock_get_runs.assert_not_called()
+
+        data = resp.json['data']
+        self.assertEqual([d['problem_id'] for d in data], problem_ids)
+        self.assertEqual([run['id'] for run in data[0]['runs']], [run.id for run in runs])
+        self.assertEqual(data[1]['runs'], [])
+
+
+class TestProblemStandingsMonitorApi(TestCase):
+    def send_request(self, **data):
+        url = url_for('monitor.problem_standings', **data)
+        resp = self.client.get(url)
+        return resp
+
+    def test_disabled(self):
+        resp = self.send_request(problem_id=[1])
+        self.assert404(resp)
+
+    def test_simple(self):
+        self.create_users()
+        self.create_ejudge_problems()
+        run = Run(problem_id=self.ejudge_problems[0].id, user_id=self.users[0].id,
+                  ejudge_status=0, ejudge_score=100)
+        db.session.add(run)
+        db.session.commit()
+
+        with mock.patch.dict(self.app.config, {'MONITOR_STANDINGS': True}):
+            resp = self.send_request(problem_id=[self.ejudge_problems[0].id, self.ejudge_problems[1].id])
+        self.assert200(resp)
+
+        data = resp.json['data']
+        self.assertEqual([d['problem_id'] for d in data],
+                         [self.ejudge_problems[0].id, self.ejudge_problems[1].id])
+        self.assertEqual(data[1]['users'], {})
+
+        summary = data[0]['users'][str(self.users[0].id)]
+        self.assertEqual(summary['attempts'], 1)
+        self.assertEqual(summary['score'], 100)
@@ -1,5 +1,7 @@
 import datetime
+import json
 
+import mock
 from dateutil.tz import UTC
 from mock import MagicMock
 
@@ -9,7 +11,9 @@ from rmatics.model import Run, MonitorCourseModule, CourseModule
 from rmatics.model.monitor import MonitorStatement, Monitor
 from rmatics.testutils import TestCase
 from rmatics.view import get_problems_by_statement_id
-from rmatics.view.monitors.monitor import get_runs, ContestBasedMonitorAPIView
+from rmatics.view.monitors.monitor import get_runs, ContestBasedMonitorAPIView, \
+    get_runs_by_problems, get_cached_runs_by_problems, get_monitor_run, patch_runs, \
+    iter_runs, stream_monitor_data, get_columnar_runs, to_columnar, from_columnar, patch_columnar_runs
 
 MONITOR_GROUP_ID = 5
 
@@ -181,3 +185,124 @@ class TestGenerateMonitor(TestCase):
                         time_before=int(time_before.timestamp()))
 
         self.assertEqual(len(runs), 3)
+
+    def test_get_runs_by_problems(self):
+        problem_ids = [problem.id for problem in self.problems]
+        user_ids = [user.id for user in self.users]
+
+        problem_runs = get_runs_by_problems(problem_ids, chunk_size=2, user_ids=user_ids)
+
+        self.assertEqual(list(problem_runs.keys()), problem_ids)
+        self.assertEqual(problem_runs[self.problems[1].id], [])
+        self.assertEqual(problem_runs[self.problems[2].id], [])
+
+        expected_runs = get_runs(problem_id=self.problems[0].id, user_ids=user_ids, cache=False)
+        self.assertEqual(problem_runs[self.problems[0].id], expected_runs)
+
+    def test_get_cached_runs_by_problems(self):
+        problem_ids = [problem.id for problem in self.problems]
+        user_ids = [user.id for user in self.users]
+
+        problem_runs = get_cached_runs_by_problems(problem_ids, user_ids=user_ids)
+
+        # Cache is read by one MGET instead of GET per problem
+        self.mock_cacher_get.assert_not_called()
+        self.mock_cacher_set.assert_not_called()
+
+        self.assertEqual(len(problem_runs[self.problems[0].id]), 3)
+        self.assertEqual(problem_runs[self.problems[1].id], [])
+
+        # Every problem has its own cache entry
+        with mock.patch('rmatics.view.monitors.monitor.get_runs_by_problems') as mock_get_runs_by_problems:
+            cached_problem_runs = get_cached_runs_by_problems(problem_ids, user_ids=user_ids)
+        mock_get_runs_by_problems.assert_not_called()
+        self.assertEqual(cached_problem_runs, problem_runs)
+
+    def test_columnar_runs(self):
+        problem_id = self.problems[0].id
+        user_ids = [user.id for user in self.users]
+        runs = get_runs(problem_id=problem_id, user_ids=user_ids, cache=False)
+
+        columnar = get_columnar_runs(problem_id=problem_id, user_ids=user_ids, cache=False)
+        self.assertEqual(columnar, to_columnar(runs))
+        self.assertEqual(from_columnar(columnar, problem_id), runs)
+
+        self.assertEqual(len(columnar['users']), len(self.users))
+        self.assertEqual(columnar['id'], [run.id for run in self.runs])
+        self.assertEqual([columnar['users'][i]['id'] for i in columnar['user']],
+                         [run.user_id for run in self.runs])
+
+        # Users are stored once
+        self.create_runs()
+        columnar = get_columnar_runs(problem_id=problem_id, user_ids=user_ids, cache=False)
+        self.assertEqual(len(columnar['users']), len(self.users))
+        self.assertEqual(len(columnar['id']), len(self.runs))
+
+        problem_runs = get_runs_by_problems([problem_id, self.problems[1].id], columnar=True, user_ids=user_ids)
+        self.assertEqual(problem_runs[problem_id], columnar)
+        self.assertEqual(problem_runs[self.problems[1].id], to_columnar([]))
+
+    def test_patch_columnar_runs(self):
+        kwargs = {'problem_id': self.problems[0].id, 'show_hidden': False}
+        columnar = get_columnar_runs(cache=False, **kwargs)
+
+        self.runs[1].ejudge_status = 0
+        db.session.commit()
+        patched = patch_columnar_runs(columnar, get_monitor_run(self.runs[1].id), **kwargs)
+        self.assertEqual(patched, get_columnar_runs(cache=False, **kwargs))
+
+    def test_iter_runs(self):
+        user_ids = [user.id for user in self.users]
+        runs = list(iter_runs(problem_id=self.problems[0].id, user_ids=user_ids))
+        self.assertEqual(runs, get_runs(problem_id=self.problems[0].id, user_ids=user_ids, cache=False))
+
+    def test_stream_monitor_data(self):
+        items = [
+            ({'problem_id': 1}, [{'id': i} for i in range(5)]),
+            ({'problem_id': 2}, []),
+            ({}, [{'id': 5}]),
+        ]
+        chunks = list(stream_monitor_data(iter(items), chunk_size=2))
+
+        expected = [dict(item_fields, runs=runs) for item_fields, runs in items]
+        self.assertEqual(json.loads(''.join(chunks)), expected)
+        self.assertEqual(stream_monitor_data([]).__next__(), '[')
+
+    def test_patch_runs_inserts_and_replaces(self):
+        user_ids = [user.id for user in self.users]
+        runs = get_runs(problem_id=self.problems[0].id, user_ids=user_ids, cache=False)
+        kwargs = {'problem_id': self.problems[0].id, 'user_ids': user_ids, 'show_hidden': False}
+
+        # Run is updated
+        self.runs[1].ejudge_status = 0
+        db.session.commit()
+        patched = patch_runs(runs, get_monitor_run(self.runs[1].id), **kwargs)
+        self.assertEqual(patched, get_runs(cache=False, **kwargs))
+
+        # New run is inserted
+        self.create_runs()
+        for run in self.runs[3:]:
+            patched = patch_runs(patched, get_monitor_run(run.id), **kwargs)
+        self.assertEqual(patched, get_runs(cache=False, **kwargs))
+
+    def test_patch_runs_respects_filters(self):
+        user_ids = [user.id for user in self.users]
+        runs = get_runs(problem_id=self.problems[0].id, user_ids=user_ids, cache=False)
+
+        self.runs[0].is_visible = False
+        db.session.commit()
+        hidden_run = get_monitor_run(self.runs[0].id)
+
+        patched = patch_runs(runs, hidden_run, problem_id=self.problems[0].id, show_hidden=False)
+        self.assertNotIn(self.runs[0].id, [r['id'] for r in patched])
+
+        patched = patch_runs(patched, hidden_run, problem_id=self.problems[0].id, show_hidden=True)
+        self.assertIn(self.runs[0].id, [r['id'] for r in patched])
+
+        # Can't tell show_hidden=None from default show_hidden=False
+        self.assertIsNone(patch_runs(runs, hidden_run, problem_id=self.problems[0].id))
+
+        time_after = int((datetime.datetime.utcnow() + datetime.timedelta(days=1)).timestamp())
+        patched = patch_runs(runs, get_monitor_run(self.runs[1].id),
+                             problem_id=self.problems[0].id, show_hidden=True, time_after=time_after)
+        self.assertNotIn(self.runs[1].id, [r['id'] for r in patched])
@@ -0,0 +1,127 @@
+import datetime
+from unittest import mock
+
+from flask import url_for
+
+from rmatics.cli import MONITOR_RUNS_BACKFILL_KEY, backfill_monitor_runs_command
+from rmatics.model.base import db, redis
+from rmatics.model.monitor_run import MonitorRun, backfill_monitor_runs
+from rmatics.model.run import Run
+from rmatics.testutils import TestCase
+from rmatics.view.monitors.monitor import get_runs, get_columnar_runs, get_runs_by_problems, \
+    get_monitor_run, iter_runs, patch_runs
+
+
+class TestMonitorRuns(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_users()
+        self.create_ejudge_problems()
+        self.create_problems()
+
+        now = datetime.datetime.utcnow().replace(microsecond=0)
+        self.runs = [
+            Run(problem_id=self.problems[i % 2].id, user_id=self.users[i % 3].id,
+                create_time=now - datetime.timedelta(minutes=i),
+                ejudge_status=i % 4, ejudge_score=i, is_visible=i != 3, statement_id=i % 2,
+                ejudge_contest_id=1)
+            for i in range(6)
+        ]
+        db.session.add_all(self.runs)
+        db.session.commit()
+
+    def get_projection(self) -> dict:
+        return {row[MonitorRun.c.id]: row for row in db.session.execute(MonitorRun.select())}
+
+    def test_backfill(self):
+        last_ids = list(backfill_monitor_runs(batch_size=4))
+        self.assertEqual(last_ids, [self.runs[3].id, self.runs[5].id])
+
+        projection = self.get_projection()
+        self.assertEqual(sorted(projection), [run.id for run in self.runs])
+        row = projection[self.runs[1].id]
+        self.assertEqual(row[MonitorRun.c.problem_id], self.problems[1].id)
+        self.assertEqual(row[MonitorRun.c.lastname], self.users[1].lastname)
+
+        # Copied runs are replaced, not duplicated
+        self.assertEqual(list(backfill_monitor_runs(after_id=self.runs[4].id)), [self.runs[5].id])
+        self.assertEqual(len(self.get_projection()), len(self.runs))
+
+    def test_backfill_command_continues(self):
+        # Command is called without click, it is already in app context
+        backfill = backfill_monitor_runs_command.callback.__wrapped__
+
+        backfill(batch_size=4, restart=False)
+        self.assertEqual(int(redis.hget(MONITOR_RUNS_BACKFILL_KEY, 'last_id')), self.runs[5].id)
+
+        db.session.execute(MonitorRun.delete())
+        db.session.commit()
+        backfill(batch_size=4, restart=False)
+        self.assertEqual(self.get_projection(), {})
+
+        backfill(batch_size=4, restart=True)
+        self.assertEqual(len(self.get_projection()), len(self.runs))
+
+    def test_reads_as_join(self):
+        list(backfill_monitor_runs())
+        problem_id = self.problems[0].id
+        shapes = [
+            {'problem_id': problem_id},
+            {'problem_id': problem_id, 'show_hidden': True},
+            {'problem_id': problem_id, 'user_ids': [self.users[0].id]},
+            {'problem_id': problem_id, 'context_id': 0},
+        ]
+
+        def read_all():
+            return [
+                *[get_runs(cache=False, **kwargs) for kwargs in shapes],
+                *[get_columnar_runs(cache=False, **kwargs) for kwargs in shapes],
+                *[list(iter_runs(**kwargs)) for kwargs in shapes],
+                get_runs_by_problems([problem.id for problem in self.problems]),
+            ]
+
+        expected = read_all()
+        with mock.patch.dict(self.app.config, {'MONITOR_RUNS_FROM_PROJECTION': True}):
+            self.assertEqual(read_all(), expected)
+
+            run = get_monitor_run(self.runs[2].id)
+            runs = patch_runs(expected[0], run, problem_id=problem_id, show_hidden=False)
+        self.assertEqual(runs, expected[0])
+
+    def test_writes(self):
+        config = {'MONITOR_RUNS_PROJECTION': True}
+        run = self.runs[0]
+        with mock.patch.dict(self.app.config, config):
+            resp = self.client.put(url_for('problem.run', run_id=run.id), json={'ejudge_status': 7})
+        self.assert200(resp)
+
+        projection = self.get_projection()
+        self.assertEqual(list(projection), [run.id])
+        self.assertEqual(projection[run.id][MonitorRun.c.ej_status], 7)
+
+        with mock.patch.dict(self.app.config, config), \
+                mock.patch('rmatics.view.problem.run.submit_task'), \
+                mock.patch.object(Run, 'move_protocol_to_rejudge_collection'):
+            resp = self.client.post(url_for('problem.rejudge_run', run_id=run.id))
+        self.assert200(resp)
+        self.assertEqual(self.get_projection()[run.id][MonitorRun.c.ej_status], 377)
+
+    def test_written_by_ejudge_v1_notification(self):
+        run_id = self.runs[0].id
+        self.runs[0].ejudge_run_id = 10
+        db.session.commit()
+
+        with mock.patch.dict(self.app.config, {'MONITOR_RUNS_PROJECTION': True}):
+            resp = self.client.post(url_for('problem.update_from_ejudge'),
+                                    json={'run_id': 10, 'contest_id': 1, 'status': 0, 'score': 100})
+        self.assert200(resp)
+
+        projection = self.get_projection()
+        self.assertEqual(list(projection), [run_id])
+        self.assertEqual(projection[run_id][MonitorRun.c.ej_status], 0)
+        self.assertEqual(projection[run_id][MonitorRun.c.ej_score], 100)
+
+    def test_not_written_by_default(self):
+        resp = self.client.put(url_for('problem.run', run_id=self.runs[0].id), json={'ejudge_status': 7})
+        self.assert200(resp)
+        self.assertEqual(self.get_projection(), {})
@@ -0,0 +1,119 @@
+import datetime
+
+from dateutil.tz import UTC
+
+from rmatics import db
+from rmatics.model import Run
+from rmatics.model.base import redis
+from rmatics.model.run import LightWeightRun
+from rmatics.testutils import TestCase
+from rmatics.utils.run import EjudgeStatuses
+from rmatics.utils.standings import StandingsAggregator, summarize_runs
+
+CREATE_TIME = datetime.datetime(2020, 1, 1, 10, 0, 0)
+
+
+def lightweight_run(status, score, create_time=CREATE_TIME):
+    return {
+        LightWeightRun.c.ej_status: status,
+        LightWeightRun.c.ej_score: score,
+        LightWeightRun.c.create_time: create_time,
+    }
+
+
+class TestSummarizeRuns(TestCase):
+    def test_attempts_until_first_ok(self):
+        ok_time = CREATE_TIME + datetime.timedelta(minutes=5)
+        runs = [
+            lightweight_run(EjudgeStatuses.WA.value, 30),
+            lightweight_run(EjudgeStatuses.OK.value, 100, ok_time),
+            lightweight_run(EjudgeStatuses.WA.value, 0),
+        ]
+
+        summary = summarize_runs(runs)
+
+        self.assertEqual(summary, {
+            'attempts': 2,
+            'score': 100,
+            'status': EjudgeStatuses.OK.value,
+            'first_ok_time': int(ok_time.replace(tzinfo=UTC).timestamp()),
+        })
+
+    def test_best_score(self):
+        runs = [
+            lightweight_run(EjudgeStatuses.PARTIAL.value, 60),
+            lightweight_run(EjudgeStatuses.WA.value, 30),
+            lightweight_run(EjudgeStatuses.IN_QUEUE.value, None),
+        ]
+
+        summary = summarize_runs(runs)
+
+        self.assertEqual(summary['attempts'], 3)
+        self.assertEqual(summary['score'], 60)
+        self.assertEqual(summary['status'], EjudgeStatuses.PARTIAL.value)
+        self.assertIsNone(summary['first_ok_time'])
+
+    def test_without_score(self):
+        summary = summarize_runs([lightweight_run(EjudgeStatuses.CE.value, None)])
+        self.assertEqual(summary['status'], EjudgeStatuses.CE.value)
+
+
+class TestStandingsAggregator(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_users()
+        self.create_ejudge_problems()
+
+        self.aggregator = StandingsAggregator(prefix='test_standings')
+        self.aggregator.init_app(redis, period=60)
+
+        self.problem_id = self.ejudge_problems[0].id
+        self.runs = [
+            Run(problem_id=self.problem_id, user_id=self.users[0].id,
+                ejudge_status=EjudgeStatuses.WA.value, ejudge_score=10),
+            Run(problem_id=self.problem_id, user_id=self.users[1].id,
+                ejudge_status=EjudgeStatuses.OK.value, ejudge_score=100),
+            Run(problem_id=self.problem_id, user_id=self.users[2].id,
+                ejudge_status=EjudgeStatuses.OK.value, ejudge_score=100, is_visible=False),
+        ]
+        db.session.add_all(self.runs)
+        db.session.commit()
+
+    def test_get_builds_standings(self):
+        standings = self.aggregator.get([self.problem_id])
+
+        users = standings[self.problem_id]
+        self.assertEqual(set(users.keys()), {self.users[0].id, self.users[1].id})
+        self.assertEqual(users[self.users[0].id]['score'], 10)
+        self.assertEqual(users[self.users[1].id]['attempts'], 1)
+
+        filtered = self.aggregator.get([self.problem_id], user_ids=[self.users[1].id])
+        self.assertEqual(list(filtered[self.problem_id].keys()), [self.users[1].id])
+
+    def test_update(self):
+        self.aggregator.get([self.problem_id])
+
+        self.runs[0].ejudge_status = EjudgeStatuses.OK.value
+        self.runs[0].ejudge_score = 100
+        self.runs[1].is_visible = False
+        db.session.commit()
+
+        self.aggregator.update(self.problem_id, self.users[0].id)
+        self.aggregator.update(self.problem_id, self.users[1].id)
+
+        for user_ids in (None, [user.id for user in self.users]):
+            users = self.aggregator.get([self.problem_id], user_ids=user_ids)[self.problem_id]
+            self.assertEqual(list(users.keys()), [self.users[0].id])
+            self.assertEqual(users[self.users[0].id]['score'], 100)
+
+    def test_update_before_build_is_kept(self):
+        self.aggregator.update(self.problem_id, self.users[0].id)
+
+        self.runs[0].ejudge_score = 50
+        db.session.commit()
+
+        # Summary updated by notification is not overwritten by building
+        self.aggregator._build([self.problem_id])
+        users = self.aggregator.get([self.problem_id])[self.problem_id]
+        self.assertEqual(users[self.users[0].id]['score'], 10)
+        self.assertIn(self.users[1].id, users)
@@ -0,0 +1,59 @@
+import os
+import tracemalloc
+import unittest
+
+from rmatics.ejudge.protocol.xml import parse_xml_testing_report, parse_xml_testing_report_stream
+
+RUN_ID = 42
+TESTS_COUNT = 150
+FIELD_SIZE = 64 * 1024
+FIELD_LIMIT = 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def _big_report() -> bytes:
+    data = 'x' * FIELD_SIZE
+    tests = ''.join(
+        f'<test num="{num}" status="OK" time="10" real-time="12" max-memory-used="1024">'
+        f'<input>{data}</input><output>{data}</output><correct>{data}</correct>'
+        f'<checker>ok</checker></test>'
+        for num in range(1, TESTS_COUNT + 1)
+    )
+    return (f'<?xml version="1.0" encoding="utf-8"?><testing-report run-id="7">'
+            f'<tests>{tests}</tests><compiler_output></compiler_output></testing-report>').encode()
+
+
+def _measure(parse):
+    tracemalloc.start()
+    result = parse()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak
+
+
+@unittest.skipUnless(os.getenv('RUN_BENCHMARKS'), 'builds large report, run with RUN_BENCHMARKS=1')
+class TestXmlParserBenchmark(unittest.TestCase):
+    """ Tree parser of text against stream parser of chunks, as fetch_protocol reads them """
+    def setUp(self):
+        self.report = _big_report()
+
+    def test_stream_parser(self):
+        chunks = [self.report[i:i + CHUNK_SIZE] for i in range(0, len(self.report), CHUNK_SIZE)]
+
+        expected, tree_peak = _measure(
+            lambda: parse_xml_testing_report(self.report.decode(), RUN_ID))
+        parsed, stream_peak = _measure(
+            lambda: parse_xml_testing_report_stream(iter(chunks), RUN_ID))
+        limited, limited_peak = _measure(
+            lambda: parse_xml_testing_report_stream(iter(chunks), RUN_ID, field_limit=FIELD_LIMIT))
+
+        self.assertEqual(parsed, expected)
+        self.assertEqual(len(limited['tests']), TESTS_COUNT)
+        for test in limited['tests'].values():
+            self.assertEqual(len(test['input']), FIELD_LIMIT)
+            self.assertEqual(len(test['output']), FIELD_LIMIT)
+
+        # Stream doesn't keep the text and the tree along with the result
+        self.assertLess(stream_peak, tree_peak)
+        # Capped fields are never collected as a whole
+        self.assertLess(limited_peak, tree_peak / 10)
@@ -0,0 +1,43 @@
+import io
+
+import mock
+import requests
+
+from rmatics.ejudge.protocol import fetch_protocol
+from rmatics.testutils import TestCase
+from rmatics.tests.unit.ejudge.protocol.test_parsers import RUN_ID, XML_REPORT
+
+
+def _response(content: bytes, content_type: str, status_code=200) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status_code
+    resp.headers['Content-Type'] = content_type
+    resp.raw = io.BytesIO(content)
+    return resp
+
+
+class TestFetchProtocol(TestCase):
+    def test_streams_xml_report(self):
+        session = mock.Mock()
+        session.get.return_value = _response(XML_REPORT.encode(), 'text/xml')
+
+        with mock.patch.dict(self.app.config, {'PROTOCOL_FIELD_LIMIT': 1}):
+            protocol = fetch_protocol('http://judge', 'token', 1, 7, RUN_ID, session=session, timeout=(1, 2))
+
+        self.assertEqual(session.get.call_args[1]['timeout'], (1, 2))
+        self.assertTrue(session.get.call_args[1]['stream'])
+        self.assertEqual(protocol['tests']['1']['output'], '3')
+        self.assertEqual(protocol['tests']['1']['input'], '1')
+
+    def test_error_status(self):
+        session = mock.Mock()
+        session.get.return_value = _response(b'', 'text/html', status_code=503)
+
+        with self.assertRaises(requests.HTTPError):
+            fetch_protocol('http://judge', 'token', 1, 7, RUN_ID, session=session)
+
+    def test_unknown_content_type(self):
+        session = mock.Mock()
+        session.get.return_value = _response(b'<html></html>', 'text/html')
+
+        self.assertIsNone(fetch_protocol('http://judge', 'token', 1, 7, RUN_ID, session=session))
@@ -5,7 +5,7 @@ import unittest
 import bson
 
 from rmatics.ejudge.protocol.bson import parse_bson_testing_report
-from rmatics.ejudge.protocol.xml import parse_xml_testing_report
+from rmatics.ejudge.protocol.xml import parse_xml_testing_report, parse_xml_testing_report_stream
 
 RUN_ID = 42
 
@@ -73,6 +73,45 @@ class TestXmlParser(unittest.TestCase):
         self.assertEqual(parsed['tests'], {})
 
 
+def _chunks(data: bytes, size: int):
+    return (data[i:i + size] for i in range(0, len(data), size))
+
+
+class TestXmlStreamParser(unittest.TestCase):
+    def test_same_as_tree_parser(self):
+        expected = parse_xml_testing_report(XML_REPORT, RUN_ID)
+        for chunk_size in (1, 7, len(XML_REPORT)):
+            parsed = parse_xml_testing_report_stream(_chunks(XML_REPORT.encode(), chunk_size), RUN_ID)
+            self.assertEqual(parsed, expected)
+
+    def test_empty_report(self):
+        parsed = parse_xml_testing_report_stream([b'<testing-report></testing-report>'], RUN_ID)
+        self.assertEqual(parsed, parse_xml_testing_report('<testing-report></testing-report>', RUN_ID))
+
+    def test_fields_are_cut(self):
+        parsed = parse_xml_testing_report_stream(_chunks(XML_REPORT.encode(), 3), RUN_ID, field_limit=2)
+
+        first = parsed['tests']['1']
+        self.assertEqual(first['input'], '1 ')
+        self.assertEqual(first['checker_output'], 'ok')
+        self.assertEqual(parsed['tests']['2']['checker_output'], 'wr')
+        self.assertEqual(parsed['tests']['2']['error_output'], 'de')
+        # Only test fields are cut
+        self.assertEqual(parsed['compiler_output'], 'warning: unused variable')
+
+    def test_text_of_nested_elements_is_skipped(self):
+        report = '<r><tests><test num="1"><input>a<b>b</b>c</input><output/></test></tests></r>'
+        expected = parse_xml_testing_report(report, RUN_ID)
+        self.assertEqual(expected['tests']['1']['input'], 'a')
+        self.assertEqual(parse_xml_testing_report_stream([report.encode()], RUN_ID), expected)
+
+    def test_non_ascii(self):
+        report = '<?xml version="1.0" encoding="utf-8"?><r><compiler_output>ошибка</compiler_output></r>'
+        # Multibyte characters are split between chunks
+        parsed = parse_xml_testing_report_stream(_chunks(report.encode(), 1), RUN_ID)
+        self.assertEqual(parsed['compiler_output'], 'ошибка')
+
+
 def _bson_report(**kwargs):
     doc = {
         'run_id': 7,
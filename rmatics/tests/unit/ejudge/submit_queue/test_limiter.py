@@ -0,0 +1,77 @@
+from mock import patch
+
+from rmatics.ejudge.submit_queue.limiter import JudgeLimiter, HEALTH_MIN_REQUESTS
+from rmatics.model.base import redis
+from rmatics.testutils import TestCase
+
+
+class TestJudgeLimiter(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = JudgeLimiter(prefix='test_judge')
+        self.limiter.init_app(redis, lease=60)
+
+    def test_limits_slots(self):
+        first = self.limiter.acquire(1, limit=2)
+        second = self.limiter.acquire(1, limit=2)
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertIsNone(self.limiter.acquire(1, limit=2))
+        # Other judges have their own slots
+        self.assertIsNotNone(self.limiter.acquire(2, limit=2))
+
+        self.limiter.release(1, first)
+        self.assertIsNotNone(self.limiter.acquire(1, limit=2))
+
+    def test_no_limit(self):
+        for _ in range(5):
+            self.assertIsNotNone(self.limiter.acquire(1, limit=0))
+        self.assertFalse(redis.exists('test_judge/1/slots'))
+
+    def test_expired_slots_are_freed(self):
+        with patch('rmatics.ejudge.submit_queue.limiter.time.time', return_value=1000):
+            self.limiter.acquire(1, limit=1)
+        with patch('rmatics.ejudge.submit_queue.limiter.time.time', return_value=1061):
+            self.assertIsNotNone(self.limiter.acquire(1, limit=1))
+
+    def test_without_store(self):
+        limiter = JudgeLimiter()
+        self.assertIsNotNone(limiter.acquire(1, limit=1))
+        self.assertIsNotNone(limiter.acquire(1, limit=1))
+        limiter.record(1, 1, ok=False)
+        self.assertEqual(limiter.get_delay(1, 5), 5)
+
+    def test_health(self):
+        self.limiter.record(1, 1, ok=True)
+        self.limiter.record(1, 3, ok=False)
+
+        requests, error_rate, latency = self.limiter.get_health(1)
+        self.assertEqual(requests, 2)
+        self.assertEqual(error_rate, 0.5)
+        self.assertEqual(latency, 2)
+        self.assertEqual(self.limiter.get_health(2), (0, 0, 0))
+
+    def test_delay_of_healthy_judge(self):
+        for _ in range(HEALTH_MIN_REQUESTS):
+            self.limiter.record(1, 1, ok=True)
+        self.assertEqual(self.limiter.get_delay(1, 5, latency_target=2), 5)
+
+    def test_delay_grows_with_error_rate(self):
+        # Error rate is 30%, three times over target
+        for i in range(HEALTH_MIN_REQUESTS):
+            self.limiter.record(1, 1, ok=i >= 3)
+        self.assertAlmostEqual(self.limiter.get_delay(1, 5, latency_target=2), 20)
+
+    def test_delay_grows_with_latency(self):
+        for _ in range(HEALTH_MIN_REQUESTS):
+            self.limiter.record(1, 4, ok=True)
+        self.assertAlmostEqual(self.limiter.get_delay(1, 5, latency_target=2), 10)
+
+    def test_delay_is_capped(self):
+        for _ in range(HEALTH_MIN_REQUESTS):
+            self.limiter.record(1, 1000, ok=False)
+        self.assertEqual(self.limiter.get_delay(1, 1, latency_target=2), 64)
+
+    def test_few_requests_do_not_change_delay(self):
+        self.limiter.record(1, 1000, ok=False)
+        self.assertEqual(self.limiter.get_delay(1, 5), 5)
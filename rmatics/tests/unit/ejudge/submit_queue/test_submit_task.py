@@ -1,14 +1,17 @@
 import datetime
 
 import mock
+import requests
 
-from rmatics.ejudge.submit_queue.task import submit_task
-from rmatics.model.base import db
+from rmatics.ejudge.submit_queue.limiter import JudgeLimiter
+from rmatics.ejudge.submit_queue.task import submit_task, THROTTLE_DELAY
+from rmatics.model.base import db, redis
 from rmatics.model.run import Run
 from rmatics.testutils import TestCase
 from rmatics.utils.run import EjudgeStatuses
 
 SUBMIT_PATH = 'rmatics.ejudge.submit_queue.task.submit'
+LIMITER_PATH = 'rmatics.ejudge.submit_queue.task.judge_limiter'
 
 EJUDGE_ERROR_RESPONSE = {
     'code': 105,
@@ -67,6 +70,8 @@ class TestSubmitTaskSuccess(SubmitTaskTestCase):
             sender_user_id=self.judges[1].sender_user_id,
             token='token-1',
             ext_user_id=self.run.id,
+            session=self.judges[1].get_session(),
+            timeout=self.judges[1].timeout,
         )
 
         run = db.session.query(Run).get(self.run.id)
@@ -100,6 +105,8 @@ class TestSubmitTaskSuccess(SubmitTaskTestCase):
             sender_user_id=7,
             token='token-2',
             ext_user_id=self.run.id,
+            session=self.judges[2].get_session(),
+            timeout=self.judges[2].timeout,
         )
 
         run = db.session.query(Run).get(self.run.id)
@@ -170,6 +177,19 @@ class TestSubmitTaskErrors(SubmitTaskTestCase):
         self.assertEqual(run.protocol['compiler_output'],
                          'Ошибка отправки посылки')
 
+    @mock.patch(SUBMIT_PATH)
+    def test_read_timeout_is_not_retried(self, submit_mock):
+        """Ejudge мог создать посылку, повторный PUT создал бы её дважды."""
+        submit_mock.side_effect = requests.ReadTimeout('ejudge is slow')
+
+        with mock.patch.object(submit_task, 'retry') as retry_mock:
+            submit_task.apply(args=(self.run.id,))
+        retry_mock.assert_not_called()
+
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status,
+                         EjudgeStatuses.RMATICS_SUBMIT_ERROR.value)
+
     @mock.patch(SUBMIT_PATH)
     def test_run_not_found_does_not_submit(self, submit_mock):
         submit_task.delay(999999)
@@ -198,3 +218,78 @@ class TestSubmitTaskErrors(SubmitTaskTestCase):
 
         submit_task.delay(self.run.id)
         submit_mock.assert_not_called()
+
+
+class TestSubmitTaskLimits(SubmitTaskTestCase):
+    def setUp(self):
+        super().setUp()
+        self.limiter = JudgeLimiter(prefix='test_judge')
+        self.limiter.init_app(redis, lease=60)
+        patcher = mock.patch(LIMITER_PATH, self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @mock.patch(SUBMIT_PATH)
+    def test_routes_to_queue_of_judge(self, submit_mock):
+        submit_mock.return_value = {'code': 0, 'run_id': 1, 'run_uuid': 'u'}
+        self.judges[1].queue = 'submit-judge-1'
+
+        with mock.patch.object(submit_task, 'apply_async') as apply_mock:
+            submit_task.apply(args=(self.run.id,))
+
+        submit_mock.assert_not_called()
+        apply_mock.assert_called_once_with((self.run.id,), {'requeued': True}, queue='submit-judge-1',
+                                           countdown=None, retries=0)
+
+    @mock.patch(SUBMIT_PATH)
+    def test_busy_judge_requeues(self, submit_mock):
+        self.judges[1].max_concurrency = 1
+        self.limiter.acquire(1, limit=1)
+
+        with mock.patch.object(submit_task, 'apply_async') as apply_mock:
+            submit_task.apply(args=(self.run.id,), kwargs={'requeued': True}, retries=2)
+
+        submit_mock.assert_not_called()
+        apply_mock.assert_called_once_with((self.run.id,), {'requeued': True}, queue=None,
+                                           countdown=THROTTLE_DELAY, retries=2)
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.IN_QUEUE.value)
+
+    @mock.patch(SUBMIT_PATH)
+    def test_releases_slot_and_records_health(self, submit_mock):
+        submit_mock.return_value = {'code': 0, 'run_id': 1, 'run_uuid': 'u'}
+        self.judges[1].max_concurrency = 1
+
+        submit_task.delay(self.run.id)
+        submit_task.delay(self._make_run().id)
+
+        self.assertEqual(submit_mock.call_count, 2)
+        self.assertEqual(redis.zcard('test_judge/1/slots'), 0)
+        self.assertEqual(self.limiter.get_health(1)[:2], (2, 0))
+
+    @mock.patch(SUBMIT_PATH)
+    def test_retry_is_delayed_by_health(self, submit_mock):
+        from celery.exceptions import Retry
+
+        submit_mock.side_effect = ConnectionError('ejudge is down')
+
+        with mock.patch.object(self.limiter, 'get_delay', return_value=40) as delay_mock, \
+                mock.patch.object(submit_task, 'retry', side_effect=Retry('retry')) as retry_mock:
+            with self.assertRaises(Retry):
+                submit_task.apply(args=(self.run.id,))
+
+        delay_mock.assert_called_once_with(1, submit_task.default_retry_delay, self.judges[1].latency_target)
+        self.assertEqual(retry_mock.call_args[1]['countdown'], 40)
+        self.assertEqual(self.limiter.get_health(1)[:2], (1, 1))
+        self.assertEqual(redis.zcard('test_judge/1/slots'), 0)
+
+    @mock.patch(SUBMIT_PATH)
+    def test_releases_slot_when_setup_fails(self, submit_mock):
+        self.judges[1].max_concurrency = 1
+
+        with mock.patch.object(Run, 'source', new_callable=mock.PropertyMock, side_effect=RuntimeError('mongo')):
+            with self.assertRaises(RuntimeError):
+                submit_task.apply(args=(self.run.id,), throw=True)
+
+        submit_mock.assert_not_called()
+        self.assertEqual(redis.zcard('test_judge/1/slots'), 0)
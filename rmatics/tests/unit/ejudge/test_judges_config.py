@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from rmatics.ejudge.judges_config import JudgeConfig, _load
+
+
+class TestJudgeConfigSession(unittest.TestCase):
+    def setUp(self):
+        self.judge = JudgeConfig(url='http://judge/new-master', pool_size=3, retries=4)
+
+    def test_session_is_reused(self):
+        self.assertIs(self.judge.get_session(), self.judge.get_session())
+
+    def test_session_is_recreated_after_fork(self):
+        session = self.judge.get_session()
+        with mock.patch('rmatics.ejudge.judges_config.os.getpid', return_value=-1):
+            self.assertIsNot(self.judge.get_session(), session)
+
+    def test_adapter_settings(self):
+        adapter = self.judge.get_session().get_adapter(self.judge.url)
+        self.assertEqual(adapter._pool_maxsize, 3)
+
+        retry = adapter.max_retries
+        self.assertEqual(retry.total, 4)
+        self.assertTrue(retry.is_retry('GET', 503))
+        # submit is not idempotent
+        self.assertFalse(retry.is_retry('PUT', 503))
+
+    def test_keep_alive(self):
+        self.assertEqual(self.judge.get_session().headers['Connection'], 'keep-alive')
+
+        judge = JudgeConfig(url='http://judge/new-master', keep_alive=False)
+        self.assertEqual(judge.get_session().headers['Connection'], 'close')
+
+    def test_timeout(self):
+        judge = JudgeConfig(url='http://judge/new-master', connect_timeout=1, read_timeout=2)
+        self.assertEqual(judge.timeout, (1, 2))
+
+
+class TestLoad(unittest.TestCase):
+    def _load(self, data: dict):
+        with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+            json.dump(data, f)
+        self.addCleanup(os.remove, f.name)
+        return _load(f.name)
+
+    def test_http_settings(self):
+        judges = self._load({
+            '1': {'url': 'http://a', 'token': 't', 'pool_size': 20, 'keep_alive': False,
+                  'connect_timeout': 1, 'read_timeout': 15, 'retries': 0},
+        })
+        judge = judges[1]
+        self.assertEqual(judge.pool_size, 20)
+        self.assertFalse(judge.keep_alive)
+        self.assertEqual(judge.timeout, (1, 15))
+        self.assertEqual(judge.retries, 0)
+
+    def test_http_settings_default(self):
+        judge = self._load({'1': {'url': 'http://a', 'token': 't'}})[1]
+        self.assertEqual(judge, JudgeConfig(url='http://a', token='t'))
+        self.assertEqual(judge.timeout, (5, 30))
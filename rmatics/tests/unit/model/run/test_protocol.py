@@ -0,0 +1,160 @@
+from unittest import mock
+
+from rmatics.cli import create_protocol_indexes_command
+from rmatics.model.base import mongo
+from rmatics.model.run import create_protocol_test_indexes, marshal_protocol, save_protocol_tests, \
+    unmarshal_protocol
+from rmatics.testutils import TestCase
+
+
+def make_test(**kwargs):
+    test = {
+        'input': '1 2',
+        'big_input': False,
+        'corr': '3',
+        'big_corr': False,
+        'output': '3',
+        'big_output': False,
+        'checker_output': '',
+        'error_output': '',
+        'extra': '',
+        'status': 'OK',
+        'string_status': 'OK',
+        'time': 10,
+        'real_time': 12,
+        'max_memory_used': 1024,
+    }
+    test.update(kwargs)
+    return test
+
+
+PROTOCOL = {
+    'run_id': 1,
+    'compiler_output': 'compiled',
+    'tests': {
+        '1': make_test(),
+        '2': make_test(output='4', status='WA', string_status='Неправильный ответ', time=0),
+    },
+}
+
+
+class TestMarshalProtocol(TestCase):
+    def test_round_trip(self):
+        protocol = unmarshal_protocol(marshal_protocol(PROTOCOL))
+        self.assertEqual(protocol, {**PROTOCOL, 'v': 2})
+
+    def test_compact(self):
+        p = marshal_protocol(PROTOCOL)
+        self.assertEqual(p['c'], 'compiled')
+        self.assertNotIn('tests', p)
+        self.assertNotIn('compiler_output', p)
+
+        (_, first), (_, second) = p['t']
+        self.assertEqual(first, {'i': '1 2', 'c': '3', 'o': '3', 's': 'OK', 't': 10, 'rt': 12, 'm': 1024})
+        self.assertNotIn('t', second)
+        self.assertNotIn('string_status', second)
+
+    def test_compress(self):
+        output = 'x' * 100
+        protocol = {**PROTOCOL, 'tests': {'1': make_test(output=output)}}
+
+        p = marshal_protocol(protocol, compress_threshold=50)
+        (_, test), = p['t']
+        self.assertIsInstance(test['o'], bytes)
+        self.assertLess(len(test['o']), len(output))
+        self.assertEqual(test['i'], '1 2')
+
+        self.assertEqual(unmarshal_protocol(p)['tests']['1']['output'], output)
+
+    def test_unknown_fields_are_kept(self):
+        protocol = {**PROTOCOL, 'audit': 'a', 'tests': {'1': make_test(score=5)}}
+        p = marshal_protocol(protocol)
+        self.assertEqual(p['audit'], 'a')
+
+        unmarshalled = unmarshal_protocol(p)
+        self.assertEqual(unmarshalled['tests']['1']['score'], 5)
+        self.assertEqual(unmarshalled['audit'], 'a')
+
+    def test_unknown_status(self):
+        protocol = {**PROTOCOL, 'tests': {'1': make_test(status='XX', string_status='XX')}}
+        self.assertEqual(unmarshal_protocol(marshal_protocol(protocol))['tests']['1']['string_status'], 'XX')
+
+    def test_long_form_is_read(self):
+        self.assertEqual(unmarshal_protocol(dict(PROTOCOL)), {**PROTOCOL, 'v': 2})
+
+
+class TestRunProtocol(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_ejudge_problems()
+        self.create_users()
+        self.create_runs()
+        self.run = self.runs[0]
+
+    def tearDown(self):
+        mongo.db.protocol.delete_many({})
+        mongo.db.protocol_test.delete_many({})
+        super().tearDown()
+
+    def test_default_format(self):
+        self.run.protocol = {**PROTOCOL, 'run_id': self.run.id}
+        stored = mongo.db.protocol.find_one({'run_id': self.run.id})
+        self.assertIn('tests', stored)
+        self.assertEqual(self.run.protocol, {**PROTOCOL, 'run_id': self.run.id, 'v': 2})
+
+    def test_compact_format(self):
+        config = {'PROTOCOL_COMPACT_FORMAT': True, 'PROTOCOL_COMPRESS_THRESHOLD': 1}
+        with mock.patch.dict(self.app.config, config):
+            self.run.protocol = {**PROTOCOL, 'run_id': self.run.id}
+
+        stored = mongo.db.protocol.find_one({'run_id': self.run.id})
+        self.assertNotIn('tests', stored)
+        self.assertIsInstance(stored['c'], bytes)
+        self.assertEqual(self.run.protocol, {**PROTOCOL, 'run_id': self.run.id, 'v': 2})
+
+    def test_split_tests(self):
+        protocol = {**PROTOCOL, 'run_id': self.run.id}
+        with mock.patch.dict(self.app.config, {'PROTOCOL_SPLIT_TESTS': True}):
+            self.run.protocol = protocol
+
+        stored = mongo.db.protocol.find_one({'run_id': self.run.id})
+        self.assertTrue(stored['split'])
+        self.assertNotIn('output', stored['tests']['1'])
+        self.assertEqual(mongo.db.protocol_test.count_documents({'run_id': self.run.id}), 2)
+
+        self.assertEqual(self.run.protocol, {**protocol, 'split': True, 'v': 2})
+
+        summary = self.run.get_protocol(full=False)
+        self.assertNotIn('output', summary['tests']['2'])
+        self.assertEqual(summary['tests']['2']['status'], 'WA')
+
+        self.assertEqual(self.run.get_protocol_test('2'), PROTOCOL['tests']['2'])
+        self.assertIsNone(self.run.get_protocol_test('3'))
+
+    def test_split_compact_tests_are_replaced(self):
+        config = {'PROTOCOL_SPLIT_TESTS': True, 'PROTOCOL_COMPACT_FORMAT': True, 'PROTOCOL_COMPRESS_THRESHOLD': 1}
+        with mock.patch.dict(self.app.config, config):
+            self.run.protocol = {**PROTOCOL, 'run_id': self.run.id}
+            self.run.protocol = {**PROTOCOL, 'run_id': self.run.id, 'tests': {'1': make_test()}}
+
+        self.assertEqual(mongo.db.protocol_test.count_documents({'run_id': self.run.id}), 1)
+        self.assertIsInstance(mongo.db.protocol_test.find_one({'run_id': self.run.id})['input'], bytes)
+        self.assertEqual(self.run.get_protocol_test('1'), make_test())
+        self.assertNotIn('input', self.run.get_protocol(full=False)['tests']['1'])
+
+    def test_test_indexes(self):
+        self.addCleanup(mongo.db.rejudge_test.drop)
+        self.addCleanup(mongo.db.protocol_test.drop)
+        create_protocol_test_indexes()
+        # Command is called without click, it is already in app context
+        create_protocol_indexes_command.callback.__wrapped__()
+
+        keys = [index['key'] for index in mongo.db.protocol_test.index_information().values()]
+        self.assertIn([('run_id', 1), ('test_num', 1)], keys)
+        keys = [index['key'] for index in mongo.db.rejudge_test.index_information().values()]
+        self.assertIn([('run_id', 1), ('rjdgId', 1), ('test_num', 1)], keys)
+
+        # The same tests saved twice at once are kept once
+        doc = {'run_id': self.run.id, 'test_num': '1', 'input': '1 2'}
+        save_protocol_tests({self.run.id: [doc, dict(doc)]})
+        self.assertEqual(mongo.db.protocol_test.count_documents({'run_id': self.run.id}), 1)
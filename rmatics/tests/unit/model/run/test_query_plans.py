@@ -0,0 +1,197 @@
+import datetime
+import random
+import re
+from unittest import mock
+
+from sqlalchemy import event
+
+from rmatics.model.base import db
+from rmatics.model.group import Group, UserGroup
+from rmatics.model.monitor_run import backfill_monitor_runs, copy_monitor_runs
+from rmatics.model.run import Run
+from rmatics.model.user import SimpleUser
+from rmatics.testutils import TestCase
+from rmatics.view.monitors.monitor import _build_runs_query
+from rmatics.view.problem.problem import ProblemSubmissionsFilterApi
+
+SEED_RUNS = 5000
+PROBLEMS = 500
+USERS = 500
+
+
+def explain(statement) -> list:
+    """ Returns plan of statement: EXPLAIN rows for mysql, EXPLAIN QUERY PLAN details for sqlite """
+    dialect = db.engine.dialect
+    compiled = statement.compile(dialect=dialect)
+    params = [compiled.params[name] for name in compiled.positiontup] \
+        if compiled.positional else compiled.params
+    return explain_sql(str(compiled), params)
+
+
+def explain_sql(sql: str, params) -> list:
+    dialect = db.engine.dialect
+    if dialect.name != 'sqlite' and sql.startswith('DELETE'):
+        # MariaDB 5.5 can't explain DELETE, single table one finds rows as SELECT does
+        sql = 'SELECT *' + sql[len('DELETE'):]
+
+    cursor = db.session.connection().connection.cursor()
+    try:
+        if dialect.name == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}', params)
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+
+def find_problems(plan: list, table: str = 'runs') -> list:
+    """ Full scans of table and filesorts in plan """
+    problems = []
+    for step in plan:
+        if isinstance(step, str):
+            if re.match(rf'SCAN (TABLE )?(\w+\.)?{table}\b', step):
+                problems.append(step)
+            if 'TEMP B-TREE' in step:
+                problems.append(step)
+        else:
+            if step.get('table') == table and step.get('type') == 'ALL':
+                problems.append(f'Full scan of {table}: {step}')
+            if 'filesort' in (step.get('Extra') or ''):
+                problems.append(f'Filesort: {step}')
+    return problems
+
+
+class TestRunsQueryPlans(TestCase):
+    """ Every query shape of monitors and submissions list should use indexes of runs
+        and return runs in index order. Runs with the distribution of production
+        (many problems, many users, mostly visible) are seeded, so the planner
+        chooses plans as on real data
+    """
+    def setUp(self):
+        super().setUp()
+        self.create_users()
+        self.seed()
+
+    def seed(self):
+        random.seed(0)
+        users = SimpleUser.__table__
+        db.session.execute(users.insert(), [
+            {'id': user_id, 'firstname': 'f', 'lastname': 'l', 'username': f'u{user_id}', 'email': ''}
+            for user_id in range(100, 100 + USERS)
+        ])
+
+        now = datetime.datetime.utcnow()
+        db.session.execute(Run.__table__.insert(), [
+            {
+                'user_id': random.randrange(100, 100 + USERS),
+                'problem_id': random.randrange(1, PROBLEMS + 1),
+                'statement_id': random.randrange(1, 20),
+                'context_source': random.choice((0, 10)),
+                'is_visible': random.random() > 0.05,
+                'ej_status': random.randrange(0, 10),
+                'ej_lang_id': random.randrange(1, 5),
+                'create_time': now - datetime.timedelta(minutes=i),
+            }
+            for i in range(SEED_RUNS)
+        ])
+
+        group = Group()
+        db.session.add(group)
+        db.session.flush()
+        self.group_id = group.id
+        db.session.execute(UserGroup.__table__.insert(), [
+            {'group_id': group.id, 'user_id': user_id} for user_id in range(100, 110)
+        ])
+        db.session.commit()
+
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute('ANALYZE pynformatics')
+            db.session.execute('ANALYZE moodle')
+        else:
+            db.session.execute('ANALYZE TABLE pynformatics.runs')
+
+    def assert_plan(self, name: str, statement, allow_filesort: bool = False, table: str = 'runs'):
+        if hasattr(statement, 'statement'):
+            statement = statement.statement
+        plan = explain(statement)
+        problems = find_problems(plan, table)
+        if allow_filesort:
+            problems = [problem for problem in problems if 'TEMP B-TREE' not in problem and 'Filesort' not in problem]
+        self.assertEqual(problems, [], f'{name}: {plan}')
+
+    def test_monitor(self):
+        now = int(datetime.datetime.utcnow().timestamp())
+        shapes = {
+            'problem': {},
+            'hidden': {'show_hidden': True},
+            'context': {'context_id': 3, 'context_source': 10},
+            'time': {'time_after': now - 3600, 'time_before': now},
+        }
+        for name, kwargs in shapes.items():
+            self.assert_plan(name, _build_runs_query([1], **kwargs))
+
+        # Runs of user ids or problem ids list are sorted, they are few
+        self.assert_plan('users', _build_runs_query([1], user_ids=list(range(100, 110))), allow_filesort=True)
+        self.assert_plan('batch', _build_runs_query(list(range(1, 11))), allow_filesort=True)
+
+    def test_monitor_projection(self):
+        list(backfill_monitor_runs(batch_size=SEED_RUNS))
+        with mock.patch.dict(self.app.config, {'MONITOR_RUNS_FROM_PROJECTION': True}):
+            for name, kwargs in {'problem': {}, 'hidden': {'show_hidden': True}}.items():
+                self.assert_plan(name, _build_runs_query([1], **kwargs), table='monitor_runs')
+            self.assert_plan('batch', _build_runs_query(list(range(1, 11))), allow_filesort=True, table='monitor_runs')
+
+    def test_monitor_projection_writes(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, *args):
+            statements.append((statement, parameters))
+
+        engine = db.session.get_bind()
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            copy_monitor_runs(Run.id.in_([1, 2, 3]))
+            list(backfill_monitor_runs(after_id=SEED_RUNS - 10))
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
+        writes = [(sql, params) for sql, params in statements if sql.startswith(('DELETE', 'INSERT'))]
+        self.assertEqual(len(writes), 4)
+        for sql, params in writes:
+            if sql.startswith('DELETE'):
+                # Subquery in DELETE is run for every row of monitor_runs by mysql
+                self.assertNotIn('SELECT', sql)
+                plan = explain_sql(sql, params)
+                self.assertEqual(find_problems(plan, 'monitor_runs'), [], f'{sql}: {plan}')
+            else:
+                sql = sql[sql.index('SELECT'):]
+                plan = explain_sql(sql, params)
+                self.assertEqual(find_problems(plan), [], f'{sql}: {plan}')
+
+    def test_submissions_list(self):
+        now = int(datetime.datetime.utcnow().timestamp())
+        shapes = {
+            'problem': ({}, False),
+            'hidden': ({'show_hidden': True}, False),
+            'status': ({'status_id': 1}, False),
+            'lang': ({'lang_id': 1}, False),
+            'statement': ({'statement_id': 3}, False),
+            'context': ({'context_id': 3, 'context_source': 10}, False),
+            'time': ({'from_timestamp': (now - 3600) * 1000, 'to_timestamp': now * 1000}, False),
+            # Runs of user or group are sorted, they are few
+            'user': ({'user_id': 100}, True),
+            'group': ({'group_id': self.group_id}, True),
+        }
+        for name, (args, allow_filesort) in shapes.items():
+            query = self.list_query(1, args)
+            # Page and cursor
+            self.assert_plan(name, query.limit(10).offset(10), allow_filesort)
+            self.assert_plan(f'{name} before_id', query.filter(Run.id < SEED_RUNS // 2).limit(11), allow_filesort)
+
+    def list_query(self, problem_id, args):
+        args = {'status_id': -1, 'show_hidden': False, **args}
+        query_string = {'statement_id': args.pop('statement_id')} if 'statement_id' in args else {}
+        with self.app.test_request_context(query_string=query_string):
+            return ProblemSubmissionsFilterApi._build_query_by_args(args, problem_id, [])
@@ -1,7 +1,10 @@
 import mock
+import requests
+from celery.exceptions import Retry
 from werkzeug.exceptions import BadRequest
 
 from rmatics.model.base import db
+from rmatics.model.monitor_run import MonitorRun
 from rmatics.model.run import Run
 from rmatics.tasks.notify import (
     NON_TERMINAL_STATUSES,
@@ -11,6 +14,7 @@ from rmatics.tasks.notify import (
     load_protocol,
     make_nonterminal_upd_chain,
     make_terminal_upd_chain,
+    process_notification,
     upd_run,
     NoRunError,
 )
@@ -155,6 +159,25 @@ class TestUpdRun(NotifyTestCase):
         self.assertEqual(run.ejudge_run_id, 555)
 
 
+    def test_updates_standings(self):
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+        with mock.patch.dict(self.app.config, {'MONITOR_STANDINGS': True}), \
+                mock.patch('rmatics.tasks.notify.standings_aggregator') as standings_mock:
+            upd_run.delay(data)
+        standings_mock.update.assert_called_once_with(self.run.problem_id, self.run.user_id)
+
+    def test_updates_monitor_runs(self):
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value, score=100)
+        with mock.patch.dict(self.app.config, {'MONITOR_RUNS_PROJECTION': True}):
+            upd_run.delay(data)
+
+        row = db.session.execute(MonitorRun.select()).first()
+        self.assertEqual(row[MonitorRun.c.id], self.run.id)
+        self.assertEqual(row[MonitorRun.c.ej_status], EjudgeStatuses.OK.value)
+        self.assertEqual(row[MonitorRun.c.ej_score], 100)
+        self.assertEqual(row[MonitorRun.c.firstname], self.users[0].firstname)
+
+
 class TestCheckRun(NotifyTestCase):
     def test_passes_data_through(self):
         data = notify_data(self.run, status=0)
@@ -188,6 +211,8 @@ class TestLoadProtocol(NotifyTestCase):
             self.run.ejudge_contest_id,
             self.run.ejudge_run_id,
             self.run.id,
+            session=self.judges[1].get_session(),
+            timeout=self.judges[1].timeout,
         )
 
         saved = db.session.query(Run).get(self.run.id).protocol
@@ -222,6 +247,15 @@ class TestInvalidateCache(NotifyTestCase):
             invalidate_cache.delay(data)
         invalidate_mock.assert_called_once()
 
+    def test_updates_monitor_cache_in_place(self):
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+        with mock.patch.dict(self.app.config, {'MONITOR_CACHE_UPDATE_IN_PLACE': True}), \
+                mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run') as invalidate_mock, \
+                mock.patch('rmatics.tasks.notify.update_monitor_cache_by_run') as update_mock:
+            invalidate_cache.delay(data)
+        update_mock.assert_called_once()
+        invalidate_mock.assert_not_called()
+
 
 class TestChains(TestCase):
     def test_terminal_chain_contains_load_protocol(self):
@@ -243,3 +277,121 @@ class TestChains(TestCase):
 
     def test_non_terminal_statuses(self):
         self.assertEqual(NON_TERMINAL_STATUSES, {96, 98, 377})
+
+
+class TestProcessNotification(NotifyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.protocol = {'run_id': self.run.id, 'tests': {}, 'compiler_output': ''}
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_terminal_notification(self, fetch_mock, invalidate_mock):
+        fetch_mock.return_value = self.protocol
+
+        process_notification.delay(notify_data(self.run, status=EjudgeStatuses.OK.value, score=100))
+
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.OK.value)
+        self.assertEqual(run.ejudge_score, 100)
+        self.assertEqual(run.protocol['run_id'], self.run.id)
+        fetch_mock.assert_called_once()
+        invalidate_mock.assert_called_once()
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_nonterminal_notification_skips_protocol(self, fetch_mock, invalidate_mock):
+        process_notification.delay(notify_data(self.run, status=EjudgeStatuses.RUNNING.value))
+
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.RUNNING.value)
+        fetch_mock.assert_not_called()
+        invalidate_mock.assert_called_once()
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_duplicate_is_skipped(self, fetch_mock, invalidate_mock):
+        fetch_mock.return_value = self.protocol
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+
+        process_notification.delay(dict(data))
+        process_notification.delay(dict(data))
+        fetch_mock.assert_called_once()
+
+        # Other status of the run is not a duplicate
+        process_notification.delay(notify_data(self.run, status=EjudgeStatuses.WA.value))
+        self.assertEqual(fetch_mock.call_count, 2)
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_nonterminal_resets_processed(self, fetch_mock, invalidate_mock):
+        fetch_mock.return_value = self.protocol
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+
+        process_notification.delay(dict(data))
+        # Run is rejudged
+        db.session.query(Run).filter_by(id=self.run.id) \
+            .update({'ejudge_status': EjudgeStatuses.COMPILING.value})
+        db.session.commit()
+        process_notification.delay(notify_data(self.run, status=EjudgeStatuses.RUNNING.value))
+        process_notification.delay(dict(data))
+
+        self.assertEqual(fetch_mock.call_count, 2)
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_late_nonterminal_keeps_processed(self, fetch_mock, invalidate_mock):
+        fetch_mock.return_value = self.protocol
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+
+        process_notification.delay(dict(data))
+        process_notification.delay(notify_data(self.run, status=EjudgeStatuses.RUNNING.value))
+        process_notification.delay(dict(data))
+
+        fetch_mock.assert_called_once()
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.OK.value)
+
+    @mock.patch('rmatics.tasks.notify.invalidate_monitor_cache_by_run')
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_retries_failed_step_only(self, fetch_mock, invalidate_mock):
+        fetch_mock.return_value = self.protocol
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+
+        with mock.patch('rmatics.tasks.notify._update_run', side_effect=RuntimeError('db is down')), \
+                mock.patch.object(process_notification, 'retry', side_effect=Retry('retry')) as retry_mock:
+            with self.assertRaises(Retry):
+                process_notification.apply(args=(data,))
+
+        state = {'done': ['load_protocol'], 'retries': {'upd_run': 1}}
+        retry_mock.assert_called_once_with(args=(data,), kwargs={'state': state},
+                                           exc=mock.ANY, countdown=2)
+        invalidate_mock.assert_not_called()
+
+        process_notification.apply(args=(data,), kwargs={'state': state})
+
+        fetch_mock.assert_called_once()
+        invalidate_mock.assert_called_once()
+        self.assertEqual(db.session.query(Run).get(self.run.id).ejudge_status, EjudgeStatuses.OK.value)
+
+    def test_retries_missing_run(self):
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value, rmatics_run_id=None, run_uuid='uuid-99')
+
+        with mock.patch.object(process_notification, 'retry', side_effect=Retry('retry')) as retry_mock:
+            with self.assertRaises(Retry):
+                process_notification.apply(args=(data,), kwargs={'state': {'done': [], 'retries': {'check_run': 2}}})
+
+        self.assertEqual(retry_mock.call_args[1]['countdown'], 15)
+
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_client_error_is_not_retried(self, fetch_mock):
+        response = requests.Response()
+        response.status_code = 404
+        fetch_mock.side_effect = requests.HTTPError(response=response)
+
+        with mock.patch.object(process_notification, 'retry') as retry_mock:
+            with self.assertRaises(requests.HTTPError):
+                process_notification.apply(args=(notify_data(self.run, status=EjudgeStatuses.OK.value),))
+
+        retry_mock.assert_not_called()
+        self.assertEqual(db.session.query(Run).get(self.run.id).ejudge_status, EjudgeStatuses.IN_QUEUE.value)
@@ -0,0 +1,192 @@
+import mock
+import requests
+
+from rmatics.model.base import db, mongo, redis
+from rmatics.model.run import Run
+from rmatics.tasks.notify_batch import (
+    BUFFER_KEY,
+    PROCESSING_KEY,
+    enqueue_terminal_notification,
+    flush_terminal_notifications,
+    process_terminal_notifications,
+)
+from rmatics.tests.unit.tasks.test_notify import NotifyTestCase, notify_data
+from rmatics.utils.run import EjudgeStatuses
+
+FETCH_PROTOCOL_PATH = 'rmatics.tasks.notify_batch.fetch_protocol'
+CHAIN_PATH = 'rmatics.tasks.notify_batch.make_terminal_upd_chain'
+INVALIDATE_PATH = 'rmatics.tasks.notify_batch.invalidate_monitor_cache_by_runs'
+
+
+def fake_fetch_protocol(url, token, ej_contest_id, ej_run_id, run_id, **kwargs):
+    return {'run_id': run_id, 'tests': {}, 'compiler_output': f'run {ej_run_id}'}
+
+
+class NotifyBatchTestCase(NotifyTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other_run = Run(
+            user_id=self.users[1].id,
+            problem_id=self.ejudge_problems[0].id,
+            ejudge_contest_id=self.ejudge_problems[0].ejudge_contest_id,
+            lang_id=1,
+            ejudge_status=EjudgeStatuses.IN_QUEUE.value,
+            ejudge_run_id=11,
+            ejudge_run_uuid='uuid-11',
+            judge_id=1,
+            ejudge_score=7,
+        )
+        db.session.add(self.other_run)
+        db.session.commit()
+
+
+class TestProcessTerminalNotifications(NotifyBatchTestCase):
+    @mock.patch(INVALIDATE_PATH)
+    @mock.patch(FETCH_PROTOCOL_PATH, side_effect=fake_fetch_protocol)
+    def test_updates_runs_and_protocols(self, fetch_mock, invalidate_mock):
+        process_terminal_notifications([
+            notify_data(self.run, status=EjudgeStatuses.OK.value, score=100, test_num=5),
+            notify_data(self.other_run, status=EjudgeStatuses.WA.value, rmatics_run_id=None),
+        ])
+
+        run = db.session.query(Run).get(self.run.id)
+        self.assertEqual(run.ejudge_status, EjudgeStatuses.OK.value)
+        self.assertEqual(run.ejudge_score, 100)
+        self.assertEqual(run.ejudge_test_num, 5)
+
+        other_run = db.session.query(Run).get(self.other_run.id)
+        self.assertEqual(other_run.ejudge_status, EjudgeStatuses.WA.value)
+        # Score is not in notification
+        self.assertEqual(other_run.ejudge_score, 7)
+
+        self.assertEqual(fetch_mock.call_count, 2)
+        self.assertEqual(mongo.db.protocol.find_one({'run_id': self.run.id})['compiler_output'], 'run 10')
+        self.assertEqual(mongo.db.protocol.find_one({'run_id': self.other_run.id})['compiler_output'], 'run 11')
+
+        invalidate_mock.assert_called_once()
+        self.assertCountEqual(invalidate_mock.call_args[0][0], [run, other_run])
+
+    @mock.patch(INVALIDATE_PATH)
+    @mock.patch(FETCH_PROTOCOL_PATH, side_effect=fake_fetch_protocol)
+    def test_unknown_run_goes_to_chain(self, fetch_mock, invalidate_mock):
+        unknown = notify_data(self.run, status=EjudgeStatuses.OK.value, rmatics_run_id=None, run_uuid='uuid-99')
+
+        with mock.patch(CHAIN_PATH) as chain_mock:
+            process_terminal_notifications([
+                unknown,
+                notify_data(self.run, status=EjudgeStatuses.OK.value),
+            ])
+
+        chain_mock.return_value.delay.assert_called_once_with(unknown)
+        fetch_mock.assert_called_once()
+        self.assertEqual(db.session.query(Run).get(self.run.id).ejudge_status, EjudgeStatuses.OK.value)
+
+    @mock.patch(INVALIDATE_PATH)
+    @mock.patch(FETCH_PROTOCOL_PATH)
+    def test_failed_fetch_goes_to_chain(self, fetch_mock, invalidate_mock):
+        def fetch(url, token, ej_contest_id, ej_run_id, run_id, **kwargs):
+            if run_id == self.run.id:
+                raise requests.ConnectionError('ejudge is down')
+            return fake_fetch_protocol(url, token, ej_contest_id, ej_run_id, run_id)
+        fetch_mock.side_effect = fetch
+        failed = notify_data(self.run, status=EjudgeStatuses.OK.value)
+
+        with mock.patch(CHAIN_PATH) as chain_mock:
+            process_terminal_notifications([
+                failed,
+                notify_data(self.other_run, status=EjudgeStatuses.OK.value),
+            ])
+
+        chain_mock.return_value.delay.assert_called_once_with(failed)
+        self.assertEqual(db.session.query(Run).get(self.run.id).ejudge_status, EjudgeStatuses.IN_QUEUE.value)
+        self.assertEqual(db.session.query(Run).get(self.other_run.id).ejudge_status, EjudgeStatuses.OK.value)
+        self.assertEqual(invalidate_mock.call_args[0][0], [self.other_run])
+
+    @mock.patch(INVALIDATE_PATH)
+    @mock.patch(FETCH_PROTOCOL_PATH, side_effect=fake_fetch_protocol)
+    def test_last_notification_of_run_wins(self, fetch_mock, invalidate_mock):
+        process_terminal_notifications([
+            notify_data(self.run, status=EjudgeStatuses.WA.value),
+            notify_data(self.run, status=EjudgeStatuses.OK.value),
+        ])
+
+        fetch_mock.assert_called_once()
+        self.assertEqual(db.session.query(Run).get(self.run.id).ejudge_status, EjudgeStatuses.OK.value)
+
+
+class TestTerminalNotificationsBuffer(NotifyBatchTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.dict(self.app.config, {'NOTIFY_BATCH_WINDOW_MS': 100})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_first_notification_schedules_flush(self):
+        with mock.patch.object(flush_terminal_notifications, 'apply_async') as flush_mock:
+            enqueue_terminal_notification(notify_data(self.run, status=EjudgeStatuses.OK.value))
+            enqueue_terminal_notification(notify_data(self.other_run, status=EjudgeStatuses.OK.value))
+
+        flush_mock.assert_called_once_with(countdown=0.1)
+        self.assertEqual(redis.llen(BUFFER_KEY), 2)
+
+    @mock.patch('rmatics.tasks.notify_batch.process_terminal_notifications')
+    def test_flush_drains_buffer_by_batches(self, process_mock):
+        with mock.patch.object(flush_terminal_notifications, 'apply_async'):
+            for ejudge_run_id in range(5):
+                enqueue_terminal_notification({'run_id': ejudge_run_id})
+
+        with mock.patch.dict(self.app.config, {'NOTIFY_BATCH_SIZE': 2}):
+            flush_terminal_notifications.delay()
+
+        batches = [call[0][0] for call in process_mock.call_args_list]
+        self.assertEqual(batches, [
+            [{'run_id': 0}, {'run_id': 1}],
+            [{'run_id': 2}, {'run_id': 3}],
+            [{'run_id': 4}],
+        ])
+        self.assertEqual(redis.llen(BUFFER_KEY), 0)
+        self.assertEqual(redis.zcard(PROCESSING_KEY), 0)
+
+        # Next notification schedules the next flush
+        with mock.patch.object(flush_terminal_notifications, 'apply_async') as flush_mock:
+            enqueue_terminal_notification({'run_id': 5})
+        flush_mock.assert_called_once()
+
+    @mock.patch('rmatics.tasks.notify_batch.process_terminal_notifications', side_effect=RuntimeError)
+    def test_failed_batch_goes_to_chains(self, process_mock):
+        data = notify_data(self.run, status=EjudgeStatuses.OK.value)
+        with mock.patch.object(flush_terminal_notifications, 'apply_async'):
+            enqueue_terminal_notification(data)
+
+        with mock.patch(CHAIN_PATH) as chain_mock:
+            flush_terminal_notifications.delay()
+
+        chain_mock.return_value.delay.assert_called_once_with(data)
+
+    @mock.patch('rmatics.tasks.notify_batch.process_terminal_notifications')
+    def test_interrupted_batch_is_kept(self, process_mock):
+        with mock.patch.object(flush_terminal_notifications, 'apply_async'):
+            for ejudge_run_id in range(3):
+                enqueue_terminal_notification({'run_id': ejudge_run_id})
+
+        # Worker is killed while batch is processed
+        process_mock.side_effect = KeyboardInterrupt
+        with mock.patch.dict(self.app.config, {'NOTIFY_BATCH_SIZE': 2}), \
+                self.assertRaises(KeyboardInterrupt):
+            flush_terminal_notifications()
+
+        [batch_key] = redis.zrange(PROCESSING_KEY, 0, -1)
+        self.assertEqual(redis.llen(batch_key), 2)
+        self.assertEqual(redis.llen(BUFFER_KEY), 1)
+
+        # Batch is not taken by other flushes until its lease expires
+        process_mock.reset_mock(side_effect=True)
+        flush_terminal_notifications()
+        process_mock.assert_called_once_with([{'run_id': 2}])
+
+        process_mock.reset_mock()
+        redis.zadd(PROCESSING_KEY, {batch_key: 0})
+        flush_terminal_notifications()
+        process_mock.assert_called_once_with([{'run_id': 0}, {'run_id': 1}])
+        self.assertEqual(redis.zcard(PROCESSING_KEY), 0)
+        self.assertFalse(redis.exists(batch_key))
@@ -0,0 +1,71 @@
+from mock import patch
+
+from rmatics.model.base import db, redis
+from rmatics.model.run import Run
+from rmatics.testutils import TestCase
+from rmatics.utils.duplicates import DuplicateSubmissionDetector
+
+SOURCE_HASH = 'a' * 32
+
+
+class TestDuplicateSubmissionDetector(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_users()
+        self.create_ejudge_problems()
+
+        self.user_id = self.users[0].id
+        self.problem_id = self.ejudge_problems[0].id
+
+        self.detector = DuplicateSubmissionDetector(prefix='test_last_source')
+        self.detector.init_app(redis, use_cache=True)
+
+    def add_run(self, source_hash, lang_id, user_id=None, problem_id=None):
+        run = Run(user_id=user_id or self.user_id, problem_id=problem_id or self.problem_id,
+                  source_hash=source_hash, lang_id=lang_id)
+        db.session.add(run)
+        db.session.commit()
+
+    def test_compares_with_last_run(self):
+        self.assertFalse(self.detector.is_duplicate(self.user_id, self.problem_id, SOURCE_HASH, 1))
+
+        self.add_run(SOURCE_HASH, 1)
+        self.add_run('b' * 32, 2)
+        self.detector.remember(self.user_id, self.problem_id, 'b' * 32, 2)
+
+        self.assertFalse(self.detector.is_duplicate(self.user_id, self.problem_id, SOURCE_HASH, 1))
+        self.assertTrue(self.detector.is_duplicate(self.user_id, self.problem_id, 'b' * 32, 2))
+        self.assertFalse(self.detector.is_duplicate(self.user_id, self.problem_id, 'b' * 32, 1))
+
+    def test_cached_check_does_not_touch_db(self):
+        self.add_run(SOURCE_HASH, 1)
+        self.assertTrue(self.detector.is_duplicate(self.user_id, self.problem_id, SOURCE_HASH, 1))
+
+        with patch.object(DuplicateSubmissionDetector, '_load') as mock_load:
+            mock_load.return_value = {(self.users[1].id, self.problem_id): None}
+            self.assertTrue(self.detector.is_duplicate(self.user_id, self.problem_id, SOURCE_HASH, 1))
+            self.assertFalse(self.detector.is_duplicate(self.users[1].id, self.problem_id, SOURCE_HASH, 1))
+        # Only user without cached source is loaded
+        mock_load.assert_called_once_with([(self.users[1].id, self.problem_id)])
+
+    def test_get_last_sources(self):
+        self.add_run(SOURCE_HASH, 1)
+        self.add_run('b' * 32, 2, problem_id=self.ejudge_problems[1].id)
+        self.add_run('c' * 32, 3, problem_id=self.ejudge_problems[1].id)
+
+        user_problems = [
+            (self.user_id, self.problem_id),
+            (self.user_id, self.ejudge_problems[1].id),
+            (self.users[1].id, self.problem_id),
+        ]
+        expected = dict(zip(user_problems, [(SOURCE_HASH, 1), ('c' * 32, 3), None]))
+
+        self.assertEqual(self.detector.get_last_sources(user_problems), expected)
+        # Now from cache
+        self.assertEqual(self.detector.get_last_sources(user_problems), expected)
+
+    def test_without_cache(self):
+        self.detector.init_app(redis, use_cache=False)
+        self.detector.remember(self.user_id, self.problem_id, SOURCE_HASH, 1)
+
+        self.assertFalse(self.detector.is_duplicate(self.user_id, self.problem_id, SOURCE_HASH, 1))
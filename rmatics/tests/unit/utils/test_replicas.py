@@ -0,0 +1,133 @@
+from unittest import mock
+
+from flask import url_for
+from flask_sqlalchemy import get_state
+from sqlalchemy import event
+
+from rmatics.model.base import db
+from rmatics.model.group import Group
+from rmatics.plugins import replica_router
+from rmatics.testutils import TestCase
+from rmatics.utils.cacher import helpers
+from rmatics.utils.replicas import PRIMARY_HEADER
+from rmatics.view.monitors.monitor import get_runs
+
+
+class TestReplicaRouter(TestCase):
+    """ Replica is one more engine of the same database, so it sees all data of test """
+    def setUp(self):
+        super().setUp()
+        self.create_ejudge_problems()
+        self.create_problems()
+        self.create_users()
+        self.create_runs()
+        db.session.commit()
+
+        self.binds = self.app.config.get('SQLALCHEMY_BINDS')
+        replica_router.init_app(self.app, uris=[self.app.config['SQLALCHEMY_DATABASE_URI']], pin_period=10)
+
+        self.replica_statements = []
+        self.replica = db.get_engine(self.app, bind='replica_0')
+        event.listen(self.replica, 'before_cursor_execute', self.record)
+
+    def tearDown(self):
+        event.remove(self.replica, 'before_cursor_execute', self.record)
+        db.session.remove()
+        self.replica.dispose()
+        get_state(self.app).connectors.pop('replica_0', None)
+
+        replica_router.init_app(self.app, uris=[])
+        self.app.config['SQLALCHEMY_BINDS'] = self.binds
+        super().tearDown()
+
+    def record(self, conn, cursor, statement, *args):
+        self.replica_statements.append(statement)
+
+    def get_submissions(self, **kwargs):
+        route = url_for('problem.problem_submissions', problem_id=self.runs[0].problem_id)
+        return self.client.get(route, query_string={'page': 1}, **kwargs)
+
+    def test_read_only_view_reads_replica(self):
+        resp = self.get_submissions()
+        self.assert200(resp)
+        self.assertTrue(resp.get_json()['data'])
+        self.assertTrue(any('runs' in statement for statement in self.replica_statements))
+
+    def test_monitor_reads_replica(self):
+        with self.app.test_request_context():
+            runs = replica_router.read_only(get_runs)(problem_id=self.runs[0].problem_id, cache=False)
+        self.assertTrue(runs)
+        self.assertTrue(any('runs' in statement for statement in self.replica_statements))
+
+    def test_streamed_monitor_reads_replica(self):
+        problem_id = self.runs[0].problem_id
+        resp = self.client.get(url_for('monitor.problem_monitor', problem_id=problem_id, stream=True))
+        self.assert200(resp)
+        self.assertTrue(resp.get_json()['data'][0]['runs'])
+        self.assertTrue(any('runs' in statement for statement in self.replica_statements))
+
+    def test_flush_goes_to_primary(self):
+        def view():
+            db.session.add(Group(name='replica'))
+            db.session.commit()
+
+        with self.app.test_request_context():
+            replica_router.read_only(view)()
+
+        self.assertFalse([s for s in self.replica_statements if s.startswith('INSERT')])
+        self.assertEqual(db.session.query(Group).filter_by(name='replica').count(), 1)
+
+    def test_header_pins_primary(self):
+        self.assert200(self.get_submissions(headers={PRIMARY_HEADER: '1'}))
+        self.assertEqual(self.replica_statements, [])
+
+    def test_writes_pin_primary(self):
+        run = self.runs[0]
+        resp = self.client.put(url_for('problem.run', run_id=run.id), json={'ejudge_status': 1})
+        self.assert200(resp)
+        self.assertIn(replica_router.cookie, resp.headers['Set-Cookie'])
+
+        self.assert200(self.get_submissions())
+        self.assertEqual(self.replica_statements, [])
+
+    def test_expired_pin_reads_replica(self):
+        self.client.set_cookie('localhost', replica_router.cookie, '1')
+        self.assert200(self.get_submissions())
+        self.assertTrue(self.replica_statements)
+
+    def test_invalidates_after_replica_lag(self):
+        config = {'SQLALCHEMY_REPLICA_URIS': ['replica'], 'DB_PRIMARY_PIN_PERIOD': 5}
+        task = helpers.invalidate_monitor_cache_by_problem_users
+        with mock.patch.dict(self.app.config, config), \
+                mock.patch.object(task, 'apply_async') as apply_async:
+            helpers.invalidate_monitor_cache_by_run(self.runs[0])
+
+        run = self.runs[0]
+        apply_async.assert_called_once_with(args=([(run.problem_id, run.user_id)], ), countdown=5)
+
+    def test_invalidates_patched_cache_after_replica_lag(self):
+        config = {'SQLALCHEMY_REPLICA_URIS': ['replica'], 'DB_PRIMARY_PIN_PERIOD': 5}
+        task = helpers.invalidate_monitor_cache_by_problem_users
+        run = self.runs[0]
+        with mock.patch.dict(self.app.config, config), \
+                mock.patch.object(helpers.monitor_cacher, 'update', return_value=True), \
+                mock.patch.object(task, 'apply_async') as apply_async:
+            helpers.update_monitor_cache_by_run(run)
+
+        apply_async.assert_called_once_with(args=([(run.problem_id, run.user_id)], ), countdown=5)
+
+
+class TestWithoutReplicas(TestCase):
+    def test_nothing_is_routed(self):
+        self.create_ejudge_problems()
+        self.create_users()
+        self.create_runs()
+        db.session.commit()
+        run = self.runs[0]
+
+        resp = self.client.put(url_for('problem.run', run_id=run.id), json={'ejudge_status': 1})
+        self.assert200(resp)
+        self.assertNotIn('Set-Cookie', resp.headers)
+
+        with self.app.test_request_context():
+            self.assertIs(replica_router.read_only(db.get_read_engine)(), db.engine)
@@ -1,8 +1,10 @@
+import base64
 import datetime
 import io
 import json
+import zipfile
 from io import BytesIO
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, call
 
 from bson import ObjectId
 from flask import url_for
@@ -13,6 +15,7 @@ from rmatics.model.run import Run
 from rmatics.testutils import TestCase
 from rmatics.utils.run import EjudgeStatuses
 from rmatics.view.problem.problem import TrustedSubmitApi
+from rmatics.view.problem.run import MAX_BULK_RUNS
 
 PROTOCOL_ID = ObjectId("507f1f77bcf86cd799439011")
 WRONG_PROTOCOL_ID = ObjectId("507f1f77bcf86cd799439012")
@@ -94,6 +97,96 @@ class TestTrustedProblemSubmit(TestCase):
         self.assert400(resp)
 
 
+class TestTrustedBulkSubmit(TestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_ejudge_problems()
+        self.create_users()
+        self.create_statements()
+
+    def submission(self, source: bytes, user_id=None, problem_id=None, **kwargs):
+        return {
+            'problem_id': problem_id or self.ejudge_problems[0].id,
+            'user_id': user_id or self.users[0].id,
+            'lang_id': 1,
+            'statement_id': self.statements[0].id,
+            'source': base64.b64encode(source).decode(),
+            **kwargs
+        }
+
+    def send_request(self, submissions):
+        url = url_for('problem.trusted_bulk_submit')
+        return self.client.post(url, data=json.dumps({'submissions': submissions}),
+                                content_type='application/json')
+
+    @patch('rmatics.view.problem.problem.group')
+    @patch('rmatics.view.problem.problem.submit_task')
+    def test_simple(self, mock_submit_task, mock_group):
+        previous_source = b'previous source'
+        db.session.add(Run(user_id=self.users[1].id, problem_id=self.ejudge_problems[0].id,
+                           lang_id=1, source_hash=Run.generate_source_hash(previous_source)))
+        db.session.commit()
+
+        submissions = [
+            self.submission(b'first source'),
+            # Duplicate of previous submission in request
+            self.submission(b'first source'),
+            self.submission(b'first source', problem_id=self.ejudge_problems[1].id, context_id=42),
+            # Duplicate of run in DB
+            self.submission(previous_source, user_id=self.users[1].id),
+            self.submission(b'another source', user_id=self.users[1].id),
+            self.submission(b'x'),
+            self.submission(b'first source', problem_id=100500),
+        ]
+        resp = self.send_request(submissions)
+        self.assert200(resp)
+
+        results = resp.json['data']
+        self.assertEqual(len(results), len(submissions))
+        run_ids = [results[i]['run_id'] for i in (0, 2, 4)]
+        for i in (1, 3, 5, 6):
+            self.assertIn('error', results[i])
+
+        runs = db.session.query(Run).filter(Run.id.in_(run_ids)).order_by(Run.id).all()
+        self.assertEqual([run.id for run in runs], run_ids)
+        self.assertEqual([run.problem_id for run in runs],
+                         [self.ejudge_problems[0].id, self.ejudge_problems[1].id, self.ejudge_problems[0].id])
+        self.assertEqual(runs[1].statement_id, 42)
+        self.assertEqual(runs[2].user_id, self.users[1].id)
+        self.assertEqual(runs[2].ejudge_status, 377)
+        self.assertEqual(runs[2].source, b'another source')
+
+        mock_submit_task.s.assert_has_calls([call(run_id) for run_id in run_ids])
+        mock_group.return_value.apply_async.assert_called_once()
+
+    @patch('rmatics.view.problem.problem.group')
+    @patch('rmatics.view.problem.problem.submit_task')
+    def test_concurrent_same_runs(self, mock_submit_task, mock_group):
+        execute = db.session.execute
+
+        def execute_with_concurrent_insert(statement, params=None, *args, **kwargs):
+            result = execute(statement, params, *args, **kwargs)
+            if isinstance(params, list):
+                # The same run is inserted by another request at the same second
+                execute(statement, params[:1])
+            return result
+
+        with patch.object(db.session, 'execute', side_effect=execute_with_concurrent_insert):
+            resp = self.send_request([self.submission(b'first source')])
+        self.assert500(resp)
+
+        self.assertEqual(db.session.query(Run).count(), 0)
+        self.assertEqual(mongo.db.source.count_documents({}), 0)
+        mock_group.assert_not_called()
+
+    def test_validation(self):
+        resp = self.send_request([])
+        self.assertStatus(resp, 422)
+
+        resp = self.send_request([{'problem_id': self.ejudge_problems[0].id}])
+        self.assertStatus(resp, 422)
+
+
 class TestGetSubmissionSource(TestCase):
     def setUp(self):
         super().setUp()
@@ -146,6 +239,79 @@ class TestGetSubmissionSource(TestCase):
         self.assert200(resp)
 
 
+class TestBulkRuns(TestCase):
+    def setUp(self):
+        super().setUp()
+
+        self.create_users()
+        self.create_ejudge_problems()
+
+        self.runs = []
+        for i, user in enumerate(self.users[:2]):
+            blob = f'source {i}'.encode()
+            run = Run(
+                user_id=user.id,
+                problem_id=self.ejudge_problems[0].id,
+                ejudge_contest_id=self.ejudge_problems[0].ejudge_contest_id,
+                lang_id=1,
+                ejudge_status=EjudgeStatuses.OK.value,
+                source_hash=Run.generate_source_hash(blob),
+            )
+            db.session.add(run)
+            db.session.flush()
+            run.update_source(blob)
+            self.runs.append(run)
+        db.session.commit()
+
+        self.runs[0].protocol = {
+            'run_id': self.runs[0].id,
+            'tests': {'1': {'input': '1', 'output': '2', 'status': 'OK', 'time': 5}},
+        }
+
+    def send_request(self, data):
+        return self.client.post(url_for('problem.runs_bulk'), data=json.dumps(data),
+                                content_type='application/json')
+
+    def test_sources_and_protocols(self):
+        run_ids = [run.id for run in self.runs]
+        resp = self.send_request({'run_ids': run_ids, 'include_protocol': True, 'is_admin': True})
+        self.assert200(resp)
+
+        first, second = resp.json['data']
+        self.assertEqual(first['source'], 'source 0')
+        self.assertEqual(first['language_id'], 1)
+        self.assertEqual(first['protocol']['tests'], {'1': {'status': 'OK', 'time': 5}})
+        self.assertEqual(second['source'], 'source 1')
+        self.assertIsNone(second['protocol'])
+
+    def test_permissions(self):
+        run_ids = [run.id for run in self.runs]
+        resp = self.send_request({'run_ids': run_ids, 'user_id': self.users[1].id})
+        self.assert200(resp)
+        self.assertEqual(resp.json['data'], [
+            {'run_id': self.runs[1].id, 'language_id': 1, 'source': 'source 1'},
+        ])
+
+    def test_zip(self):
+        run_ids = [run.id for run in self.runs]
+        resp = self.send_request({'run_ids': run_ids, 'include_protocol': True,
+                                  'format': 'zip', 'is_admin': True})
+        self.assert200(resp)
+        self.assertEqual(resp.mimetype, 'application/zip')
+
+        with zipfile.ZipFile(io.BytesIO(resp.data)) as archive:
+            self.assertEqual(sorted(archive.namelist()), sorted([
+                f'{self.runs[0].id}.txt', f'{self.runs[0].id}.json', f'{self.runs[1].id}.txt',
+            ]))
+            self.assertEqual(archive.read(f'{self.runs[1].id}.txt'), b'source 1')
+            protocol = json.loads(archive.read(f'{self.runs[0].id}.json').decode())
+            self.assertEqual(protocol['tests']['1'], {'status': 'OK', 'time': 5})
+
+    def test_too_many_runs(self):
+        resp = self.send_request({'run_ids': list(range(MAX_BULK_RUNS + 1)), 'is_admin': True})
+        self.assertStatus(resp, 422)
+
+
 class TestUpdateSubmissionFromEjudge(TestCase):
     def setUp(self):
         super().setUp()
@@ -324,3 +490,23 @@ class TestGetRunProtocol(TestCase):
 
         resp = self.send_request(run_id=self.run2.id, data=data)
         self.assert404(resp)
+
+    def test_split_protocol(self):
+        test = {'input': '1', 'output': '2', 'status': 'OK', 'time': 5}
+        with patch.dict(self.app.config, {'PROTOCOL_SPLIT_TESTS': True}):
+            self.run1.protocol = {'run_id': self.run1.id, 'tests': {'1': test}}
+        data = {'is_admin': False, 'user_id': self.run1.user_id}
+
+        resp = self.send_request(run_id=self.run1.id, data={**data, 'full': False})
+        self.assert200(resp)
+        self.assertEqual(resp.json['data']['tests'], {'1': {'status': 'OK', 'time': 5}})
+
+        resp = self.client.get(url_for('problem.run_protocol_test', run_id=self.run1.id, test_number='1', **data))
+        self.assert200(resp)
+        self.assertEqual(resp.json['data'], test)
+
+        resp = self.client.get(url_for('problem.run_protocol_test', run_id=self.run1.id, test_number='2', **data))
+        self.assert404(resp)
+
+        resp = self.send_request(run_id=self.run1.id, data=data)
+        self.assertEqual(resp.json['data']['tests'], {'1': test})
@@ -1,6 +1,7 @@
 import datetime
+import json
 from abc import ABC, abstractmethod
-from typing import Callable, List
+from typing import Callable, List, Optional, Tuple
 
 from sqlalchemy import or_, and_
 
@@ -22,6 +23,12 @@ class ICacheInvalidator(ABC):
     def invalidate(self, label: str, all_of: dict = None, any_of: dict = None) -> bool:
         pass
 
+    def find(self, label: str, all_of: dict = None, any_of: dict = None) -> Optional[List[Tuple[str, dict]]]:
+        """ Returns [(key, func_kwargs)] of caches which would be invalidated
+            by the same arguments, or None if invalidator can't restore func_kwargs
+        """
+        return None
+
 
 class MonitorCacheInvalidator(ICacheInvalidator):
     def __init__(self, autocommit=True, prefix=None):
@@ -30,7 +37,8 @@ class MonitorCacheInvalidator(ICacheInvalidator):
         self.prefix = prefix or 'monitor'
         self.invalidate_by = ['user_ids', 'time_after', 'time_before']
 
-    def init_app(self, remove_cache_func: Callable[[str], None], period=20):
+    def init_app(self, remove_cache_func: Callable[..., None], period=20):
+        """ remove_cache_func should accept several keys at once, e.g. redis.delete """
         self.remove_cache_func = remove_cache_func
 
     def subscribe(self, label: str, period: int, key: str, func_kwargs: dict, **kwargs):
@@ -83,10 +91,14 @@ class MonitorCacheInvalidator(ICacheInvalidator):
         if problem_id is not None:
             invalid_cache_metas_q = invalid_cache_metas_q.filter(MonitorCacheMeta.problem_id == problem_id)
 
+        keys = []
         for meta in invalid_cache_metas_q:
-            self.remove_cache_func(meta.key)
+            keys.append(meta.key)
             db.session.delete(meta)
 
+        if keys:
+            self.remove_cache_func(*keys)
+
         if self.autocommit:
             db.session.commit()
 
@@ -123,3 +135,112 @@ class MonitorCacheInvalidator(ICacheInvalidator):
         for item in value:
             acc.append(cls._simple_item_to_string(key, item))
         return acc
+
+
+class RedisCacheInvalidator(ICacheInvalidator):
+    """ Cache invalidator based on Redis sets instead of MonitorCacheMeta
+
+        For every cached key we keep it in sets
+            {prefix}/invalidate/{label}/{problem_id}/all
+            {prefix}/invalidate/{label}/{problem_id}/{index_by}_{value}  for every value of index_by kwarg
+            {prefix}/invalidate/{label}/{problem_id}/*                   if index_by kwarg is not set
+        Every set lives as long as the cache itself.
+
+        Invalidation by index_by values takes union of their sets and the * set
+        (caches for all users are affected by any user), then deletes found keys
+        together with the sets. All index_by values from all_of and any_of are
+        treated as any_of: it can only invalidate more, which is safe for cache.
+        If there is no index_by values all caches of the problem are invalidated.
+
+        Also func_kwargs of every key are kept in {prefix}/kwargs/{key},
+        so caches can be found and updated instead of being invalidated
+    """
+    WILDCARD = '*'
+    ALL = 'all'
+
+    def __init__(self, prefix=None, index_by='user_ids'):
+        self.store = None
+        self.remove_cache_func = None
+        self.prefix = prefix or 'monitor'
+        self.index_by = index_by
+
+    def init_app(self, remove_cache_func: Callable[..., None], store=None):
+        """ remove_cache_func should accept several keys at once, e.g. redis.delete """
+        self.remove_cache_func = remove_cache_func
+        self.store = store
+
+    def subscribe(self, label: str, period: int, key: str, func_kwargs: dict, **kwargs):
+        func_kwargs = dict(func_kwargs) if func_kwargs else {}
+        problem_id = func_kwargs.pop('problem_id')
+
+        values = self._to_list(func_kwargs.get(self.index_by))
+        if values:
+            suffixes = [self._value_suffix(value) for value in values]
+        else:
+            suffixes = [self.WILDCARD]
+        suffixes.append(self.ALL)
+
+        pipeline = self.store.pipeline(transaction=False)
+        for suffix in suffixes:
+            set_key = self._get_set_key(label, problem_id, suffix)
+            pipeline.sadd(set_key, key)
+            pipeline.expire(set_key, period)
+        pipeline.set(self._get_kwargs_key(key), json.dumps(dict(func_kwargs, problem_id=problem_id)), ex=period)
+        pipeline.execute()
+
+    def invalidate(self, label: str, all_of: dict = None, any_of: dict = None) -> bool:
+        set_keys = self._get_set_keys(label, all_of, any_of)
+
+        # Read and drop index atomically, so keys subscribed meanwhile are not lost
+        pipeline = self.store.pipeline(transaction=True)
+        pipeline.sunion(set_keys)
+        pipeline.delete(*set_keys)
+        keys, _ = pipeline.execute()
+
+        if keys:
+            self.remove_cache_func(*keys)
+            self.store.delete(*(self._get_kwargs_key(key.decode()) for key in keys))
+
+        return True
+
+    def find(self, label: str, all_of: dict = None, any_of: dict = None) -> List[Tuple[str, dict]]:
+        set_keys = self._get_set_keys(label, all_of, any_of)
+        keys = [key.decode() for key in self.store.sunion(set_keys)]
+        if not keys:
+            return []
+
+        kwargs_list = self.store.mget([self._get_kwargs_key(key) for key in keys])
+        # Keys without kwargs are already expired
+        return [(key, json.loads(func_kwargs))
+                for key, func_kwargs in zip(keys, kwargs_list)
+                if func_kwargs]
+
+    def _get_set_keys(self, label: str, all_of: dict = None, any_of: dict = None) -> List[str]:
+        any_of = dict(any_of) if any_of else {}
+        all_of = dict(all_of) if all_of else {}
+        # Allow problem_id arg ONLY in all_of args
+        problem_id = all_of.pop('problem_id')
+
+        values = self._to_list(all_of.get(self.index_by)) + self._to_list(any_of.get(self.index_by))
+        if values:
+            suffixes = [self.WILDCARD] + [self._value_suffix(value) for value in values]
+        else:
+            suffixes = [self.ALL]
+        return [self._get_set_key(label, problem_id, suffix) for suffix in suffixes]
+
+    def _get_set_key(self, label: str, problem_id, suffix: str) -> str:
+        return f'{self.prefix}/invalidate/{label}/{problem_id}/{suffix}'
+
+    def _get_kwargs_key(self, key: str) -> str:
+        return f'{self.prefix}/kwargs/{key}'
+
+    def _value_suffix(self, value) -> str:
+        return f'{self.index_by}_{value}'
+
+    @staticmethod
+    def _to_list(value) -> list:
+        if value is None:
+            return []
+        if isinstance(value, (list, tuple, set)):
+            return list(value)
+        return [value]
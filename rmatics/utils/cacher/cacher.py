@@ -2,27 +2,31 @@ import datetime
 import functools
 import hashlib
 import json
-import pickle
-from typing import Callable, List, Optional
+import time
+from contextlib import ExitStack
+from typing import Callable, List, Optional, Tuple
 
 import redis
 
 from rmatics.utils.cacher.cache_invalidators import ICacheInvalidator
+from rmatics.utils.cacher.codecs import CacheCodec
+from rmatics.utils.cacher.local_cache import LocalCache, MISSING
 from rmatics.utils.cacher.locker import ILocker
 
-PICKLE_ASCII_PROTO = 0
+# How often process waiting for cache fill checks it, seconds
+FILL_POLL_INTERVAL = 0.05
 
 
-def _dump_to_ascii_str(obj) -> str:
-    """Dump object to ascii-encoded string."""
-    return pickle.dumps(obj, PICKLE_ASCII_PROTO).decode()
+def _dump_to_str(obj) -> str:
+    """Dump object to json string which is the same for equal objects in every process."""
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=str)
 
 
 def get_cache_key(func: Callable, prefix: str,
                   args: tuple, kwargs: dict) -> str:
     """Get unique key to be used as cache key in redis or smth."""
-    dumped_args = _dump_to_ascii_str(args)
-    dumped_kwargs = _dump_to_ascii_str(kwargs)
+    dumped_args = _dump_to_str(args)
+    dumped_kwargs = _dump_to_str(kwargs)
     key = f'{dumped_args}_{dumped_kwargs}'
     hashed_key = hashlib.md5(key.encode('ascii'))
     return f'{prefix}/{func.__name__}_{hashed_key.hexdigest()}'
@@ -69,6 +73,7 @@ class Cacher:
         We use full_text_search by its field
         So its better to remove old CacheMeta
         For example by CRON u now
+        RedisCacheInvalidator keeps the same index in redis sets instead
     Also #2:
     ------
         For invalidation we use only kwargs of cached function call
@@ -78,10 +83,22 @@ class Cacher:
         Например, contest_ids = [1, 2, 3]; для contest_ids = {id: [3]} не сработает
     Also #4:
     ------
-        We can use locker to lock storage;
-        Before getting from cache we lock our code and then realise it
-        to avoid raise conditions and multiply function executing
+        We use locker only on cache miss, hits are read without locks;
+        Only process which took the lock executes function (single flight),
+        others wait up to fill_wait seconds for cache to be filled
+        and execute function without caching if it is not.
         lock is unique for each cache key (from get_cache_key)
+        If stale_period is set, results are kept stale_period seconds longer
+        and expired result is returned while lock owner recomputes it
+    Also #5:
+    ------
+        Values are encoded by codec (plain json by default),
+        see CacheCodec for msgpack and compression
+    Also #6:
+    ------
+        Optional local_cache keeps decoded results in process for a few seconds;
+        Invalidators should remove caches by Cacher.remove,
+        so keys are removed from local caches of all processes too
     """
     def __init__(self, store,
                  locker: ILocker,
@@ -89,7 +106,12 @@ class Cacher:
                  cache_invalidator: Optional[ICacheInvalidator] = None,
                  prefix='cache',
                  period=30*60,
-                 autocommit=True):
+                 autocommit=True,
+                 codec: Optional[CacheCodec] = None,
+                 stale_period=0,
+                 fill_wait=0.5,
+                 lock_timeout=4000,
+                 local_cache: Optional[LocalCache] = None):
         """Construct cache decorator based on the given redis connector."""
 
         self.store = store
@@ -99,6 +121,11 @@ class Cacher:
         self.autocommit = autocommit
         self.locker = locker
         self.allowed_kwargs = allowed_kwargs
+        self.codec = codec or CacheCodec()
+        self.stale_period = stale_period
+        self.fill_wait = fill_wait
+        self.lock_timeout = lock_timeout
+        self.local_cache = local_cache
 
     def __call__(self, func):
         @functools.wraps(func)
@@ -113,27 +140,205 @@ class Cacher:
 
             key = get_cache_key(func, self.prefix, (), allowed_kwargs)
 
-            with self.locker.take_possession(key):
-                try:
-                    result = self.store.get(key)
-                except redis.exceptions.ConnectionError:
-                    return func(*args, **kwargs)
-
-                if result:
-                    return json.loads(result)
-
-                func_result = func(*args, **kwargs)
-                self.store.set(key, json.dumps(func_result))
-                self.store.expire(key, self.period)
-
-            if self.cache_invalidator is not None:
-                self.cache_invalidator.subscribe(func.__name__,
-                                                 self.period,
-                                                 key,
-                                                 allowed_kwargs)
-            return func_result
+            if self.local_cache is not None:
+                local_result = self.local_cache.get(key)
+                if local_result is not MISSING:
+                    return local_result
+
+            try:
+                result, is_fresh = self._get(key)
+            except redis.exceptions.ConnectionError:
+                return func(*args, **kwargs)
+
+            if result and is_fresh:
+                return self._load(key, result)
+
+            with self.locker.try_possession(key, self.lock_timeout) as is_owner:
+                if is_owner:
+                    func_result = func(*args, **kwargs)
+                    self._set(key, func_result)
+                    self._subscribe(func, key, allowed_kwargs)
+                    return func_result
+
+            # Someone else is computing result
+            if result:
+                return self.codec.loads(result)
+
+            result = self._wait_for_fill(key)
+            if result:
+                return self.codec.loads(result)
+            return func(*args, **kwargs)
         return wrapped
 
+    def _load(self, key: str, value: bytes):
+        """ Decodes fresh cached value and keeps it in local cache """
+        result = self.codec.loads(value)
+        if self.local_cache is not None:
+            self.local_cache.set(key, result, size=len(value))
+        return result
+
+    def _get(self, key: str) -> Tuple[Optional[bytes], bool]:
+        """ Returns cached value and if it is not stale """
+        if not self.stale_period:
+            return self.store.get(key), True
+
+        value, fresh = self.store.mget([key, self._get_fresh_key(key)])
+        return value, bool(fresh)
+
+    def _get_many(self, keys: List[str]) -> Tuple[list, List[bool]]:
+        if not self.stale_period:
+            return self.store.mget(keys), [True] * len(keys)
+
+        values = self.store.mget(keys + [self._get_fresh_key(key) for key in keys])
+        return values[:len(keys)], [bool(fresh) for fresh in values[len(keys):]]
+
+    def _set(self, key: str, result, pipeline=None):
+        target = pipeline
+        if target is None:
+            target = self.store.pipeline(transaction=False) if self.stale_period else self.store
+
+        target.set(key, self.codec.dumps(result), ex=self.period + self.stale_period)
+        if self.stale_period:
+            target.set(self._get_fresh_key(key), 1, ex=self.period)
+            if pipeline is None:
+                target.execute()
+
+    def _wait_for_fill(self, key: str) -> Optional[bytes]:
+        deadline = time.monotonic() + self.fill_wait
+        while time.monotonic() < deadline:
+            time.sleep(FILL_POLL_INTERVAL)
+            result = self.store.get(key)
+            if result:
+                return result
+        return None
+
+    def _wait_for_fill_many(self, keys: List[str]) -> list:
+        """ Same as _wait_for_fill for all keys at once, not filled values are None """
+        values = [None] * len(keys)
+        deadline = time.monotonic() + self.fill_wait
+        while time.monotonic() < deadline:
+            time.sleep(FILL_POLL_INTERVAL)
+            indexes = [i for i, value in enumerate(values) if not value]
+            for i, value in zip(indexes, self.store.mget([keys[i] for i in indexes])):
+                values[i] = value
+            if all(values):
+                break
+        return values
+
+    def _subscribe(self, func, key: str, allowed_kwargs: dict):
+        if self.cache_invalidator is not None:
+            self.cache_invalidator.subscribe(func.__name__,
+                                             self.period + self.stale_period,
+                                             key,
+                                             allowed_kwargs)
+
+    @staticmethod
+    def _get_fresh_key(key: str) -> str:
+        return f'{key}/fresh'
+
+    def get_many(self, func, list_of_kwargs: List[dict],
+                 batch_func: Callable[[List[dict]], list] = None) -> list:
+        """ Get cached results of func for every kwargs from list_of_kwargs
+            Cache entries are the same as for single func(**kwargs) call,
+            so func should be decorated by this cacher
+
+            All cached values are fetched by one MGET and computed results
+            are written back by one pipeline of SET ... EX
+
+            Missed results are computed by one batch_func(missed_kwargs) call
+            which should return results in the same order,
+            or by func(**kwargs) one by one if batch_func is not provided;
+            only results whose locks were taken are computed (single flight),
+            others are waited for as in single call
+
+            Returns results in the same order as list_of_kwargs
+        """
+        if not list_of_kwargs:
+            return []
+
+        allowed_kwargs_list = [self._filter_invalidate_kwargs(kwargs) for kwargs in list_of_kwargs]
+        keys = [get_cache_key(func, self.prefix, (), allowed_kwargs)
+                for allowed_kwargs in allowed_kwargs_list]
+
+        results = [None] * len(list_of_kwargs)
+        indexes = range(len(keys))
+        if self.local_cache is not None:
+            indexes = []
+            for i, key in enumerate(keys):
+                local_result = self.local_cache.get(key)
+                if local_result is MISSING:
+                    indexes.append(i)
+                else:
+                    results[i] = local_result
+            if not indexes:
+                return results
+
+        try:
+            cached_values, fresh = self._get_many([keys[i] for i in indexes])
+        except redis.exceptions.ConnectionError:
+            return self._compute_many(func, list_of_kwargs, batch_func)
+
+        missed = []
+        stale = []
+        for i, value, is_fresh in zip(indexes, cached_values, fresh):
+            if not value:
+                missed.append(i)
+            elif is_fresh:
+                results[i] = self._load(keys[i], value)
+            else:
+                results[i] = self.codec.loads(value)
+                stale.append(i)
+
+        computed = []
+        waiting = []
+        with ExitStack() as locks:
+            # Stale results are recomputed by process which took their locks,
+            # others return them as is
+            for i in stale:
+                if locks.enter_context(self.locker.try_possession(keys[i], self.lock_timeout)):
+                    computed.append(i)
+            for i in missed:
+                if locks.enter_context(self.locker.try_possession(keys[i], self.lock_timeout)):
+                    computed.append(i)
+                else:
+                    waiting.append(i)
+
+            if computed:
+                computed.sort()
+                missed_kwargs = [list_of_kwargs[i] for i in computed]
+                func_results = self._compute_many(func, missed_kwargs, batch_func)
+
+                pipeline = self.store.pipeline(transaction=False)
+                for i, func_result in zip(computed, func_results):
+                    self._set(keys[i], func_result, pipeline=pipeline)
+                    results[i] = func_result
+                pipeline.execute()
+
+        for i in computed:
+            self._subscribe(func, keys[i], allowed_kwargs_list[i])
+
+        if waiting:
+            # Someone else is computing them
+            filled = self._wait_for_fill_many([keys[i] for i in waiting])
+            not_filled = []
+            for i, value in zip(waiting, filled):
+                if value:
+                    results[i] = self.codec.loads(value)
+                else:
+                    not_filled.append(i)
+            if not_filled:
+                func_results = self._compute_many(func, [list_of_kwargs[i] for i in not_filled], batch_func)
+                for i, func_result in zip(not_filled, func_results):
+                    results[i] = func_result
+        return results
+
+    @staticmethod
+    def _compute_many(func, list_of_kwargs: List[dict],
+                      batch_func: Callable[[List[dict]], list] = None) -> list:
+        if batch_func is not None:
+            return batch_func(list_of_kwargs)
+        return [func(cache=False, **kwargs) for kwargs in list_of_kwargs]
+
     def _filter_invalidate_kwargs(self, kwargs: dict) -> dict:
         result_set = {}
         for arg in self.allowed_kwargs:
@@ -160,6 +365,61 @@ class Cacher:
 
         return self._invalidate(func, all_of=kwargs)
 
+    def invalidate(self, func, all_of: dict = None, any_of: dict = None) -> bool:
+        """ Invalidate all caches of func which match all of all_of keys and any of any_of keys
+            Returns True if its possible to invalidate some caches
+        """
+        if self.cache_invalidator is None:
+            return False
+
+        return self._invalidate(func, all_of=all_of, any_of=any_of)
+
+    def update(self, func, patch_func: Callable[[object, dict], object], **kwargs) -> bool:
+        """ Update in place all caches of func which would be invalidated by
+            invalidate_all_of(func, **kwargs)
+
+            patch_func(cached_result, func_kwargs) returns new result
+            or None if result can't be patched, then cache is removed
+
+            Returns False if caches can't be found, so they should be invalidated
+        """
+        if self.cache_invalidator is None:
+            return False
+
+        entries = self.cache_invalidator.find(func.__name__, all_of=kwargs)
+        if entries is None:
+            return False
+
+        for key, func_kwargs in entries:
+            self._patch(key, lambda result: patch_func(result, func_kwargs))
+        return True
+
+    def _patch(self, key: str, patch: Callable[[object], object]):
+        def transaction(pipe):
+            result = pipe.get(key)
+            if not result:
+                return
+            ttl = pipe.ttl(key)
+            patched = patch(self.codec.loads(result))
+
+            pipe.multi()
+            if patched is None:
+                pipe.delete(key)
+            else:
+                pipe.set(key, self.codec.dumps(patched), ex=ttl if ttl > 0 else self.period)
+
+        self.store.transaction(transaction, key)
+        if self.local_cache is not None:
+            self.local_cache.publish([key])
+
+    def remove(self, *keys):
+        """ Removes cached results, also from local caches of all processes """
+        if not keys:
+            return
+        self.store.delete(*keys)
+        if self.local_cache is not None:
+            self.local_cache.publish(keys)
+
     def _invalidate(self, func, all_of: dict = None, any_of: dict = None) -> bool:
         label = func.__name__
         return self.cache_invalidator.invalidate(label, all_of=all_of, any_of=any_of)
@@ -0,0 +1,99 @@
+import json
+import zlib
+
+try:
+    import msgpack
+except ImportError:  # msgpack codec is optional
+    msgpack = None
+
+JSON_SERIALIZER = 'json'
+MSGPACK_SERIALIZER = 'msgpack'
+
+# Version byte: serializer id with optional compression flag.
+# Plain json never starts with such byte, so entries without it are decoded as json
+JSON_VERSION = 0x01
+MSGPACK_VERSION = 0x02
+ZLIB_FLAG = 0x10
+
+
+def _msgpack_dumps(obj) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def _msgpack_loads(data: bytes):
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _json_dumps(obj) -> bytes:
+    return json.dumps(obj, separators=(',', ':')).encode()
+
+
+SERIALIZERS = {
+    JSON_VERSION: (_json_dumps, json.loads),
+    MSGPACK_VERSION: (_msgpack_dumps, _msgpack_loads),
+}
+
+SERIALIZER_VERSIONS = {
+    JSON_SERIALIZER: JSON_VERSION,
+    MSGPACK_SERIALIZER: MSGPACK_VERSION,
+}
+
+
+class CacheCodec:
+    """ Encodes cached values to bytes and back
+
+    Usage:
+    ------
+        codec = CacheCodec('msgpack', compress_threshold=16 * 1024)
+        data = codec.dumps({'a': 1})
+        codec.loads(data) == {'a': 1}
+
+    Also:
+    ------
+        Encoded value is version byte and payload, payload is compressed
+        by zlib if it is longer than compress_threshold.
+        Any codec decodes values of every version and plain json,
+        so serializer can be changed without flushing cache.
+        CacheCodec('json') without compression writes plain json,
+        which can be read by workers without codecs
+    """
+    def __init__(self, serializer: str = JSON_SERIALIZER,
+                 compress_threshold: int = 0, compress_level: int = 1):
+        if serializer not in SERIALIZER_VERSIONS:
+            raise ValueError(f'Unknown cache serializer {serializer}')
+        if serializer == MSGPACK_SERIALIZER and msgpack is None:
+            raise ValueError('msgpack is not installed')
+
+        self.version = SERIALIZER_VERSIONS[serializer]
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def dumps(self, obj):
+        serialize, _ = SERIALIZERS[self.version]
+        payload = serialize(obj)
+
+        version = self.version
+        if self.compress_threshold and len(payload) > self.compress_threshold:
+            payload = zlib.compress(payload, self.compress_level)
+            version |= ZLIB_FLAG
+        elif version == JSON_VERSION:
+            return payload
+
+        return bytes([version]) + payload
+
+    @staticmethod
+    def loads(data):
+        if isinstance(data, str):
+            return json.loads(data)
+
+        version = data[0]
+        serializer = SERIALIZERS.get(version & ~ZLIB_FLAG)
+        if serializer is None:
+            return json.loads(data)
+
+        payload = data[1:]
+        if version & ZLIB_FLAG:
+            payload = zlib.decompress(payload)
+
+        _, deserialize = serializer
+        return deserialize(payload)
@@ -73,6 +73,10 @@ class FlaskCacher:
                    'with current args.'
             self._app.logger.warning(msg)
 
+    def remove(self, *keys):
+        # Explicit proxy, so it can be passed to invalidators before init_app
+        return self._instance.remove(*keys)
+
     def __call__(self, f: Callable):
         # We use deferred wrapping because when decorator called
         # We did not have self._instance: we did not call init_app yet
@@ -1,9 +1,86 @@
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from celery import shared_task
+from flask import current_app
+
 from rmatics import monitor_cacher
 from rmatics.model import Run
-from rmatics.view.monitors.monitor import get_runs
+from rmatics.model.base import db
+from rmatics.view.monitors.monitor import get_runs, get_monitor_run, patch_runs, \
+    get_columnar_runs, patch_columnar_runs
 
 
 def invalidate_monitor_cache_by_run(run: Run):
     problem_id = run.problem_id
     user_id = run.user_id
-    monitor_cacher.invalidate_all_of(get_runs, problem_id=problem_id, user_ids=user_id)
\ No newline at end of file
+    monitor_cacher.invalidate_all_of(get_runs, problem_id=problem_id, user_ids=user_id)
+    if current_app.config.get('MONITOR_COLUMNAR_FORMAT'):
+        monitor_cacher.invalidate_all_of(get_columnar_runs, problem_id=problem_id, user_ids=user_id)
+    _invalidate_after_replica_lag([(problem_id, user_id)])
+
+
+def invalidate_monitor_cache_by_runs(runs: Iterable[Run]):
+    """ Invalidates caches once per problem for all users of runs """
+    user_ids_by_problem = defaultdict(set)
+    for run in runs:
+        user_ids_by_problem[run.problem_id].add(run.user_id)
+
+    _invalidate_by_problems(user_ids_by_problem)
+    _invalidate_after_replica_lag([(problem_id, user_id)
+                                   for problem_id, user_ids in user_ids_by_problem.items()
+                                   for user_id in user_ids])
+
+
+def _invalidate_after_replica_lag(problem_users: List[Tuple[int, int]]):
+    """ Monitor read from replica right after invalidation can be cached without the update,
+        so caches are invalidated once more when replicas have surely got it
+    """
+    if current_app.config.get('SQLALCHEMY_REPLICA_URIS'):
+        invalidate_monitor_cache_by_problem_users.apply_async(
+            args=(problem_users, ),
+            countdown=current_app.config.get('DB_PRIMARY_PIN_PERIOD', 10),
+        )
+
+
+@shared_task(name='rmatics.utils.cacher.helpers.invalidate_monitor_cache_by_problem_users', ignore_result=True)
+def invalidate_monitor_cache_by_problem_users(problem_users: List[Tuple[int, int]]):
+    user_ids_by_problem = defaultdict(set)
+    for problem_id, user_id in problem_users:
+        user_ids_by_problem[problem_id].add(user_id)
+    _invalidate_by_problems(user_ids_by_problem)
+    db.session.commit()
+
+
+def _invalidate_by_problems(user_ids_by_problem: Dict[int, Set[int]]):
+    funcs = [get_runs]
+    if current_app.config.get('MONITOR_COLUMNAR_FORMAT'):
+        funcs.append(get_columnar_runs)
+
+    for problem_id, user_ids in user_ids_by_problem.items():
+        for func in funcs:
+            monitor_cacher.invalidate(func, all_of={'problem_id': problem_id},
+                                      any_of={'user_ids': sorted(user_ids)})
+
+
+def update_monitor_cache_by_run(run: Run):
+    """ Apply current state of run to cached get_runs results instead of invalidating them
+        Falls back to invalidation if cached results can't be found
+    """
+    monitor_run = get_monitor_run(run.id)
+    if monitor_run is None:
+        return invalidate_monitor_cache_by_run(run)
+
+    funcs = [(get_runs, patch_runs)]
+    if current_app.config.get('MONITOR_COLUMNAR_FORMAT'):
+        funcs.append((get_columnar_runs, patch_columnar_runs))
+
+    for func, patch_func in funcs:
+        def patch(result, func_kwargs: dict):
+            return patch_func(result, monitor_run, **func_kwargs)
+
+        updated = monitor_cacher.update(func, patch, problem_id=run.problem_id, user_ids=run.user_id)
+        if not updated:
+            monitor_cacher.invalidate_all_of(func, problem_id=run.problem_id, user_ids=run.user_id)
+    # Miss filled from replica meanwhile is cached without the patch
+    _invalidate_after_replica_lag([(run.problem_id, run.user_id)])
@@ -0,0 +1,132 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class LocalCache:
+    """ In-process LRU cache with TTL and size limit in bytes
+
+    Usage:
+    ------
+        local_cache = LocalCache(max_bytes=64 * 1024 * 1024, ttl=5)
+        local_cache.init_app(redis, channel='monitor/invalidated')
+
+        local_cache.set(key, value, size=len(encoded_value))
+        value = local_cache.get(key)  # MISSING if there is no fresh value
+
+        # Removes keys from local caches of all processes
+        local_cache.publish(keys)
+
+    Also:
+    ------
+        Local caches are kept coherent by redis pub/sub channel:
+        every process listens to it in daemon thread started on first use
+        (after fork) and removes published keys, dead listener is restarted.
+        Messages can be lost while listener is reconnecting,
+        so ttl should be small: it bounds how long stale value is served.
+        Values are returned as is, they should not be mutated
+    """
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 5):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = None
+        self.channel = None
+
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_pid = None
+
+    def init_app(self, store, channel: str):
+        self.store = store
+        self.channel = channel
+
+    def get(self, key: str):
+        self._ensure_listening()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+
+            expire_at, _, value = entry
+            if expire_at <= time.monotonic():
+                self._remove(key)
+                return MISSING
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, size: int):
+        if size > self.max_bytes:
+            return
+        self._ensure_listening()
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+
+            while self._size > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._size -= evicted_size
+
+    def remove(self, *keys: str):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def publish(self, keys: Iterable[str]):
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        self.remove(*keys)
+        if self.store is not None and keys:
+            self.store.publish(self.channel, json.dumps(keys))
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def _on_message(self, message: dict):
+        try:
+            keys = json.loads(message['data'])
+        except (TypeError, ValueError):
+            logger.warning('Bad local cache invalidation message %s', message)
+            # Can't tell which keys are invalid
+            self.clear()
+            return
+        self.remove(*keys)
+
+    def _is_listening(self) -> bool:
+        return self._listener_pid == os.getpid() and self._listener.is_alive()
+
+    def _ensure_listening(self):
+        if self.store is None or self._is_listening():
+            return
+
+        with self._lock:
+            if self._is_listening():
+                return
+            # Listener of parent process is not running after fork
+            # and messages could be lost while listener was down
+            self._entries.clear()
+            self._size = 0
+
+            pubsub = self.store.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(**{self.channel: self._on_message})
+            self._listener = pubsub.run_in_thread(sleep_time=1, daemon=True)
+            self._listener_pid = os.getpid()
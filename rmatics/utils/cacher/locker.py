@@ -14,6 +14,10 @@ class ILocker(ABC):
     def _unlock(self, key):
         pass
 
+    def _try_lock(self, key, timeout) -> bool:
+        self._lock(key, timeout)
+        return True
+
     @contextmanager
     def take_possession(self, key, timeout=4000):
         """ Context manager for locking some resource """
@@ -21,6 +25,18 @@ class ILocker(ABC):
         yield
         self._unlock(key)
 
+    @contextmanager
+    def try_possession(self, key, timeout=4000):
+        """ Same as take_possession but doesn't wait for resource,
+            yields False if it is locked by someone else
+        """
+        locked = self._try_lock(key, timeout)
+        try:
+            yield locked
+        finally:
+            if locked:
+                self._unlock(key)
+
 
 class FakeLocker(ILocker):
     def _lock(self, *args, **kwargs):
@@ -40,17 +56,20 @@ class RedisLocker(ILocker):
             If not success then sleep (timeout // 10) milliseconds
             and try again
         """
-        lock_key = f'lock/{key}'
         sleep_time = timeout / (10 * 1000)
-        while True:
-            lock = self.dlm.lock(lock_key, timeout)
-            if lock:
-                break
+        while not self._try_lock(key, timeout):
             time.sleep(sleep_time)
 
+    def _try_lock(self, key, timeout) -> bool:
+        lock_key = f'lock/{key}'
+        lock = self.dlm.lock(lock_key, timeout)
+        if not lock:
+            return False
+
         self._locks[lock_key] = lock
+        return True
 
     def _unlock(self, key):
         lock_key = f'lock/{key}'
-        lock = self._locks[lock_key]
+        lock = self._locks.pop(lock_key)
         self.dlm.unlock(lock)
@@ -0,0 +1,148 @@
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+
+import redis
+from sqlalchemy import select, func
+
+from rmatics.model.base import db
+from rmatics.model.run import Run
+
+logger = logging.getLogger(__name__)
+
+# (source_hash, lang_id) of run
+LastSource = Tuple[Optional[str], Optional[int]]
+
+
+class DuplicateSubmissionDetector:
+    """ Checks if submission is the same as the last submission of user for the problem
+
+    Usage:
+    ------
+        detector = DuplicateSubmissionDetector(prefix='last_source')
+        detector.init_app(redis, period=24*60*60, use_cache=True)
+
+        if detector.is_duplicate(user_id, problem_id, source_hash, lang_id):
+            raise BadRequest(...)
+        ...  # Insert run and commit
+        detector.remember(user_id, problem_id, source_hash, lang_id)
+
+    Also:
+    ------
+        Last run is found by index (user_id, problem_id, id, source_hash, ej_lang_id)
+        If use_cache, source of the last run is kept in redis hash {prefix}/{user_id}
+        with field problem_id, so check doesn't touch DB.
+        Source read from DB is written by HSETNX and never overwrites remembered one.
+        If redis is unavailable, DB is used
+    """
+    def __init__(self, prefix='last_source'):
+        self.prefix = prefix
+        self.store = None
+        self.period = None
+        self.use_cache = False
+
+    def init_app(self, store, period=24*60*60, use_cache=True):
+        self.store = store
+        self.period = period
+        self.use_cache = use_cache
+
+    def is_duplicate(self, user_id: int, problem_id: int, source_hash: str, lang_id: int) -> bool:
+        last_source = self.get_last_sources([(user_id, problem_id)])[(user_id, problem_id)]
+        return last_source == (source_hash, lang_id)
+
+    def get_last_sources(self, user_problems: Iterable[Tuple[int, int]]) -> Dict[Tuple[int, int], Optional[LastSource]]:
+        """ Returns {(user_id, problem_id): (source_hash, lang_id) of the last run or None} """
+        user_problems = list(dict.fromkeys(user_problems))
+
+        last_sources = {}
+        if self.use_cache:
+            try:
+                last_sources = self._get_cached(user_problems)
+            except redis.exceptions.ConnectionError:
+                logger.warning('Can\'t read last sources from redis')
+
+        missed = [user_problem for user_problem in user_problems if user_problem not in last_sources]
+        if missed:
+            loaded = self._load(missed)
+            last_sources.update(loaded)
+            if self.use_cache:
+                self._cache(loaded, overwrite=False)
+
+        return last_sources
+
+    def remember(self, user_id: int, problem_id: int, source_hash: str, lang_id: int):
+        """ Should be called after run is committed """
+        self.remember_many({(user_id, problem_id): (source_hash, lang_id)})
+
+    def remember_many(self, last_sources: Dict[Tuple[int, int], LastSource]):
+        if self.use_cache:
+            self._cache(last_sources, overwrite=True)
+
+    def _get_cached(self, user_problems: list) -> dict:
+        pipeline = self.store.pipeline(transaction=False)
+        for user_id, problem_id in user_problems:
+            pipeline.hget(self._get_key(user_id), str(problem_id))
+        values = pipeline.execute()
+
+        return {user_problem: self._loads(value)
+                for user_problem, value in zip(user_problems, values)
+                if value is not None}
+
+    def _cache(self, last_sources: dict, overwrite: bool):
+        pipeline = self.store.pipeline(transaction=False)
+        for (user_id, problem_id), last_source in last_sources.items():
+            key = self._get_key(user_id)
+            if overwrite:
+                pipeline.hset(key, str(problem_id), self._dumps(last_source))
+            else:
+                pipeline.hsetnx(key, str(problem_id), self._dumps(last_source))
+            pipeline.expire(key, self.period)
+        try:
+            pipeline.execute()
+        except redis.exceptions.ConnectionError:
+            logger.warning('Can\'t write last sources to redis')
+
+    @staticmethod
+    def _load(user_problems: list) -> dict:
+        runs = Run.__table__.c
+        last_sources = dict.fromkeys(user_problems)
+
+        if len(user_problems) == 1:
+            (user_id, problem_id), = user_problems
+            query = select([runs.user_id, runs.problem_id, runs.source_hash, runs.ej_lang_id]) \
+                .where(runs.user_id == user_id) \
+                .where(runs.problem_id == problem_id) \
+                .order_by(runs.id.desc()) \
+                .limit(1)
+        else:
+            user_ids = {user_id for user_id, _ in user_problems}
+            problem_ids = {problem_id for _, problem_id in user_problems}
+            last_run_ids = select([func.max(runs.id)]) \
+                .where(runs.user_id.in_(user_ids)) \
+                .where(runs.problem_id.in_(problem_ids)) \
+                .group_by(runs.user_id, runs.problem_id)
+            query = select([runs.user_id, runs.problem_id, runs.source_hash, runs.ej_lang_id]) \
+                .where(runs.id.in_(last_run_ids))
+
+        for row in db.session.execute(query):
+            user_problem = (row[runs.user_id], row[runs.problem_id])
+            if user_problem in last_sources:
+                last_sources[user_problem] = (row[runs.source_hash], row[runs.ej_lang_id])
+        return last_sources
+
+    @staticmethod
+    def _dumps(last_source: Optional[LastSource]) -> str:
+        # Empty string means that user has no runs for the problem
+        if last_source is None:
+            return ''
+        source_hash, lang_id = last_source
+        return f'{source_hash or ""}:{"" if lang_id is None else lang_id}'
+
+    @staticmethod
+    def _loads(value: bytes) -> Optional[LastSource]:
+        if not value:
+            return None
+        source_hash, lang_id = value.decode().split(':')
+        return source_hash or None, int(lang_id) if lang_id else None
+
+    def _get_key(self, user_id: int) -> str:
+        return f'{self.prefix}/{user_id}'
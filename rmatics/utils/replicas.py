@@ -0,0 +1,109 @@
+import functools
+import random
+import time
+from typing import Iterable, Iterator, List, Optional
+
+from flask import Response, after_this_request, g, has_app_context, request, stream_with_context
+
+# Attribute of flask.g with bind key of replica chosen for current read only view
+REPLICA_BIND_ATTR = 'db_replica_bind'
+# Read only views with this header read from primary, for clients without cookies
+PRIMARY_HEADER = 'X-Read-Primary'
+
+
+class ReplicaRouter:
+    """ Routes queries of read only views to read replicas
+
+    Usage:
+    ------
+        replica_router = ReplicaRouter(cookie='db_primary_until')
+        replica_router.init_app(app, uris=['mysql+pymysql://replica/'], pin_period=10)
+
+        class MonitorApi(MethodView):
+            decorators = [replica_router.read_only]
+
+        class SubmitApi(MethodView):
+            decorators = [replica_router.writes]
+
+    Also:
+    ------
+        Replicas are added to SQLALCHEMY_BINDS as replica_0, replica_1, ...
+        While read only view is handled, db.session selects and
+        db.get_read_engine() use one random replica, flushes, INSERT, UPDATE
+        and DELETE always go to primary. Streamed responses of the view read
+        from the same replica while they are sent.
+        Views which write set cookie {cookie}=<timestamp>, so reads of the same
+        client go to primary for pin_period seconds and see their writes,
+        clients without cookies can send X-Read-Primary header instead.
+        Until init_app is called with replicas, everything is read from primary
+    """
+    def __init__(self, cookie='db_primary_until'):
+        self.cookie = cookie
+        self.binds = []
+        self.pin_period = None
+
+    def init_app(self, app, uris: List[str] = None, pin_period=10):
+        """ Should be called before db.init_app """
+        self.pin_period = pin_period
+        self.binds = [f'replica_{i}' for i in range(len(uris or []))]
+        if self.binds:
+            binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+            binds.update(zip(self.binds, uris))
+            app.config['SQLALCHEMY_BINDS'] = binds
+
+    def read_only(self, func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if not self.binds or self.is_pinned():
+                return func(*args, **kwargs)
+
+            bind = random.choice(self.binds)
+            setattr(g, REPLICA_BIND_ATTR, bind)
+            try:
+                response = func(*args, **kwargs)
+            finally:
+                g.pop(REPLICA_BIND_ATTR, None)
+
+            if isinstance(response, Response) and response.is_streamed:
+                response.response = self._stream_with_bind(response.response, bind)
+            return response
+        return wrapped
+
+    @staticmethod
+    def _stream_with_bind(chunks: Iterable, bind: str) -> Iterator:
+        """ Body is generated after the view returned, in new app context,
+            so the bind is set again for it
+        """
+        def generate():
+            setattr(g, REPLICA_BIND_ATTR, bind)
+            try:
+                yield from chunks
+            finally:
+                g.pop(REPLICA_BIND_ATTR, None)
+
+        return stream_with_context(generate())
+
+    def writes(self, func):
+        @functools.wraps(func)
+        def wrapped(*args, **kwargs):
+            if self.binds:
+                @after_this_request
+                def pin(response):
+                    response.set_cookie(self.cookie, str(int(time.time() + self.pin_period)),
+                                        max_age=self.pin_period)
+                    return response
+            return func(*args, **kwargs)
+        return wrapped
+
+    def is_pinned(self) -> bool:
+        if request.headers.get(PRIMARY_HEADER):
+            return True
+        try:
+            return int(request.cookies.get(self.cookie, 0)) > time.time()
+        except ValueError:
+            return False
+
+    @staticmethod
+    def get_bind() -> Optional[str]:
+        """ Bind key of replica to read from or None for primary """
+        return g.get(REPLICA_BIND_ATTR) if has_app_context() else None
@@ -1,4 +1,7 @@
-from flask import jsonify as flask_jsonify
+import zipfile
+from typing import Iterable, Tuple
+
+from flask import jsonify as flask_jsonify, Response, stream_with_context
 
 
 def jsonify(data, status_code=200):
@@ -13,3 +16,52 @@ def jsonify(data, status_code=200):
         response['status'] = 'error'
 
     return flask_jsonify(response), status_code
+
+
+def jsonify_stream(data_chunks: Iterable[str]) -> Response:
+    """ Same envelope as jsonify(data) but body is sent chunk by chunk
+        data_chunks should yield already json encoded pieces of data
+    """
+    def generate():
+        yield '{"data": '
+        yield from data_chunks
+        yield ', "status": "success", "status_code": 200}'
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/json')
+
+
+class _ZipStream:
+    """ Unseekable file for ZipFile, written data is taken by pop """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_stream(files: Iterable[Tuple[str, bytes]], filename: str = 'archive.zip') -> Response:
+    """ Zip archive of (name, data) files, every file is sent as soon as it is compressed """
+    def generate():
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for name, data in files:
+                archive.writestr(name, data)
+                yield stream.pop()
+        yield stream.pop()
+
+    return Response(stream_with_context(generate()), status=200, mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
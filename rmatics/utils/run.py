@@ -49,7 +49,7 @@ _str_code_status_map = {
     "SK": EjudgeStatuses.SKIPPED.value,
 }
 
-_status_map_str = {v: k for k, v in _str_code_status_map}
+_status_map_str = {v: k for k, v in _str_code_status_map.items()}
 
 def get_status_from_string_code(code: str):
     if code in _str_code_status_map:
@@ -0,0 +1,171 @@
+import json
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+from dateutil.tz import UTC
+from sqlalchemy import select, true
+
+from rmatics.model.base import db
+from rmatics.model.run import LightWeightRun
+from rmatics.utils.run import EjudgeStatuses
+
+BUILT_FIELD = '_built'
+
+
+def summarize_runs(runs: Iterable) -> dict:
+    """ Reduce runs of one user for one problem (ordered by id) to
+        attempts before first OK, best score, its status and time of first OK
+    """
+    summary = {
+        'attempts': 0,
+        'score': None,
+        'status': None,
+        'first_ok_time': None,
+    }
+    last_status = None
+    for run in runs:
+        summary['attempts'] += 1
+        last_status = run[LightWeightRun.c.ej_status]
+
+        score = run[LightWeightRun.c.ej_score]
+        if score is not None and (summary['score'] is None or score > summary['score']):
+            summary['score'] = score
+            summary['status'] = last_status
+
+        if last_status == EjudgeStatuses.OK.value:
+            create_time = run[LightWeightRun.c.create_time].replace(tzinfo=UTC)
+            summary['first_ok_time'] = int(create_time.timestamp())
+            break
+
+    if summary['score'] is None:
+        summary['status'] = last_status
+
+    return summary
+
+
+class StandingsAggregator:
+    """ Per-problem per-user summary of visible runs kept in Redis hashes
+
+    Usage:
+    ------
+        standings = StandingsAggregator(prefix='standings')
+        standings.init_app(redis, period=60*60)
+
+        # Summaries of problem are built from DB on first request
+        data = standings.get([problem_id], user_ids=[1, 2])
+        # and then only user's summary is recomputed when user's run is changed
+        standings.update(problem_id, user_id)
+
+    Also:
+    ------
+        Hash {prefix}/{problem_id} maps user_id to json summary.
+        Updates are written even if hash is not built yet and
+        building never overwrites them (HSETNX), so summary updated
+        while problem is being built is not lost.
+        Users without runs are kept with zero attempts and skipped on read.
+    """
+    def __init__(self, prefix='standings'):
+        self.prefix = prefix
+        self.store = None
+        self.period = None
+
+    def init_app(self, store, period=60*60):
+        self.store = store
+        self.period = period
+
+    def get(self, problem_ids: List[int], user_ids: List[int] = None) -> Dict[int, Dict[int, dict]]:
+        problem_ids = list(OrderedDict.fromkeys(problem_ids))
+
+        pipeline = self.store.pipeline(transaction=False)
+        for problem_id in problem_ids:
+            key = self._get_key(problem_id)
+            if user_ids is None:
+                pipeline.hgetall(key)
+            else:
+                pipeline.hmget(key, [BUILT_FIELD, *user_ids])
+        results = pipeline.execute()
+
+        problem_standings = OrderedDict()
+        not_built = []
+        for problem_id, result in zip(problem_ids, results):
+            if user_ids is None:
+                result = {field.decode(): value for field, value in result.items()}
+            else:
+                result = dict(zip([BUILT_FIELD, *map(str, user_ids)], result))
+
+            if not result.pop(BUILT_FIELD, None):
+                not_built.append(problem_id)
+                continue
+            problem_standings[problem_id] = self._load(result)
+
+        if not_built:
+            built_standings = self._build(not_built)
+            for problem_id in not_built:
+                summaries = built_standings.get(problem_id, {})
+                if user_ids is not None:
+                    summaries = {user_id: summaries[user_id] for user_id in user_ids if user_id in summaries}
+                problem_standings[problem_id] = summaries
+
+        return OrderedDict((problem_id, problem_standings[problem_id]) for problem_id in problem_ids)
+
+    def update(self, problem_id: int, user_id: int):
+        """ Recompute summary of one user for one problem """
+        query = self._build_query([problem_id]).where(LightWeightRun.c.user_id == user_id)
+        conn = db.engine.connect()
+        summary = summarize_runs(conn.execute(query))
+
+        key = self._get_key(problem_id)
+        pipeline = self.store.pipeline(transaction=True)
+        pipeline.hset(key, str(user_id), json.dumps(summary))
+        pipeline.expire(key, self.period)
+        pipeline.execute()
+
+    def _build(self, problem_ids: List[int]) -> Dict[int, Dict[int, dict]]:
+        conn = db.get_read_engine().connect()
+        rows = conn.execute(self._build_query(problem_ids))
+
+        user_runs = OrderedDict()
+        for run in rows:
+            problem_user = (run[LightWeightRun.c.problem_id], run[LightWeightRun.c.user_id])
+            user_runs.setdefault(problem_user, []).append(run)
+
+        problem_standings = {}
+        for (problem_id, user_id), runs in user_runs.items():
+            problem_standings.setdefault(problem_id, {})[user_id] = summarize_runs(runs)
+
+        pipeline = self.store.pipeline(transaction=True)
+        for problem_id in problem_ids:
+            key = self._get_key(problem_id)
+            for user_id, summary in problem_standings.get(problem_id, {}).items():
+                pipeline.hsetnx(key, str(user_id), json.dumps(summary))
+            pipeline.hset(key, BUILT_FIELD, 1)
+            pipeline.expire(key, self.period)
+        pipeline.execute()
+
+        return problem_standings
+
+    @staticmethod
+    def _build_query(problem_ids: List[int]):
+        return select([LightWeightRun.c.problem_id,
+                       LightWeightRun.c.user_id,
+                       LightWeightRun.c.id,
+                       LightWeightRun.c.create_time,
+                       LightWeightRun.c.ej_score,
+                       LightWeightRun.c.ej_status]) \
+            .where(LightWeightRun.c.problem_id.in_(problem_ids)) \
+            .where(LightWeightRun.c.is_visible == true()) \
+            .order_by(LightWeightRun.c.problem_id, LightWeightRun.c.user_id, LightWeightRun.c.id)
+
+    @staticmethod
+    def _load(result: Dict[str, bytes]) -> Dict[int, dict]:
+        summaries = {}
+        for user_id, summary in result.items():
+            if summary is None:
+                continue
+            summary = json.loads(summary)
+            if summary['attempts']:
+                summaries[int(user_id)] = summary
+        return summaries
+
+    def _get_key(self, problem_id: int) -> str:
+        return f'{self.prefix}/{problem_id}'
@@ -1,85 +1,392 @@
+import bisect
 import datetime
 import json
 from collections import namedtuple, OrderedDict
-from typing import Iterable, Tuple, Optional
+from typing import Iterable, Iterator, Tuple, Optional, List, Dict
 
 from dateutil.tz import UTC
-from flask import request
+from flask import request, current_app
 from flask.views import MethodView
-from marshmallow import fields
+from marshmallow import fields, validate
 from sqlalchemy import select, true
 from webargs.flaskparser import parser
+from werkzeug.exceptions import BadRequest, NotFound
 
 from rmatics import db, monitor_cacher
+from rmatics.plugins import replica_router, standings_aggregator
 from rmatics.model import SimpleUser, UserGroup, CourseModule, Statement, MonitorCourseModule
 from rmatics.model.monitor import MonitorStatement, Monitor
+from rmatics.model.monitor_run import MonitorRun
 from rmatics.model.run import LightWeightRun
 from rmatics.model.user import LightWeightUser
-from rmatics.utils.response import jsonify
+from rmatics.utils.response import jsonify, jsonify_stream
 from rmatics.view import get_problems_by_statement_id
 from rmatics.view.monitors.serializers.monitor import ContestBasedMonitorSchema, \
-    ProblemBasedMonitorSchema
+    ProblemBasedMonitorSchema, ProblemStandingsMonitorSchema, ProblemSchema, \
+    ContestBasedColumnarMonitorSchema, ProblemBasedColumnarMonitorSchema
 
 ContestBasedMonitorData = namedtuple('ContestBasedMonitorData', ('contest_id', 'problem', 'runs'))
 ProblemBasedMonitorData = namedtuple('ProblemBasedMonitorData', ('problem_id', 'runs'))
+ProblemStandingsMonitorData = namedtuple('ProblemStandingsMonitorData', ('problem_id', 'users'))
 
+# How many runs are encoded into one chunk of streamed response
+STREAM_CHUNK_SIZE = 500
 
-@monitor_cacher
-def get_runs(problem_id: int = None, user_ids: Iterable = None,
-             time_after: int = None, time_before: int = None,
-             context_id: int = None, context_source: int = None, show_hidden: bool = False):
-    """ We are using SQLAlchemy Сore to speedup multiply object fetching and serializing """
+COLUMNAR_FORMAT = 'columnar'
+COLUMNAR_VALUE_FIELDS = ('id', 'create_time', 'ejudge_score', 'ejudge_status', 'ejudge_test_num')
+COLUMNAR_RUN_FIELDS = ('user', *COLUMNAR_VALUE_FIELDS)
+
+
+def _from_projection() -> bool:
+    return bool(current_app.config.get('MONITOR_RUNS_FROM_PROJECTION'))
 
-    query = select([LightWeightRun, LightWeightUser]) \
+
+def _runs_table():
+    return MonitorRun if _from_projection() else LightWeightRun
+
+
+def _select_runs():
+    if _from_projection():
+        return select([MonitorRun])
+    return select([LightWeightRun, LightWeightUser]) \
         .select_from(LightWeightRun.join(LightWeightUser, LightWeightRun.c.user_id == LightWeightUser.c.id))
 
-    if problem_id is not None:
-        query = query.where(LightWeightRun.c.problem_id == problem_id)
+
+def _build_runs_query(problem_ids: Iterable = None, user_ids: Iterable = None,
+                      time_after: int = None, time_before: int = None,
+                      context_id: int = None, context_source: int = None, show_hidden: bool = False):
+    query = _select_runs()
+    runs = _runs_table()
+
+    if problem_ids is not None:
+        query = query.where(runs.c.problem_id.in_(problem_ids))
 
     if user_ids is not None:
-        query = query.where(LightWeightRun.c.user_id.in_(user_ids))
+        query = query.where(runs.c.user_id.in_(user_ids))
 
     if time_after is not None:
         time_after = datetime.datetime.fromtimestamp(time_after)
-        query = query.where(LightWeightRun.c.create_time > time_after)
+        query = query.where(runs.c.create_time > time_after)
     if time_before is not None:
         time_before = datetime.datetime.fromtimestamp(time_before)
-        query = query.where(LightWeightRun.c.create_time < time_before)
+        query = query.where(runs.c.create_time < time_before)
 
     # apply context filters
     if context_id is not None:
-        query = query.where(LightWeightRun.c.statement_id == context_id)
+        query = query.where(runs.c.statement_id == context_id)
     if context_source is not None:
-        query = query.where(LightWeightRun.c.context_source == context_source)
+        query = query.where(runs.c.context_source == context_source)
     if show_hidden is False:
-        query = query.where(LightWeightRun.c.is_visible == true())
-
-    query = query.order_by(LightWeightRun.c.id)
-
-    conn = db.engine.connect()
-    result = conn.execute(query)
-
-    data = [
-        {
-            'id': run[LightWeightRun.c.id],
-            'user': {
-                'id': run[LightWeightUser.c.id],
-                'firstname': run[LightWeightUser.c.firstname],
-                'lastname': run[LightWeightUser.c.lastname],
-                'username': run[LightWeightUser.c.username],
-                'email': run[LightWeightUser.c.email]
-            },
-            'problem_id': run[LightWeightRun.c.problem_id],
-            'create_time': run[LightWeightRun.c.create_time].replace(tzinfo=UTC).strftime('%Y-%m-%dT%H:%M:%S%z'),
-            'ejudge_score': run[LightWeightRun.c.ej_score],
-            'ejudge_status': run[LightWeightRun.c.ej_status],
-            'ejudge_test_num': run[LightWeightRun.c.ej_test_num],
-        }
-        for run in result]
+        query = query.where(runs.c.is_visible == true())
+
+    return query.order_by(runs.c.id)
+
+
+# Columns of monitor_runs by columns of runs and mdl_user they are copied from
+PROJECTION_COLUMNS = {
+    **{column: MonitorRun.c[column.name] for column in LightWeightRun.c},
+    **{column: MonitorRun.c[column.name] for column in LightWeightUser.c if column.name != 'id'},
+    LightWeightUser.c.id: MonitorRun.c.user_id,
+}
+
+
+class _ProjectedRun:
+    """ monitor_runs row which is read by runs and mdl_user columns as _select_runs rows are """
+    __slots__ = ('row', )
+
+    def __init__(self, row):
+        self.row = row
+
+    def __getitem__(self, column):
+        return self.row[PROJECTION_COLUMNS[column]]
+
+
+def _execute_runs(conn, query, **execution_options) -> Iterable:
+    result = conn.execution_options(**execution_options).execute(query)
+    if _from_projection():
+        return map(_ProjectedRun, result)
+    return result
+
+
+def _serialize_run(run) -> dict:
+    return {
+        'id': run[LightWeightRun.c.id],
+        'user': {
+            'id': run[LightWeightUser.c.id],
+            'firstname': run[LightWeightUser.c.firstname],
+            'lastname': run[LightWeightUser.c.lastname],
+            'username': run[LightWeightUser.c.username],
+            'email': run[LightWeightUser.c.email]
+        },
+        'problem_id': run[LightWeightRun.c.problem_id],
+        'create_time': run[LightWeightRun.c.create_time].replace(tzinfo=UTC).strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'ejudge_score': run[LightWeightRun.c.ej_score],
+        'ejudge_status': run[LightWeightRun.c.ej_status],
+        'ejudge_test_num': run[LightWeightRun.c.ej_test_num],
+    }
+
+
+@monitor_cacher
+def get_runs(problem_id: int = None, user_ids: Iterable = None,
+             time_after: int = None, time_before: int = None,
+             context_id: int = None, context_source: int = None, show_hidden: bool = False):
+    """ We are using SQLAlchemy Сore to speedup multiply object fetching and serializing """
+    problem_ids = [problem_id] if problem_id is not None else None
+    query = _build_runs_query(problem_ids, user_ids, time_after, time_before,
+                              context_id, context_source, show_hidden)
+
+    conn = db.get_read_engine().connect()
+    result = _execute_runs(conn, query)
+
+    data = [_serialize_run(run) for run in result]
 
     return data
 
 
+def _serialize_runs(rows) -> list:
+    return [_serialize_run(run) for run in rows]
+
+
+def _build_columnar(runs_values: Iterable[tuple]) -> dict:
+    """ runs_values are (user, id, create_time, ejudge_score, ejudge_status, ejudge_test_num) """
+    columnar = {'users': [], **{field: [] for field in COLUMNAR_RUN_FIELDS}}
+    user_indexes = {}
+    for user, *values in runs_values:
+        user_index = user_indexes.get(user['id'])
+        if user_index is None:
+            user_index = user_indexes[user['id']] = len(columnar['users'])
+            columnar['users'].append(user)
+
+        columnar['user'].append(user_index)
+        for field, value in zip(COLUMNAR_VALUE_FIELDS, values):
+            columnar[field].append(value)
+    return columnar
+
+
+def _columnar_runs(rows) -> dict:
+    def values(run):
+        user = {
+            'id': run[LightWeightUser.c.id],
+            'firstname': run[LightWeightUser.c.firstname],
+            'lastname': run[LightWeightUser.c.lastname],
+            'username': run[LightWeightUser.c.username],
+            'email': run[LightWeightUser.c.email]
+        }
+        create_time = run[LightWeightRun.c.create_time].replace(tzinfo=UTC)
+        return (user,
+                run[LightWeightRun.c.id],
+                int(create_time.timestamp()),
+                run[LightWeightRun.c.ej_score],
+                run[LightWeightRun.c.ej_status],
+                run[LightWeightRun.c.ej_test_num])
+
+    return _build_columnar(map(values, rows))
+
+
+def to_columnar(runs: Iterable[dict]) -> dict:
+    """ Compact form of get_runs result:
+        every user is stored once in users table and runs are stored
+        as parallel arrays, where user is index in users table
+        and create_time is epoch seconds
+    """
+    def values(run):
+        create_time = datetime.datetime.strptime(run['create_time'], '%Y-%m-%dT%H:%M:%S%z')
+        return (run['user'],
+                run['id'],
+                int(create_time.timestamp()),
+                run['ejudge_score'],
+                run['ejudge_status'],
+                run['ejudge_test_num'])
+
+    return _build_columnar(map(values, runs))
+
+
+def from_columnar(columnar: dict, problem_id: int) -> list:
+    """ Restores get_runs result from to_columnar one """
+    runs = []
+    for i, user_index in enumerate(columnar['user']):
+        create_time = datetime.datetime.fromtimestamp(columnar['create_time'][i], UTC)
+        runs.append({
+            'id': columnar['id'][i],
+            'user': columnar['users'][user_index],
+            'problem_id': problem_id,
+            'create_time': create_time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'ejudge_score': columnar['ejudge_score'][i],
+            'ejudge_status': columnar['ejudge_status'][i],
+            'ejudge_test_num': columnar['ejudge_test_num'][i],
+        })
+    return runs
+
+
+@monitor_cacher
+def get_columnar_runs(problem_id: int = None, user_ids: Iterable = None,
+                      time_after: int = None, time_before: int = None,
+                      context_id: int = None, context_source: int = None, show_hidden: bool = False):
+    """ Same as get_runs but in to_columnar form, which is cached as is """
+    problem_ids = [problem_id] if problem_id is not None else None
+    query = _build_runs_query(problem_ids, user_ids, time_after, time_before,
+                              context_id, context_source, show_hidden)
+
+    conn = db.get_read_engine().connect()
+    return _columnar_runs(_execute_runs(conn, query))
+
+
+def get_runs_by_problems(problem_ids: List[int], chunk_size: int = None,
+                         columnar: bool = False, **kwargs) -> Dict[int, list]:
+    """ Same as get_runs (or get_columnar_runs if columnar) but for many problems at once
+
+        Runs of all problems are fetched by one query (or by one query
+        per chunk_size problems) and split by problem_id in Python
+    """
+    if chunk_size is None:
+        chunk_size = current_app.config.get('MONITOR_BATCH_CHUNK_SIZE', 50)
+
+    problem_rows = OrderedDict((problem_id, []) for problem_id in problem_ids)
+    problem_ids = list(problem_rows.keys())
+
+    conn = db.get_read_engine().connect()
+    for i in range(0, len(problem_ids), chunk_size):
+        chunk = problem_ids[i:i + chunk_size]
+        query = _build_runs_query(chunk, **kwargs)
+        for run in _execute_runs(conn, query):
+            problem_rows[run[LightWeightRun.c.problem_id]].append(run)
+
+    serialize = _columnar_runs if columnar else _serialize_runs
+    return OrderedDict((problem_id, serialize(rows)) for problem_id, rows in problem_rows.items())
+
+
+def get_cached_runs_by_problems(problem_ids: List[int], columnar: bool = False, **kwargs) -> Dict[int, list]:
+    """ Batch get_runs (or get_columnar_runs): reads and fills the same per-problem cache entries,
+        but runs of all missed problems are fetched by get_runs_by_problems
+    """
+    list_of_kwargs = [dict(kwargs, problem_id=problem_id) for problem_id in problem_ids]
+
+    def batch_func(missed_kwargs: List[dict]) -> list:
+        missed_problem_ids = [kw['problem_id'] for kw in missed_kwargs]
+        problem_runs = get_runs_by_problems(missed_problem_ids, columnar=columnar, **kwargs)
+        return [problem_runs[problem_id] for problem_id in missed_problem_ids]
+
+    func = get_columnar_runs if columnar else get_runs
+    results = monitor_cacher.get_many(func, list_of_kwargs, batch_func=batch_func)
+    return dict(zip(problem_ids, results))
+
+
+def iter_runs(problem_id: int = None, **kwargs) -> Iterator[dict]:
+    """ Same as get_runs(cache=False) but runs are yielded one by one
+        from server-side cursor, so they are never all in memory
+    """
+    problem_ids = [problem_id] if problem_id is not None else None
+    query = _build_runs_query(problem_ids, **kwargs)
+
+    conn = db.get_read_engine().connect()
+    try:
+        for run in _execute_runs(conn, query, stream_results=True):
+            yield _serialize_run(run)
+    finally:
+        conn.close()
+
+
+def stream_monitor_data(items: Iterable[Tuple[dict, Iterable[dict]]],
+                        chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[str]:
+    """ Lazily encodes [dict(item_fields, runs=list(runs)) for item_fields, runs in items]
+        to json; runs are encoded by chunk_size at once
+    """
+    yield '['
+    for i, (item_fields, runs) in enumerate(items):
+        head = json.dumps(item_fields)[:-1]
+        separator = ', ' if item_fields else ''
+        yield f'{", " if i else ""}{head}{separator}"runs": ['
+
+        chunk = []
+        is_first_chunk = True
+        for run in runs:
+            chunk.append(json.dumps(run))
+            if len(chunk) >= chunk_size:
+                yield ('' if is_first_chunk else ', ') + ', '.join(chunk)
+                chunk = []
+                is_first_chunk = False
+        if chunk:
+            yield ('' if is_first_chunk else ', ') + ', '.join(chunk)
+
+        yield ']}'
+    yield ']'
+
+
+def get_monitor_run(run_id: int):
+    """ Returns run row in the same shape as get_runs selects it or None """
+    query = _select_runs().where(_runs_table().c.id == run_id)
+
+    conn = db.get_read_engine().connect()
+    run = conn.execute(query).first()
+    if run is not None and _from_projection():
+        return _ProjectedRun(run)
+    return run
+
+
+def _run_matches(run, problem_id: int = None, user_ids: Iterable = None,
+                 time_after: int = None, time_before: int = None,
+                 context_id: int = None, context_source: int = None, show_hidden: bool = False) -> bool:
+    """ Checks run row by the same filters as _build_runs_query """
+    if problem_id is not None and run[LightWeightRun.c.problem_id] != problem_id:
+        return False
+    if user_ids is not None and run[LightWeightRun.c.user_id] not in user_ids:
+        return False
+
+    create_time = run[LightWeightRun.c.create_time]
+    if time_after is not None and not create_time > datetime.datetime.fromtimestamp(time_after):
+        return False
+    if time_before is not None and not create_time < datetime.datetime.fromtimestamp(time_before):
+        return False
+
+    if context_id is not None and run[LightWeightRun.c.statement_id] != context_id:
+        return False
+    if context_source is not None and run[LightWeightRun.c.context_source] != context_source:
+        return False
+    if show_hidden is False and not run[LightWeightRun.c.is_visible]:
+        return False
+
+    return True
+
+
+def patch_runs(runs: list, run, **kwargs) -> Optional[list]:
+    """ Apply run row to cached get_runs(**kwargs) result:
+        insert or replace it by id if it matches filters, remove it otherwise
+
+        Returns None if result can't be patched
+    """
+    # Cache key is the same for show_hidden=None and missing show_hidden (False),
+    # so we can't tell if hidden run should be there
+    if 'show_hidden' not in kwargs and not run[LightWeightRun.c.is_visible]:
+        return None
+
+    run_id = run[LightWeightRun.c.id]
+    runs = [r for r in runs if r['id'] != run_id]
+
+    if _run_matches(run, **kwargs):
+        index = bisect.bisect([r['id'] for r in runs], run_id)
+        runs.insert(index, _serialize_run(run))
+
+    return runs
+
+
+def patch_columnar_runs(columnar: dict, run, **kwargs) -> Optional[dict]:
+    """ patch_runs for cached get_columnar_runs(**kwargs) result """
+    runs = patch_runs(from_columnar(columnar, kwargs.get('problem_id')), run, **kwargs)
+    if runs is None:
+        return None
+    return to_columnar(runs)
+
+
+def _is_columnar(args: dict) -> bool:
+    if args['format'] != COLUMNAR_FORMAT:
+        return False
+    if not current_app.config.get('MONITOR_COLUMNAR_FORMAT'):
+        raise BadRequest('Columnar format is disabled')
+    if args['stream']:
+        raise BadRequest('Columnar format can not be streamed')
+    return True
+
+
 contest_based_get_args = {
     'group_id': fields.Integer(missing=None),
     'contest_id': fields.List(fields.Integer(), required=True),
@@ -89,10 +396,17 @@ contest_based_get_args = {
     # Internal context scope arguments
     'context_source': fields.Integer(required=False),
     'show_hidden': fields.Boolean(required=False, missing=False),
+
+    # Send runs from server-side cursor chunk by chunk, bypassing cache
+    'stream': fields.Boolean(missing=False),
+    # Return runs of every problem in to_columnar form
+    'format': fields.String(missing=None, validate=validate.OneOf([COLUMNAR_FORMAT])),
 }
 
 
 class ContestBasedMonitorAPIView(MethodView):
+    decorators = [replica_router.read_only]
+
     def get(self):
         args = parser.parse(contest_based_get_args, request)
         group_id = args['group_id']
@@ -121,6 +435,7 @@ class ContestBasedMonitorAPIView(MethodView):
         # Context arguments
         context_source = args.get('context_source')
         show_hidden = args.get('show_hidden')
+        columnar = _is_columnar(args)
 
         contest_ids = []
         for cm_id in course_module_ids:
@@ -132,20 +447,53 @@ class ContestBasedMonitorAPIView(MethodView):
         for contest_id in contest_ids:
             contest_problems[contest_id] = get_problems_by_statement_id(contest_id)
 
+        if args['stream']:
+            problem_schema = ProblemSchema()
+            items = (
+                ({'contest_id': contest_id, 'problem': problem_schema.dump(problem).data},
+                 iter_runs(problem_id=problem.id,
+                           user_ids=user_ids,
+                           time_before=time_before,
+                           time_after=time_after,
+                           context_source=context_source,
+                           show_hidden=show_hidden))
+                for contest_id, problems in contest_problems.items()
+                for problem in problems
+            )
+            return jsonify_stream(stream_monitor_data(items))
+
         contest_problems_runs = []
-        for contest_id, problems in contest_problems.items():
-            for problem in problems:
-                runs = get_runs(problem_id=problem.id,
-                                user_ids=user_ids,
-                                time_before=time_before,
-                                time_after=time_after,
-                                context_source=context_source,
-                                show_hidden=show_hidden
-                                )
-                monitor_data = ContestBasedMonitorData(contest_id, problem, runs)
-                contest_problems_runs.append(monitor_data)
-
-        schema = ContestBasedMonitorSchema(many=True)
+        if current_app.config.get('MONITOR_BATCH_FETCH'):
+            problem_ids = [problem.id for problems in contest_problems.values() for problem in problems]
+            problem_runs = get_cached_runs_by_problems(problem_ids,
+                                                       columnar=columnar,
+                                                       user_ids=user_ids,
+                                                       time_before=time_before,
+                                                       time_after=time_after,
+                                                       context_source=context_source,
+                                                       show_hidden=show_hidden)
+            for contest_id, problems in contest_problems.items():
+                for problem in problems:
+                    monitor_data = ContestBasedMonitorData(contest_id, problem, problem_runs[problem.id])
+                    contest_problems_runs.append(monitor_data)
+        else:
+            runs_func = get_columnar_runs if columnar else get_runs
+            for contest_id, problems in contest_problems.items():
+                for problem in problems:
+                    runs = runs_func(problem_id=problem.id,
+                                     user_ids=user_ids,
+                                     time_before=time_before,
+                                     time_after=time_after,
+                                     context_source=context_source,
+                                     show_hidden=show_hidden
+                                     )
+                    monitor_data = ContestBasedMonitorData(contest_id, problem, runs)
+                    contest_problems_runs.append(monitor_data)
+
+        if columnar:
+            schema = ContestBasedColumnarMonitorSchema(many=True)
+        else:
+            schema = ContestBasedMonitorSchema(many=True)
 
         response = schema.dump(contest_problems_runs)
 
@@ -198,6 +546,11 @@ problem_based_get_args = {
     'context_id': fields.Integer(required=False),
     'context_source': fields.Integer(required=False),
     'show_hidden': fields.Boolean(required=False),
+
+    # Send runs from server-side cursor chunk by chunk, bypassing cache
+    'stream': fields.Boolean(missing=False),
+    # Return runs of every problem in to_columnar form
+    'format': fields.String(missing=None, validate=validate.OneOf([COLUMNAR_FORMAT])),
 }
 
 
@@ -206,6 +559,8 @@ class ProblemBasedMonitorAPIView(MethodView):
         We would like avoid Contests and MonitorStatements and Groups here
     """
 
+    decorators = [replica_router.read_only]
+
     def get(self):
         args = parser.parse(problem_based_get_args, request)
 
@@ -222,23 +577,97 @@ class ProblemBasedMonitorAPIView(MethodView):
         context_id = args.get('context_id')
         context_source = args.get('context_source')
         show_hidden = args.get('show_hidden')
+        columnar = _is_columnar(args)
+
+        if args['stream']:
+            items = (
+                ({'problem_id': problem_id},
+                 iter_runs(problem_id=problem_id,
+                           user_ids=user_ids,
+                           time_before=time_before,
+                           time_after=time_after,
+                           context_id=context_id,
+                           context_source=context_source,
+                           show_hidden=show_hidden))
+                for problem_id in problem_ids
+            )
+            return jsonify_stream(stream_monitor_data(items))
 
         problem_runs = []
-        for problem_id in problem_ids:
-            runs = get_runs(problem_id=problem_id,
-                            user_ids=user_ids,
-                            time_before=time_before,
-                            time_after=time_after,
-
-                            context_id=context_id,
-                            context_source=context_source,
-                            show_hidden=show_hidden, )
-            problem_runs.append(ProblemBasedMonitorData(problem_id, runs))
-
-        schema = ProblemBasedMonitorSchema(many=True)
+        if current_app.config.get('MONITOR_BATCH_FETCH'):
+            runs_by_problem = get_cached_runs_by_problems(problem_ids,
+                                                          columnar=columnar,
+                                                          user_ids=user_ids,
+                                                          time_before=time_before,
+                                                          time_after=time_after,
+
+                                                          context_id=context_id,
+                                                          context_source=context_source,
+                                                          show_hidden=show_hidden)
+            for problem_id in problem_ids:
+                problem_runs.append(ProblemBasedMonitorData(problem_id, runs_by_problem[problem_id]))
+        else:
+            runs_func = get_columnar_runs if columnar else get_runs
+            for problem_id in problem_ids:
+                runs = runs_func(problem_id=problem_id,
+                                 user_ids=user_ids,
+                                 time_before=time_before,
+                                 time_after=time_after,
+
+                                 context_id=context_id,
+                                 context_source=context_source,
+                                 show_hidden=show_hidden, )
+                problem_runs.append(ProblemBasedMonitorData(problem_id, runs))
+
+        if columnar:
+            schema = ProblemBasedColumnarMonitorSchema(many=True)
+        else:
+            schema = ProblemBasedMonitorSchema(many=True)
         problem_runs = schema.dump(problem_runs)
 
         # We have to commit session because we may created cache_meta
         db.session.commit()
 
         return jsonify(problem_runs.data)
+
+
+problem_standings_get_args = {
+    'user_id': fields.List(fields.Integer(), missing=None),
+    'uid': fields.List(fields.Integer(), missing=None),
+    'problem_id': fields.List(fields.Integer(), missing=None),
+    'pid': fields.List(fields.Integer(), missing=None),
+}
+
+
+class ProblemStandingsMonitorAPIView(MethodView):
+    """ Compact version of ProblemBasedMonitorAPIView
+        Instead of all runs returns summary for every user:
+        attempts, best score and its status, time of first OK
+        Summaries are counted by visible runs, time and context filters are not supported
+    """
+
+    decorators = [replica_router.read_only]
+
+    def get(self):
+        if not current_app.config.get('MONITOR_STANDINGS'):
+            raise NotFound('Problem standings are disabled')
+
+        args = parser.parse(problem_standings_get_args, request)
+
+        user_ids = args['user_id']
+        if not user_ids:
+            user_ids = args['uid']
+        problem_ids = args['problem_id']
+        if not problem_ids:
+            problem_ids = args['pid']
+        if not problem_ids:
+            raise BadRequest('You must specify problem_id')
+
+        standings = standings_aggregator.get(problem_ids, user_ids=user_ids)
+        problem_standings = [ProblemStandingsMonitorData(problem_id, users)
+                             for problem_id, users in standings.items()]
+
+        schema = ProblemStandingsMonitorSchema(many=True)
+        problem_standings = schema.dump(problem_standings)
+
+        return jsonify(problem_standings.data)
@@ -1,6 +1,7 @@
 from flask import Blueprint
 
-from rmatics.view.monitors.monitor import ContestBasedMonitorAPIView, ProblemBasedMonitorAPIView
+from rmatics.view.monitors.monitor import ContestBasedMonitorAPIView, ProblemBasedMonitorAPIView, \
+    ProblemStandingsMonitorAPIView
 
 monitor_blueprint = Blueprint('monitor', __name__, url_prefix='/monitor')
 
@@ -10,3 +11,6 @@ monitor_blueprint.add_url_rule('/', methods=('GET', 'POST'),
 
 monitor_blueprint.add_url_rule('/problem_monitor', methods=('GET', ),
                                view_func=ProblemBasedMonitorAPIView.as_view('problem_monitor'))
+
+monitor_blueprint.add_url_rule('/problem_standings', methods=('GET', ),
+                               view_func=ProblemStandingsMonitorAPIView.as_view('problem_standings'))
@@ -27,3 +27,16 @@ class ContestBasedMonitorSchema(Schema):
 class ProblemBasedMonitorSchema(Schema):
     problem_id = fields.Integer(dump_only=True)
     runs = fields.List(fields.Dict(), dump_only=True)
+
+
+class ContestBasedColumnarMonitorSchema(ContestBasedMonitorSchema):
+    runs = fields.Dict(dump_only=True)
+
+
+class ProblemBasedColumnarMonitorSchema(ProblemBasedMonitorSchema):
+    runs = fields.Dict(dump_only=True)
+
+
+class ProblemStandingsMonitorSchema(Schema):
+    problem_id = fields.Integer(dump_only=True)
+    users = fields.Dict(dump_only=True)
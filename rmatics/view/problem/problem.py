@@ -1,36 +1,56 @@
+import binascii
 import datetime
+import hashlib
+import json
+from collections import Counter, defaultdict, deque
+from typing import Optional
 
 import base64
+from celery import group
 from flask import (
     current_app,
     request,
 )
 from flask import jsonify as flask_jsonify
 from flask.views import MethodView
-from marshmallow import fields
-from sqlalchemy import desc, true
+from marshmallow import fields, validate
+from marshmallow.utils import isoformat
+from redis import exceptions as redis_exceptions
+from sqlalchemy import desc, true, select, func
 from sqlalchemy.orm import Load
+from webargs import fields as webargs_fields
 from webargs.flaskparser import parser
-from werkzeug.exceptions import BadRequest, NotFound
+from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
 
 from rmatics.ejudge.submit_queue.task import (
     submit_task,
 )
 
 from rmatics.model import CourseModule
-from rmatics.model.base import db
+from rmatics.model.base import db, mongo, redis
 from rmatics.model.group import UserGroup
+from rmatics.model.monitor_run import sync_monitor_runs
 from rmatics.model.problem import Problem, EjudgeProblem
-from rmatics.model.run import Run
+from rmatics.model.run import Run, get_sources
 from rmatics.model.user import SimpleUser
+from rmatics.plugins import duplicate_detector, replica_router
 from rmatics.utils.response import jsonify
 from rmatics.view import get_problems_by_statement_id
 from rmatics.view.problem.serializers.problem import ProblemSchema
 from rmatics.view.problem.serializers.run import RunSchema
 
 DEFAULT_MOODLE_CONTEXT_SOURCE = 10
+# Max submissions in one TrustedBulkSubmitApi request
+MAX_BULK_SUBMISSIONS = 1000
+DUPLICATE_SUBMISSION_MESSAGE = 'Source file is duplicate of your previous submission'
+# Max runs in one page of ProblemSubmissionsFilterApi
+MAX_PER_PAGE = 100
+# Arguments of ProblemSubmissionsFilterApi which don't change count of runs
+PAGINATION_ARGS = ('count', 'page', 'before_id', 'after_id', 'total', 'include_source')
 
 class TrustedSubmitApi(MethodView):
+    decorators = [replica_router.writes]
+
     post_args = {
         'lang_id': fields.Integer(required=True),
         'statement_id': fields.Integer(),
@@ -55,13 +75,18 @@ class TrustedSubmitApi(MethodView):
         """
         max_size = max_size_kb * 1024
         file_bytes: bytes = file.read(max_size)
-        if len(file_bytes) == max_size:
+        return TrustedSubmitApi.check_source_restriction(file_bytes, max_size_kb)
+
+    @staticmethod
+    def check_source_restriction(source: bytes, max_size_kb: int = 64) -> bytes:
+        """ Same as check_file_restriction for already read source """
+        if len(source) >= max_size_kb * 1024:
             raise ValueError('Submission should be less than 64Kb')
         # TODO: 4 это просто так, что такое пустой файл для ejudge?
-        if len(file_bytes) < 4:
+        if len(source) < 4:
             raise ValueError('Submission shouldn\'t be empty')
 
-        return file_bytes
+        return source
 
     def post(self, problem_id: int):
         args = parser.parse(self.post_args)
@@ -97,14 +122,8 @@ class TrustedSubmitApi(MethodView):
             raise BadRequest(e.args[0])
         source_hash = Run.generate_source_hash(text)
 
-        duplicate: Run = db.session.query(Run).filter(Run.user_id == user_id) \
-            .filter(Run.problem_id == problem_id) \
-            .order_by(Run.id.desc()).first()
-
-        if duplicate is not None and \
-                duplicate.source_hash == source_hash and \
-                duplicate.lang_id == language_id:
-            raise BadRequest('Source file is duplicate of your previous submission')
+        if duplicate_detector.is_duplicate(user_id, problem_id, source_hash, language_id):
+            raise BadRequest(DUPLICATE_SUBMISSION_MESSAGE)
 
         # There is not constraint on statement_id
         run = Run(
@@ -127,6 +146,7 @@ class TrustedSubmitApi(MethodView):
 
         db.session.add(run)
         db.session.flush()
+        sync_monitor_runs(Run.id == run.id)
 
         run.update_source(text)
 
@@ -134,6 +154,7 @@ class TrustedSubmitApi(MethodView):
 
         # Коммит должен быть до отправки в очередь иначе это гонка
         db.session.commit()
+        duplicate_detector.remember(user_id, problem_id, source_hash, language_id)
 
         submit_task.delay(run.id)
 
@@ -142,7 +163,176 @@ class TrustedSubmitApi(MethodView):
         })
 
 
+class TrustedBulkSubmitApi(MethodView):
+    """ Same as TrustedSubmitApi but for many submissions at once
+
+        Sources are sent base64 encoded in json body.
+        Every submission is checked separately: response has {'run_id': ...}
+        or {'error': ...} for every submission in the same order.
+        Submission is duplicate if it is the same as previous submission
+        of user for the problem, including previous one in this request.
+
+        Last runs for duplicate check are fetched at once, runs are
+        inserted by one executemany, sources by one insert_many
+        and submit tasks are sent as one celery group
+    """
+
+    decorators = [replica_router.writes]
+
+    submission_args = {
+        'problem_id': fields.Integer(required=True),
+        'lang_id': fields.Integer(required=True),
+        'user_id': fields.Integer(required=True),
+        'statement_id': fields.Integer(),
+        'source': fields.String(required=True),
+
+        # Submission context arguments, see TrustedSubmitApi
+        'context_id': fields.Integer(required=False),
+        'context_source': fields.Integer(required=False, missing=DEFAULT_MOODLE_CONTEXT_SOURCE),
+        'is_visible': fields.Boolean(required=False, missing=True),
+    }
+
+    post_args = {
+        'submissions': fields.List(webargs_fields.Nested(submission_args), required=True,
+                                   validate=validate.Length(min=1, max=MAX_BULK_SUBMISSIONS)),
+    }
+
+    def post(self):
+        args = parser.parse(self.post_args, request, locations=('json', ))
+        submissions = args['submissions']
+
+        problem_ids = {submission['problem_id'] for submission in submissions}
+        problems = db.session.query(EjudgeProblem) \
+            .filter(EjudgeProblem.id.in_(problem_ids))
+        problems = {problem.id: problem for problem in problems}
+
+        last_sources = duplicate_detector.get_last_sources(
+            (submission['user_id'], submission['problem_id']) for submission in submissions
+        )
+
+        results = [None] * len(submissions)
+        accepted = []
+        for i, submission in enumerate(submissions):
+            try:
+                run_values, text = self._build_run_values(submission, problems)
+            except (BadRequest, NotFound) as e:
+                results[i] = {'error': e.description}
+                continue
+
+            user_problem = (run_values['user_id'], run_values['problem_id'])
+            source = (run_values['source_hash'], run_values['ej_lang_id'])
+            if last_sources.get(user_problem) == source:
+                results[i] = {'error': DUPLICATE_SUBMISSION_MESSAGE}
+                continue
+            last_sources[user_problem] = source
+
+            accepted.append((i, run_values, text))
+
+        if accepted:
+            run_ids = self._insert_runs([run_values for _, run_values, _ in accepted])
+            sync_monitor_runs(Run.id.in_(run_ids))
+
+            mongo.db.source.insert_many([
+                {'run_id': run_id, 'blob': text}
+                for run_id, (_, _, text) in zip(run_ids, accepted)
+            ], ordered=False)
+
+            # Коммит должен быть до отправки в очередь иначе это гонка
+            db.session.commit()
+            duplicate_detector.remember_many({
+                (run_values['user_id'], run_values['problem_id']): (run_values['source_hash'], run_values['ej_lang_id'])
+                for _, run_values, _ in accepted
+            })
+
+            group([submit_task.s(run_id) for run_id in run_ids]).apply_async()
+
+            for run_id, (i, _, _) in zip(run_ids, accepted):
+                results[i] = {'run_id': run_id}
+
+        return jsonify(results)
+
+    @staticmethod
+    def _build_run_values(submission: dict, problems: dict) -> tuple:
+        """ Checks submission like TrustedSubmitApi.post
+            Returns values of runs table row and source
+        """
+        problem = problems.get(submission['problem_id'])
+        if problem is None:
+            raise NotFound('Problem with this id is not found')
+
+        if submission['user_id'] <= 0:
+            raise BadRequest('Wrong user status')
+
+        try:
+            text = base64.b64decode(submission['source'], validate=True)
+        except (binascii.Error, ValueError):
+            raise BadRequest('Source should be base64 encoded')
+
+        try:
+            limit = 64
+            if problem.output_only:
+                limit = 1024 * 16
+            text = TrustedSubmitApi.check_source_restriction(text, limit)
+        except ValueError as e:
+            raise BadRequest(e.args[0])
+
+        # If it's context aware submission,
+        # overwrite statement_id with context
+        statement_id = submission.get('context_id') or submission.get('statement_id')
+
+        run_values = {
+            'user_id': submission['user_id'],
+            'problem_id': problem.id,
+            'statement_id': statement_id,
+            'ej_contest_id': problem.ejudge_contest_id,
+            'ej_lang_id': submission['lang_id'],
+            'ej_status': 377,  # In queue
+            'source_hash': Run.generate_source_hash(text),
+            'context_source': submission['context_source'],
+            'is_visible': submission['is_visible'],
+        }
+        return run_values, text
+
+    @staticmethod
+    def _insert_runs(rows: list) -> list:
+        """ Inserts runs by one executemany and returns their ids in the same order
+
+            executemany doesn't return ids, so inserted rows are selected back
+            by their values; same rows are indistinguishable, so their ids
+            are assigned in insertion order. Nothing is inserted if selected rows
+            don't match inserted ones one to one
+        """
+        runs = Run.__table__.c
+        create_time = datetime.datetime.utcnow().replace(microsecond=0)
+        rows = [dict(row, create_time=create_time) for row in rows]
+        key_columns = [runs.user_id, runs.problem_id, runs.statement_id, runs.ej_lang_id,
+                       runs.source_hash, runs.context_source, runs.is_visible]
+
+        max_id = db.session.execute(select([func.max(runs.id)])).scalar() or 0
+        db.session.execute(Run.__table__.insert(), rows)
+
+        query = select([runs.id, *key_columns]) \
+            .where(runs.id > max_id) \
+            .where(runs.create_time == create_time) \
+            .where(runs.user_id.in_({row['user_id'] for row in rows})) \
+            .order_by(runs.id)
+
+        ids_by_key = defaultdict(deque)
+        for row in db.session.execute(query):
+            ids_by_key[tuple(row[column] for column in key_columns)].append(row[runs.id])
+
+        keys = [tuple(row[column.name] for column in key_columns) for row in rows]
+        # Same rows inserted by concurrent request at the same second are selected too
+        if Counter(keys) != Counter({key: len(ids) for key, ids in ids_by_key.items()}):
+            db.session.rollback()
+            raise InternalServerError('Inserted runs can not be found, submissions are not accepted')
+
+        return [ids_by_key[key].popleft() for key in keys]
+
+
 class ProblemApi(MethodView):
+    decorators = [replica_router.read_only]
+
     def get(self, problem_id: int):
         problem = db.session.query(EjudgeProblem).get(problem_id)
         if not problem:
@@ -163,7 +353,13 @@ get_args = {
     'lang_id': fields.Integer(),
     'status_id': fields.Integer(missing=-1, default=-1),
     'count': fields.Integer(default=10, missing=10),
-    'page': fields.Integer(required=True),
+    # One of page, before_id and after_id is required
+    'page': fields.Integer(),
+    # Runs with id less than before_id and/or greater than after_id, see ProblemSubmissionsFilterApi
+    'before_id': fields.Integer(),
+    'after_id': fields.Integer(),
+    # How metadata count is got: exact COUNT, COUNT cached for SUBMISSIONS_COUNT_CACHE_TTL or none
+    'total': fields.String(validate=validate.OneOf(['exact', 'cached', 'none'])),
     'from_timestamp': fields.Integer(),  # Может быть -1, тогда не фильтруем
     'to_timestamp': fields.Integer(),  # Может быть -1, тогда не фильтруем
 
@@ -175,6 +371,47 @@ get_args = {
 }
 
 
+# Columns of runs of ProblemSubmissionsFilterApi with SUBMISSIONS_CORE_QUERY, exactly what RunSchema dumps
+SUBMISSION_COLUMNS = (
+    Run.id,
+    Run.user_id,
+    Run.problem_id,
+    Run.ejudge_status,
+    Run.create_time,
+    Run.lang_id,
+    Run.ejudge_test_num,
+    Run.ejudge_score,
+    Run.context_source,
+    SimpleUser.__table__.c.id.label('user_ref'),
+    SimpleUser.__table__.c.firstname.label('user_firstname'),
+    SimpleUser.__table__.c.lastname.label('user_lastname'),
+    Problem.__table__.c.name.label('problem_name'),
+)
+
+
+def _serialize_submission(row) -> dict:
+    """ The same as RunSchema dump of run with user and problem """
+    return {
+        'id': row.id,
+        'user': None if row.user_ref is None else {
+            'id': row.user_ref,
+            'firstname': row.user_firstname,
+            'lastname': row.user_lastname,
+        },
+        'problem': {
+            'id': row.problem_id,
+            'name': row.problem_name,
+        },
+        'ejudge_status': row.ejudge_status,
+        'create_time': row.create_time and isoformat(row.create_time),
+        'lang_id': row.lang_id,
+        'ejudge_language_id': row.lang_id,
+        'ejudge_test_num': row.ejudge_test_num,
+        'ejudge_score': row.ejudge_score,
+        'context_source': row.context_source,
+    }
+
+
 # TODO: only teacher
 class ProblemSubmissionsFilterApi(MethodView):
     """ View for getting problem submissions
@@ -192,14 +429,24 @@ class ProblemSubmissionsFilterApi(MethodView):
         --------
         'result': success | error
         'data': [Run]
-        'metadata': {count: int, page_count: int}
+        'metadata': {count: int, page_count: int, next_before_id: int, next_after_id: int}
 
         Also:
         --------
         If problem_id = 0 we are trying to find problems by
         CourseModule == statement_id
+
+        Pages can be got by page or by before_id/after_id. The last ones
+        seek by Run.id, so they are as fast for deep pages as for the first one:
+        next_before_id of response is before_id of the next (older) page,
+        next_after_id is after_id of the previous (newer) one, they are null
+        if there are no more runs.
+        count and page_count are null if total is none, it is default for
+        before_id/after_id, exact is default for page
     """
 
+    decorators = [replica_router.read_only]
+
     def get(self, problem_id: int):
         return self.process(problem_id, [])
 
@@ -210,17 +457,57 @@ class ProblemSubmissionsFilterApi(MethodView):
     def process(self, problem_id: int, user_ids):
         args = parser.parse(get_args, request)
         query = self._build_query_by_args(args, problem_id, user_ids)
-        per_page_count = args.get('count')
+        core_query = current_app.config.get('SUBMISSIONS_CORE_QUERY')
+        count_query = query
+        if core_query:
+            query = self._project_query(query)
+        per_page_count = self._get_per_page(args.get('count'))
         page = args.get('page')
-        result = query.paginate(page=page, per_page=per_page_count,
-                                error_out=False, max_per_page=100)
+        before_id = args.get('before_id')
+        after_id = args.get('after_id')
+
+        if before_id is not None or after_id is not None:
+            total_mode = args.get('total') or 'none'
+            items, metadata = self._get_keyset_page(query, per_page_count, before_id, after_id)
+        elif page is not None:
+            total_mode = args.get('total') or 'exact'
+            if total_mode == 'exact':
+                result = query.paginate(page=page, per_page=per_page_count,
+                                        error_out=False, max_per_page=MAX_PER_PAGE)
+                items = result.items
+                metadata = {'count': result.total, 'page_count': result.pages}
+            else:
+                items = query.limit(per_page_count).offset((max(page, 1) - 1) * per_page_count).all()
+                metadata = {}
+            metadata['next_before_id'] = items[-1].id if items and len(items) == per_page_count else None
+            metadata['next_after_id'] = items[0].id if page > 1 and items else None
+        else:
+            raise BadRequest('page, before_id or after_id is required')
+
+        if total_mode != 'exact' or 'count' not in metadata:
+            total = self._get_total(count_query, problem_id, user_ids, total_mode)
+            metadata['count'] = total
+            metadata['page_count'] = None if total is None else -(-total // max(per_page_count, 1))
 
+        if core_query:
+            data = self._dump_rows(items, args.get('include_source'))
+        else:
+            data = self._dump_runs(items, args.get('include_source'))
+
+        return flask_jsonify({
+            'result': 'success',
+            'data': data,
+            'metadata': metadata
+        })
+
+    @staticmethod
+    def _dump_runs(items: list, include_source: bool) -> list:
         runs = []
 
         problem_ids = set()
         user_ids = set()
 
-        for run in result.items:
+        for run in items:
             problem_ids.add(run.problem_id)
             user_ids.add(run.user_id)
 
@@ -236,28 +523,110 @@ class ProblemSubmissionsFilterApi(MethodView):
         for u in users_result:
             users[u.id] = u
 
-        for run in result.items:
+        sources = {}
+        if include_source:
+            sources = get_sources(run.id for run in items)
+
+        for run in items:
             if run.user_id > 0:
                 if run.user_id in users:
                     run.user = users[run.user_id]
                 run.problem = problems[run.problem_id]
-                if args.get('include_source'):
-                    run.code = base64.b64encode(run.source)
+                if include_source:
+                    run.code = base64.b64encode(sources.get(run.id) or b'')
                 runs.append(run)
 
-        metadata = {
-            'count': result.total,
-            'page_count': result.pages
-        }
-
         schema = RunSchema(many=True)
-        data = schema.dump(runs)
+        return schema.dump(runs).data
 
-        return flask_jsonify({
-            'result': 'success',
-            'data': data.data,
-            'metadata': metadata
-        })
+    @staticmethod
+    def _project_query(query):
+        """ Query of SUBMISSION_COLUMNS only, runs are joined with their users and problems """
+        users = SimpleUser.__table__
+        problems = Problem.__table__
+        return query.with_entities(*SUBMISSION_COLUMNS) \
+            .outerjoin(users, users.c.id == Run.user_id) \
+            .outerjoin(problems, problems.c.id == Run.problem_id)
+
+    @staticmethod
+    def _dump_rows(rows: list, include_source: bool) -> list:
+        """ The same as _dump_runs for rows of _project_query """
+        rows = [row for row in rows if row.user_id > 0]
+        sources = get_sources(row.id for row in rows) if include_source else {}
+
+        data = []
+        for row in rows:
+            run = _serialize_submission(row)
+            if include_source:
+                run['code'] = base64.b64encode(sources.get(row.id) or b'').decode()
+            data.append(run)
+        return data
+
+    @staticmethod
+    def _get_per_page(per_page_count: int) -> int:
+        # The same bounds as paginate has
+        if per_page_count < 0:
+            return 20
+        return min(per_page_count, MAX_PER_PAGE)
+
+    @staticmethod
+    def _get_keyset_page(query, per_page_count: int, before_id: int = None, after_id: int = None):
+        """ Runs with id in (after_id, before_id) closest to after_id if it is given,
+            to before_id otherwise. One extra run is fetched to know if there are more
+        """
+        if before_id is not None:
+            query = query.filter(Run.id < before_id)
+        if after_id is not None:
+            query = query.filter(Run.id > after_id) \
+                .order_by(None) \
+                .order_by(Run.id)
+
+        items = query.limit(per_page_count + 1).all()
+        has_more = len(items) > per_page_count
+        items = items[:per_page_count]
+
+        if after_id is not None:
+            items.reverse()
+            metadata = {
+                'next_before_id': items[-1].id if items else before_id,
+                'next_after_id': items[0].id if has_more and items else None,
+            }
+        else:
+            metadata = {
+                'next_before_id': items[-1].id if has_more and items else None,
+                'next_after_id': items[0].id if items else None,
+            }
+        return items, metadata
+
+    @staticmethod
+    def _get_total(query, problem_id: int, user_ids, total_mode: str) -> Optional[int]:
+        if total_mode == 'none':
+            return None
+
+        count_query = query.order_by(None)
+        if total_mode == 'exact':
+            return count_query.count()
+
+        filters = {key: value for key, value in sorted(request.args.items())
+                   if key not in PAGINATION_ARGS}
+        key_source = json.dumps([problem_id, sorted(user_ids or []), filters], sort_keys=True)
+        key = f'submissions/count/{hashlib.md5(key_source.encode()).hexdigest()}'
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            cached, = pipeline.get(key).execute()
+        except redis_exceptions.ConnectionError:
+            current_app.logger.warning('Can\'t read count of submissions from redis')
+            return count_query.count()
+        if cached is not None:
+            return int(cached)
+
+        total = count_query.count()
+        try:
+            pipeline = redis.pipeline(transaction=False)
+            pipeline.set(key, total, ex=current_app.config['SUBMISSIONS_COUNT_CACHE_TTL']).execute()
+        except redis_exceptions.ConnectionError:
+            current_app.logger.warning('Can\'t write count of submissions to redis')
+        return total
 
     @classmethod
     def _build_query_by_args(cls, args, problem_id, user_ids = []):
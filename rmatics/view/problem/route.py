@@ -1,13 +1,18 @@
 from flask import Blueprint
 
-from rmatics.view.problem.problem import TrustedSubmitApi, ProblemApi, ProblemSubmissionsFilterApi
-from rmatics.view.problem.run import SourceApi, UpdateRunFromEjudgeAPIv1, UpdateRunFromEjudgeAPIv2, ProtocolApi, RunAPI
+from rmatics.view.problem.problem import TrustedSubmitApi, ProblemApi, ProblemSubmissionsFilterApi, \
+    TrustedBulkSubmitApi
+from rmatics.view.problem.run import SourceApi, UpdateRunFromEjudgeAPIv1, UpdateRunFromEjudgeAPIv2, ProtocolApi, \
+    ProtocolTestApi, RunAPI, BulkRunsApi
 
 problem_blueprint = Blueprint('problem', __name__, url_prefix='/problem')
 
 problem_blueprint.add_url_rule('/trusted/<int:problem_id>/submit_v2', methods=('POST', ),
                                view_func=TrustedSubmitApi.as_view('trusted_submit'))
 
+problem_blueprint.add_url_rule('/trusted/submit_bulk', methods=('POST', ),
+                               view_func=TrustedBulkSubmitApi.as_view('trusted_bulk_submit'))
+
 problem_blueprint.add_url_rule('/<int:problem_id>', methods=('GET', ),
                                view_func=ProblemApi.as_view('problem'))
 
@@ -20,9 +25,15 @@ problem_blueprint.add_url_rule('/run/<int:run_id>', methods=('PUT', ),
 problem_blueprint.add_url_rule('/run/<int:run_id>/source', methods=('GET', ),
                                view_func=SourceApi.as_view('run_source'))
 
+problem_blueprint.add_url_rule('/run/bulk', methods=('POST', ),
+                               view_func=BulkRunsApi.as_view('runs_bulk'))
+
 problem_blueprint.add_url_rule('/run/<int:run_id>/protocol', methods=('GET', ),
                                view_func=ProtocolApi.as_view('run_protocol'))
 
+problem_blueprint.add_url_rule('/run/<int:run_id>/protocol/<test_number>', methods=('GET', ),
+                               view_func=ProtocolTestApi.as_view('run_protocol_test'))
+
 problem_blueprint.add_url_rule('/run/action/update_from_ejudge', methods=('POST', ),
                                view_func=UpdateRunFromEjudgeAPIv1.as_view('update_from_ejudge'))
 
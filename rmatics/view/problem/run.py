@@ -1,9 +1,11 @@
 import functools
+import json
+from typing import Optional
 
 from bson import ObjectId
 from flask import request, current_app
 from flask.views import MethodView
-from marshmallow import fields, Schema, post_load
+from marshmallow import fields, Schema, post_load, validate
 from pymongo.errors import PyMongoError, DuplicateKeyError
 from webargs.flaskparser import parser
 from werkzeug.exceptions import NotFound, BadRequest, InternalServerError
@@ -11,19 +13,28 @@ from sqlalchemy import or_, and_
 
 from rmatics.ejudge.submit_queue.task import submit_task
 from rmatics.model.base import db, mongo
+from rmatics.model.monitor_run import sync_monitor_runs
 from rmatics.model.rejudge import Rejudge
-from rmatics.model.run import Run
+from rmatics.model.run import Run, get_protocol_summaries, get_sources
+from rmatics.plugins import replica_router
 from rmatics.tasks.notify import (
     NON_TERMINAL_STATUSES,
     _to_int,
+    _update_standings,
     make_nonterminal_upd_chain,
     make_terminal_upd_chain,
+    process_notification,
 )
+from rmatics.tasks.notify_batch import enqueue_terminal_notification
 from rmatics.utils.cacher.helpers import invalidate_monitor_cache_by_run
-from rmatics.utils.response import jsonify
+from rmatics.utils.response import jsonify, zip_stream
 from rmatics.view.problem.serializers.run import RunSchema
 
 POSSIBLE_SOURCE_ENCODINGS = ['utf-8', 'cp1251', 'windows-1251', 'ascii', 'koi8-r']
+# Max runs in one BulkRunsApi request
+MAX_BULK_RUNS = 5000
+# Runs of BulkRunsApi fetched from mongo by one query
+BULK_RUNS_CHUNK_SIZE = 200
 
 
 class FromEjudgeRunSchema(Schema):
@@ -44,6 +55,8 @@ class FromEjudgeRunSchema(Schema):
 
 
 class RunAPI(MethodView):
+    decorators = [replica_router.writes]
+
     def put(self, run_id: int):
         """ View for updating run """
         data = request.get_json(force=True, silent=False)
@@ -67,7 +80,10 @@ class RunAPI(MethodView):
         data, _ = dump_run_schema.dump(run)
 
         db.session.add(run)
+        db.session.flush()
+        sync_monitor_runs(Run.id == run.id)
         db.session.commit()
+        update_standings_by_run(run)
 
         return jsonify(data)
 
@@ -88,14 +104,47 @@ class RunAPI(MethodView):
         run.ejudge_test_num = None
         run.ejudge_score = None
         db.session.add(run)
+        db.session.flush()
+        sync_monitor_runs(Run.id == run.id)
         db.session.commit()
+        update_standings_by_run(run)
 
         submit_task.delay(run.id)
 
         return jsonify({})
 
 
+def update_standings_by_run(run: Run):
+    """ Recomputes standings of run's user for its problem after run was changed and committed """
+    if current_app.config.get('MONITOR_STANDINGS'):
+        _update_standings(Run.id == run.id)
+
+
+def filter_runs_by_access(query, args: dict):
+    """ Admin sees every run, user sees own runs and runs of context_source if it is given """
+    is_admin = args.get('is_admin')
+    user_id = args.get('user_id')
+    context_source = args.get('context_source')
+
+    if context_source and context_source > 0 and not is_admin:
+        query = query.filter(or_(Run.context_source == context_source, Run.user_id == user_id))
+    elif not is_admin:
+        query = query.filter(Run.user_id == user_id)
+    return query
+
+
+def decode_source(source: Optional[bytes]):
+    source = source or b''
+    for encoding in POSSIBLE_SOURCE_ENCODINGS:
+        try:
+            return source.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return source
+
+
 class SourceApi(MethodView):
+    decorators = [replica_router.read_only]
 
     get_args = {
         'is_admin': fields.Boolean(default=False, missing=False),
@@ -105,66 +154,125 @@ class SourceApi(MethodView):
 
     def get(self, run_id: int):
         args = parser.parse(self.get_args, request)
-        is_admin = args.get('is_admin')
-        user_id = args.get('user_id')
-        context_source = args.get('context_source')
-
-        run_q = db.session.query(Run)
-
-        if context_source and context_source > 0 and not is_admin:
-            run_q = run_q.filter(or_(Run.context_source == context_source, Run.user_id == user_id))
-        elif not is_admin:
-            run_q = run_q.filter(Run.user_id == user_id)
 
+        run_q = filter_runs_by_access(db.session.query(Run), args)
         run = run_q.filter(Run.id == run_id).one_or_none()
 
         if run is None:
             raise NotFound(f'Run with id #{run_id} is not found')
 
         language_id = run.lang_id
-
-        source = run.source or b''
-        for encoding in POSSIBLE_SOURCE_ENCODINGS:
-            try:
-                source = source.decode(encoding)
-                break
-            except UnicodeDecodeError:
-                pass
+        source = decode_source(run.source)
 
         return jsonify({'source': source, 'language_id': language_id})
 
 
+class BulkRunsApi(MethodView):
+    """ Sources and protocol summaries (without input, output etc. of tests) of many runs
+
+        Response is [{'run_id', 'language_id', 'source', 'protocol'}] for every found run
+        or, if format is zip, streamed zip archive of {run_id}.txt sources
+        and {run_id}.json protocols.
+        Sources and protocols are fetched from mongo by one query per BULK_RUNS_CHUNK_SIZE runs
+    """
+
+    decorators = [replica_router.read_only]
+
+    post_args = {
+        'run_ids': fields.List(fields.Integer(), required=True,
+                               validate=validate.Length(min=1, max=MAX_BULK_RUNS)),
+        'include_source': fields.Boolean(missing=True),
+        'include_protocol': fields.Boolean(missing=False),
+        'format': fields.String(missing='json', validate=validate.OneOf(['json', 'zip'])),
+
+        'is_admin': fields.Boolean(missing=False),
+        'user_id': fields.Integer(),
+        'context_source': fields.Integer(missing=0),
+    }
+
+    def post(self):
+        args = parser.parse(self.post_args, request, locations=('json', ))
+
+        runs_q = db.session.query(Run.id, Run.lang_id) \
+            .filter(Run.id.in_(set(args['run_ids']))) \
+            .order_by(Run.id)
+        runs = filter_runs_by_access(runs_q, args).all()
+
+        if args['format'] == 'zip':
+            return zip_stream(self._get_files(runs, args), filename='runs.zip')
+
+        result = []
+        for chunk, sources, protocols in self._load_chunks(runs, args):
+            for run_id, language_id in chunk:
+                item = {'run_id': run_id, 'language_id': language_id}
+                if args['include_source']:
+                    item['source'] = decode_source(sources.get(run_id))
+                if args['include_protocol']:
+                    item['protocol'] = protocols.get(run_id)
+                result.append(item)
+        return jsonify(result)
+
+    def _get_files(self, runs: list, args: dict):
+        for chunk, sources, protocols in self._load_chunks(runs, args):
+            for run_id, _ in chunk:
+                if sources.get(run_id) is not None:
+                    yield f'{run_id}.txt', sources[run_id]
+                if run_id in protocols:
+                    yield f'{run_id}.json', json.dumps(protocols[run_id], ensure_ascii=False)
+
+    @staticmethod
+    def _load_chunks(runs: list, args: dict):
+        for i in range(0, len(runs), BULK_RUNS_CHUNK_SIZE):
+            chunk = runs[i:i + BULK_RUNS_CHUNK_SIZE]
+            run_ids = [run_id for run_id, _ in chunk]
+            sources = get_sources(run_ids) if args['include_source'] else {}
+            protocols = get_protocol_summaries(run_ids) if args['include_protocol'] else {}
+            yield chunk, sources, protocols
+
+
 class ProtocolApi(MethodView):
+    decorators = [replica_router.read_only]
 
     get_args = {
         'is_admin': fields.Boolean(default=False, missing=False),
         'user_id': fields.Integer(),
         'context_source': fields.Integer(default=0),
+        # Without data of tests stored out of protocol, it is fetched by ProtocolTestApi
+        'full': fields.Boolean(missing=True),
     }
 
     def get(self, run_id: int):
         args = parser.parse(self.get_args, request)
-        is_admin = args.get('is_admin')
-        user_id = args.get('user_id')
-        context_source = args.get('context_source')
+        run = self._get_run(run_id, args)
 
-        run_q = db.session.query(Run)
+        protocol = run.get_protocol(full=args['full'])
+        if not protocol:
+            raise NotFound(f'Protocol for run_id: {run_id} not found')
 
-        if context_source and context_source > 0 and not is_admin:
-            run_q = run_q.filter(or_(Run.context_source == context_source, Run.user_id == user_id))
-        elif not is_admin:
-            run_q = run_q.filter(Run.user_id == user_id)
+        return jsonify(protocol)
 
+    @staticmethod
+    def _get_run(run_id: int, args: dict) -> Run:
+        run_q = filter_runs_by_access(db.session.query(Run), args)
         run = run_q.filter(Run.id == run_id).one_or_none()
 
         if run is None:
             raise NotFound(f'Run with id #{run_id} is not found')
+        return run
 
-        protocol = run.protocol
-        if not protocol:
-            raise NotFound(f'Protocol for run_id: {run_id} not found')
 
-        return jsonify(protocol)
+class ProtocolTestApi(ProtocolApi):
+    """ One test of protocol with its input, output, etc. """
+
+    def get(self, run_id: int, test_number: str):
+        args = parser.parse(self.get_args, request)
+        run = self._get_run(run_id, args)
+
+        test = run.get_protocol_test(test_number)
+        if test is None:
+            raise NotFound(f'Test #{test_number} of protocol for run_id: {run_id} not found')
+
+        return jsonify(test)
 
 class UpdateRunFromEjudgeAPIv1(MethodView):
 
@@ -207,7 +315,10 @@ class UpdateRunFromEjudgeAPIv1(MethodView):
                 raise InternalServerError(f'Looks like mongo is shutdown')
 
         db.session.add(received_run)
+        db.session.flush()
+        sync_monitor_runs(Run.id == received_run.id)
         db.session.commit()
+        update_standings_by_run(received_run)
 
         return jsonify({}, 200)
 
@@ -235,11 +346,20 @@ class UpdateRunFromEjudgeAPIv2(MethodView):
         if data.get('rmatics_run_id') is not None:
             data['rmatics_run_id'] = _to_int(data.get('rmatics_run_id'))
 
+        if status not in NON_TERMINAL_STATUSES and current_app.config.get('NOTIFY_BATCH_WINDOW_MS'):
+            enqueue_terminal_notification(data)
+            return jsonify({}, 200)
+
+        if current_app.config.get('NOTIFY_SINGLE_TASK'):
+            process_notification.delay(data)
+            return jsonify({}, 200)
+
+        # Compatibility mode
         if status in NON_TERMINAL_STATUSES:
             upd_chain = make_nonterminal_upd_chain()
         else:
             upd_chain = make_terminal_upd_chain()
-            
+
         upd_chain.delay(data)
 
         return jsonify({}, 200)